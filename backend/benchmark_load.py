@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Load test for the dashboard API: concurrent dashboard pollers, KV state
+pushers and trade bursts, reporting p50/p99 latency and throughput per
+endpoint.
+
+By default server.py is booted in-process against an in-memory
+mongomock-motor database, so runs are reproducible without any service.
+Point it at a real database with --mongo-url, compare the embedded storage
+backends with --storage memory|sqlite, or load a running deployment with
+--base-url.
+
+    python benchmark_load.py --duration 30 --pollers 20 --pushers 4 --traders 2
+    python benchmark_load.py --mongo-url mongodb://localhost:27017 --json > run.json
+    python benchmark_load.py --storage sqlite
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.samples[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed):
+        rows = []
+        for name in sorted(set(self.samples) | set(self.errors)):
+            latencies = np.array(self.samples[name]) * 1000
+            rows.append({
+                "endpoint": name,
+                "requests": int(latencies.size),
+                "errors": self.errors[name],
+                "throughput_rps": latencies.size / elapsed,
+                "p50_ms": float(np.percentile(latencies, 50)) if latencies.size else None,
+                "p90_ms": float(np.percentile(latencies, 90)) if latencies.size else None,
+                "p99_ms": float(np.percentile(latencies, 99)) if latencies.size else None,
+                "max_ms": float(latencies.max()) if latencies.size else None,
+            })
+        return rows
+
+
+async def dashboard_poller(client, recorder, stop, interval):
+    """Polls like the dashboard's fallback loop, revalidating with ETags as a browser would"""
+    etags = {}
+    reads = [
+        ("GET /risk-config", "/risk-config"),
+        ("GET /risk-status", "/risk-status"),
+        ("GET /logs", "/logs?limit=50"),
+        ("GET /trades", "/trades?limit=100"),
+    ]
+    await asyncio.sleep(random.uniform(0, interval))
+    while not stop.is_set():
+        for name, url in reads:
+            headers = {"Accept-Encoding": "gzip, br"}
+            if url in etags:
+                headers["If-None-Match"] = etags[url]
+            response = await recorder.call(client, name, "GET", url, headers=headers)
+            if response is not None and "etag" in response.headers:
+                etags[url] = response.headers["etag"]
+        await asyncio.sleep(interval)
+
+
+async def kv_pusher(client, recorder, stop, rate):
+    """Pushes KV state the way the trading system's sync loop does"""
+    realised = 0.0
+    while not stop.is_set():
+        realised += random.uniform(-25, 25)
+        unrealised = random.uniform(-100, 100)
+        now_ms = int(time.time() * 1000)
+        state = {
+            "capital_day_915": 3000,
+            "max_loss_pct": 5,
+            "max_profit_pct": 10,
+            "realised": realised,
+            "unrealised": unrealised,
+            "total_pnl": realised + unrealised,
+            "consecutive_losses": random.randint(0, 2),
+            "cooldown_active": False,
+            "last_trade_time": now_ms,
+        }
+        await recorder.call(client, "POST /sync-kv-state", "POST", "/sync-kv-state", json={"state": state})
+        await asyncio.sleep(1 / rate)
+
+
+async def trade_burster(client, recorder, stop, burst, pause):
+    """Sends bursts of fills, alternating sides so positions open and close"""
+    instruments = ["NIFTY25D16256600PE", "NIFTY25D09257700PE", "BANKNIFTY25D1651000CE"]
+    while not stop.is_set():
+        for i in range(burst):
+            trade = {
+                "instrument": random.choice(instruments),
+                "side": "BUY" if i % 2 == 0 else "SELL",
+                "quantity": 75,
+                "price": round(random.uniform(10, 20), 2),
+            }
+            await recorder.call(client, "POST /trades", "POST", "/trades", json=trade)
+        await recorder.call(client, "POST /pre-trade-check", "POST", "/pre-trade-check", json={
+            "instrument": instruments[0], "side": "BUY", "quantity": 75, "price": 15.0,
+        })
+        await asyncio.sleep(pause)
+
+
+async def boot_in_process(storage, mongo_url, db_name):
+    """Import server.py with the requested storage and run its startup hooks"""
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ["MONGO_URL"] = mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = db_name
+    if storage == "sqlite":
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="risk_benchmark_"), "risk.db")
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+    import storage as storage_module
+
+    if storage != "mongo":
+        await server.app.router.startup()
+    elif mongo_url:
+        await server.connect_db()
+        await storage_module.client.drop_database(db_name)
+        await server.app.router.startup()
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor is not installed; install it or pass --mongo-url")
+        storage_module.db = AsyncMongoMockClient(tz_aware=True)[db_name]
+        # mongomock can't create the time-series history collection, so skip
+        # ensure_collections; an empty database needs no migration anyway
+        await server.load_positions()
+        await server.start_log_sink()
+    return server
+
+
+async def run(args):
+    server = None
+    if args.base_url:
+        transport = None
+        base_url = args.base_url.rstrip("/") + "/api"
+    else:
+        server = await boot_in_process(args.storage, args.mongo_url, args.db_name)
+        transport = httpx.ASGITransport(app=server.app)
+        base_url = "http://benchmark/api"
+    if args.account:
+        base_url += f"/accounts/{args.account}"
+
+    recorder = LatencyRecorder()
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.pollers + args.pushers + args.traders + 4)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30) as client:
+        # Seed config, status and some history so reads return full pages
+        await client.post("/risk-status/reset")
+        workers = (
+            [dashboard_poller(client, recorder, stop, args.poll_interval) for _ in range(args.pollers)]
+            + [kv_pusher(client, recorder, stop, args.push_rate) for _ in range(args.pushers)]
+            + [trade_burster(client, recorder, stop, args.burst, args.burst_pause) for _ in range(args.traders)]
+        )
+        tasks = [asyncio.create_task(worker) for worker in workers]
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    if server is not None:
+        await server.shutdown_db_client()
+    return recorder.report(elapsed), elapsed
+
+
+def print_report(rows, elapsed):
+    total = sum(row["requests"] for row in rows)
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"{'endpoint':<24}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for row in rows:
+        if not row["requests"]:
+            print(f"{row['endpoint']:<24}{0:>10}{row['errors']:>8}")
+            continue
+        print(
+            f"{row['endpoint']:<24}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>9.1f}"
+            f"{row['p50_ms']:>9.2f}{row['p90_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="benchmark a running server instead of booting one in-process")
+    parser.add_argument("--storage", choices=["mongo", "memory", "sqlite"], default="mongo",
+                        help="storage backend to boot in-process (sqlite uses a temporary file)")
+    parser.add_argument("--mongo-url", help="boot against this MongoDB instead of mongomock-motor")
+    parser.add_argument("--db-name", default="risk_benchmark", help="database to use (dropped first with --mongo-url)")
+    parser.add_argument("--account", help="drive /api/accounts/<account> instead of the default account")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--pollers", type=int, default=10, help="dashboard polling clients")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between a poller's refreshes")
+    parser.add_argument("--pushers", type=int, default=2, help="KV state pushers")
+    parser.add_argument("--push-rate", type=float, default=20.0, help="pushes per second per pusher")
+    parser.add_argument("--traders", type=int, default=1, help="trade burst clients")
+    parser.add_argument("--burst", type=int, default=20, help="trades per burst")
+    parser.add_argument("--burst-pause", type=float, default=2.0, help="seconds between bursts")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for reproducible traffic")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rows, elapsed = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps({"elapsed_s": elapsed, "endpoints": rows}, indent=2))
+    else:
+        print_report(rows, elapsed)
+    if any(row["errors"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""CPU per request of the read endpoints' serialization, before and after
+the single-validation fast path.
+
+"before" reproduces the old path: build model instances from the stored
+documents, then let FastAPI validate them against response_model and encode
+them with jsonable_encoder + json.dumps. "after" is what the endpoints do
+now. No database is needed; documents are shaped like stored ones.
+
+    python benchmark_serialization.py [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import server
+
+
+def stored_trades(count):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "account": "default",
+        "timestamp": now - timedelta(seconds=i),
+        "instrument": "NIFTY25D16256600PE",
+        "side": "BUY" if i % 2 else "SELL",
+        "quantity": 75,
+        "price": 17.45 + i / 100,
+        "pnl": None,
+        "status": "executed",
+        "realised_pnl": -22.5,
+    } for i in range(count)]
+
+
+def stored_logs(count):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "account": "default",
+        "timestamp": now - timedelta(seconds=i),
+        "expire_at": now + timedelta(days=30),
+        "level": "info",
+        "type": "config_change",
+        "message": "Risk configuration updated",
+        "details": {"daily_max_loss": 5000.0, "max_trades_per_day": 10, "trailing_profit_enabled": False},
+    } for i in range(count)]
+
+
+def stored_singleton(model, doc_id):
+    doc = model(id=doc_id).model_dump() if model is server.RiskStatus else server.RiskConfig(
+        id=doc_id, daily_max_loss=5000.0, daily_max_profit=10000.0, max_trades_per_day=10,
+        max_position_size=50000.0, stop_loss_percentage=2.0, consecutive_loss_limit=3,
+        cooldown_after_loss=15, trailing_profit_enabled=False, trailing_profit_step=0.5,
+    ).model_dump()
+    doc.update(account="default", version=42)
+    return doc
+
+
+async def before_list(model, field, docs):
+    content = await serialize_response(field=field, response_content=[model(**doc) for doc in docs])
+    return JSONResponse(content).body
+
+
+async def before_one(model, field, doc):
+    content = await serialize_response(field=field, response_content=model(**doc))
+    return JSONResponse(content).body
+
+
+def cpu_per_call(fn, iterations):
+    loop = asyncio.new_event_loop()
+    try:
+        for _ in range(min(50, iterations)):
+            loop.run_until_complete(fn())
+        start = time.process_time()
+        for _ in range(iterations):
+            loop.run_until_complete(fn())
+        return (time.process_time() - start) / iterations
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    config = stored_singleton(server.RiskConfig, "current_config")
+    status = stored_singleton(server.RiskStatus, "current_status")
+    logs = stored_logs(50)
+    trades = stored_trades(100)
+
+    config_field = create_response_field(name="config", type_=server.RiskConfig)
+    status_field = create_response_field(name="status", type_=server.RiskStatus)
+    logs_field = create_response_field(name="logs", type_=List[server.LogEntry])
+    trades_field = create_response_field(name="trades", type_=List[server.Trade])
+
+    async def after_config():
+        return server.RiskConfig.model_validate(config).model_dump_json()
+
+    async def after_status():
+        return server.RiskStatus.model_validate(status).model_dump_json()
+
+    async def after_logs():
+        return server.LOG_LIST.dump_json(server.LOG_LIST.validate_python(logs))
+
+    async def after_trades():
+        return server.TRADE_LIST.dump_json(server.TRADE_LIST.validate_python(trades))
+
+    cases = [
+        ("GET /api/risk-config", lambda: before_one(server.RiskConfig, config_field, config), after_config),
+        ("GET /api/risk-status", lambda: before_one(server.RiskStatus, status_field, status), after_status),
+        ("GET /api/logs (50)", lambda: before_list(server.LogEntry, logs_field, logs), after_logs),
+        ("GET /api/trades (100)", lambda: before_list(server.Trade, trades_field, trades), after_trades),
+    ]
+
+    print(f"{'endpoint':<24}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, before, after in cases:
+        before_cpu = cpu_per_call(before, args.iterations)
+        after_cpu = cpu_per_call(after, args.iterations)
+        print(f"{name:<24}{before_cpu * 1e6:>14.1f}{after_cpu * 1e6:>14.1f}{before_cpu / after_cpu:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+from pymongo import monitoring
+import time
+import bisect
+import threading
+from typing import List, Dict, Any, Tuple
+
+# Metrics, rendered in the Prometheus text format at /metrics
+METRIC_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """A labelled counter or gauge. Updates take a lock because pymongo's
+    command listeners run on Motor's worker threads."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str):
+        with self.lock:
+            self.values[label_values] = value
+
+    def dec(self, *label_values: str, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = METRIC_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        # Per label set: one count per bucket plus +Inf, then sum
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            series_items = [(key, list(series)) for key, series in self.series.items()]
+        for key, series in series_items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "risk_http_request_duration_seconds", "Time from request to response start, by route template",
+    ("method", "route"),
+)
+HTTP_RESPONSES = Metric("risk_http_responses_total", "Responses by route template and status", ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("risk_http_requests_in_flight", "Requests currently being handled")
+MONGO_COMMAND_SECONDS = Histogram(
+    "risk_mongo_command_duration_seconds", "MongoDB command round trips, by command and collection",
+    ("command", "collection"),
+)
+MONGO_COMMAND_FAILURES = Metric("risk_mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection"))
+CACHE_LOOKUPS = Metric(
+    "risk_singleton_cache_lookups_total",
+    "Singleton cache reads: hit (in memory), revalidated (version probe unchanged) or miss (reloaded)",
+    ("collection", "result"),
+)
+KV_SYNC_LAG = Gauge(
+    "risk_kv_sync_lag_seconds", "Age of the latest KV sync when applied, from its last_trade_time or push timestamp",
+    ("account", "source"),
+)
+KV_LAST_SYNC = Gauge("risk_kv_last_sync_timestamp_seconds", "Unix time of the latest applied KV sync", ("account",))
+LOG_SINK_PENDING = Gauge("risk_log_sink_pending", "Log entries queued for the background writer")
+LOG_SINK_DROPPED = Gauge("risk_log_sink_dropped", "Log entries dropped because the writer queue was full")
+STREAM_SUBSCRIBERS = Gauge("risk_stream_subscribers", "Open /stream connections")
+DEADLINES_PENDING = Gauge("risk_deadlines_pending", "Timers armed for upcoming status deadlines such as cooldown expiry")
+DEADLINES_FIRED = Metric("risk_deadlines_fired_total", "Deadline timers that fired, by kind", ("kind",))
+METRICS = [
+    HTTP_REQUEST_SECONDS, HTTP_RESPONSES, HTTP_IN_FLIGHT, MONGO_COMMAND_SECONDS, MONGO_COMMAND_FAILURES,
+    CACHE_LOOKUPS, KV_SYNC_LAG, KV_LAST_SYNC, LOG_SINK_PENDING, LOG_SINK_DROPPED, STREAM_SUBSCRIBERS,
+    DEADLINES_PENDING, DEADLINES_FIRED,
+]
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every MongoDB command from pymongo's command monitoring events"""
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+    def __init__(self):
+        self.pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        self.pending[(event.connection_id, event.request_id)] = (
+            event.command_name, target if isinstance(target, str) else "",
+        )
+
+    def succeeded(self, event):
+        labels = self.pending.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, *labels)
+
+    def failed(self, event):
+        labels = self.pending.pop((event.connection_id, event.request_id), None)
+        if labels is not None:
+            MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, *labels)
+            MONGO_COMMAND_FAILURES.inc(*labels)
+
+class MetricsMiddleware:
+    """Counts in-flight requests and times each one by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        started = False
+
+        def record(status: int):
+            # The router stores the matched route in the scope; the template
+            # keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route)
+            HTTP_RESPONSES.inc(scope["method"], route, str(status))
+
+        async def send_timed(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                record(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not started:
+                record(500)
+            raise
+        finally:
+            HTTP_IN_FLIGHT.dec()
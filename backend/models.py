@@ -0,0 +1,184 @@
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field, ConfigDict, AfterValidator, BeforeValidator, PlainSerializer
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional, Dict, Any, Annotated, Literal
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from enum import Enum
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Trading days and hours are bucketed in the exchange's timezone
+TRADING_TIMEZONE = ZoneInfo(os.environ.get('TRADING_TIMEZONE', 'Asia/Kolkata'))
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def trading_day(value: datetime) -> str:
+    """The YYYY-MM-DD trading day of a moment, in TRADING_TIMEZONE"""
+    return as_utc(value).astimezone(TRADING_TIMEZONE).date().isoformat()
+
+# Timestamps are stored as native BSON dates and rendered as ISO strings in
+# API responses, exactly as when they were stored as strings
+Timestamp = Annotated[
+    datetime,
+    AfterValidator(as_utc),
+    PlainSerializer(lambda value: value.isoformat(), return_type=str, when_used="json"),
+]
+
+# Fills are BUY or SELL; brokers send either case
+Side = Annotated[Literal["BUY", "SELL"], BeforeValidator(lambda value: value.upper() if isinstance(value, str) else value)]
+
+# Enums
+class LogLevel(str, Enum):
+    INFO = "info"
+    WARNING = "warning"
+    ERROR = "error"
+    SUCCESS = "success"
+
+class LogType(str, Enum):
+    CONFIG_CHANGE = "config_change"
+    RISK_EVENT = "risk_event"
+    VIOLATION = "violation"
+    SYSTEM = "system"
+
+# Models
+class RiskConfig(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default="current_config")
+    daily_max_loss: float = Field(description="Maximum daily loss allowed")
+    daily_max_profit: float = Field(description="Daily profit target")
+    max_trades_per_day: int = Field(description="Maximum number of trades allowed per day")
+    max_position_size: float = Field(description="Maximum position size")
+    stop_loss_percentage: float = Field(description="Stop loss percentage")
+    consecutive_loss_limit: int = Field(description="Maximum consecutive losses allowed")
+    cooldown_after_loss: int = Field(description="Cooldown period in minutes after a loss")
+    trailing_profit_enabled: bool = Field(default=False)
+    trailing_profit_step: float = Field(default=0.0)
+    side_lock: Optional[str] = Field(default=None, description="BUY or SELL lock")
+    updated_at: Timestamp = Field(default_factory=utc_now)
+
+class RiskConfigUpdate(BaseModel):
+    daily_max_loss: float
+    daily_max_profit: float
+    max_trades_per_day: int
+    max_position_size: float
+    stop_loss_percentage: float
+    consecutive_loss_limit: int
+    cooldown_after_loss: int
+    trailing_profit_enabled: bool = False
+    trailing_profit_step: float = 0.0
+    side_lock: Optional[str] = None
+
+class RiskStatus(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default="current_status")
+    current_pnl: float = Field(default=0.0)
+    realised: float = Field(default=0.0)
+    unrealised: float = Field(default=0.0)
+    total_pnl: float = Field(default=0.0)
+    trades_today: int = Field(default=0)
+    consecutive_losses: int = Field(default=0)
+    trading_day: Optional[str] = Field(default=None, description="Trading day trades_today and consecutive_losses count")
+    max_loss_hit: bool = Field(default=False)
+    max_profit_hit: bool = Field(default=False)
+    position_size: float = Field(default=0.0)
+    in_cooldown: bool = Field(default=False)
+    cooldown_until: Optional[Timestamp] = None
+    cooldown_remaining_minutes: int = Field(default=0)
+    violations: List[str] = Field(default_factory=list)
+    last_trade_time: Optional[Timestamp] = None
+    peak_profit: float = Field(default=0.0, description="Peak profit reached today")
+    active_loss_floor: Optional[float] = Field(default=0.0, description="Current loss floor (trailing stop); None when no loss limit is set")
+    trip_reason: Optional[str] = Field(default=None, description="Reason for tripping")
+    orders_allowed: bool = Field(default=True, description="Whether new orders are allowed")
+    updated_at: Timestamp = Field(default_factory=utc_now)
+
+class RiskStatusUpdate(BaseModel):
+    current_pnl: Optional[float] = None
+    realised: Optional[float] = None
+    unrealised: Optional[float] = None
+    total_pnl: Optional[float] = None
+    trades_today: Optional[int] = None
+    consecutive_losses: Optional[int] = None
+    max_loss_hit: Optional[bool] = None
+    max_profit_hit: Optional[bool] = None
+    position_size: Optional[float] = None
+    in_cooldown: Optional[bool] = None
+    cooldown_until: Optional[Timestamp] = None
+    cooldown_remaining_minutes: Optional[int] = None
+    violations: Optional[List[str]] = None
+    last_trade_time: Optional[Timestamp] = None
+    peak_profit: Optional[float] = None
+    active_loss_floor: Optional[float] = None
+    trip_reason: Optional[str] = None
+    orders_allowed: Optional[bool] = None
+
+class KVStateUpdate(BaseModel):
+    """Model to accept KV state data from external system"""
+    state: Dict[str, Any]
+
+class KVStateBatchItem(BaseModel):
+    state: Dict[str, Any]
+    timestamp: Optional[int] = Field(default=None, description="Push time in milliseconds")
+
+class KVStateBatch(BaseModel):
+    """Model to accept several KV states pushed at once"""
+    states: List[KVStateBatchItem]
+
+class LogEntry(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: Timestamp = Field(default_factory=utc_now)
+    level: LogLevel
+    type: LogType
+    message: str
+    details: Optional[Dict[str, Any]] = None
+
+class LogEntryCreate(BaseModel):
+    level: LogLevel
+    type: LogType
+    message: str
+    details: Optional[Dict[str, Any]] = None
+
+class Trade(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: Timestamp = Field(default_factory=utc_now)
+    instrument: str = Field(description="Trading instrument symbol")
+    side: Side = Field(description="BUY or SELL")
+    quantity: int = Field(gt=0, description="Trade quantity")
+    price: float = Field(description="Trade price")
+    order_id: Optional[str] = None
+    status: str = Field(default="executed")
+
+class TradeCreate(BaseModel):
+    instrument: str
+    side: Side
+    quantity: int = Field(gt=0)
+    price: float
+    order_id: Optional[str] = None
+    status: str = "executed"
+
+class PreTradeCheck(BaseModel):
+    instrument: str
+    side: Side
+    quantity: int = Field(gt=0)
+    price: float
+
+class RiskSimulationRequest(BaseModel):
+    configs: List[Dict[str, Any]] = Field(default_factory=list, description="Candidate overrides of the current config")
+    grid: Dict[str, List[Any]] = Field(default_factory=dict, description="Override values crossed with every candidate")
+    start: Optional[str] = Field(default=None, description="First trading day, YYYY-MM-DD")
+    end: Optional[str] = Field(default=None, description="Last trading day, YYYY-MM-DD")
+    include_trips: bool = True
@@ -0,0 +1,155 @@
+from typing import Optional, Dict, Any
+from datetime import datetime
+from models import as_utc
+
+# Risk rule engine
+TRIP_DAILY_MAX_LOSS = "daily_max_loss"
+TRIP_TRAILING_FLOOR = "trailing_profit_floor"
+TRIP_DAILY_MAX_PROFIT = "daily_max_profit"
+TRIP_CONSECUTIVE_LOSSES = "consecutive_loss_limit"
+TRIP_MAX_TRADES = "max_trades_per_day"
+TRIP_COOLDOWN = "cooldown"
+DENY_SIDE_LOCK = "side_lock"
+DENY_POSITION_SIZE = "max_position_size"
+MANUAL_HALT = "manual_halt"
+RULE_TRIP_REASONS = {
+    TRIP_DAILY_MAX_LOSS, TRIP_TRAILING_FLOOR, TRIP_DAILY_MAX_PROFIT,
+    TRIP_CONSECUTIVE_LOSSES, TRIP_MAX_TRADES, TRIP_COOLDOWN,
+}
+
+def manual_halt(status: Dict[str, Any]) -> Optional[str]:
+    """Reason of a halt set from outside the rules (orders_allowed=False with a
+    trip_reason no rule produces); it holds until orders are re-allowed or reset"""
+    reason = status.get("trip_reason")
+    if status.get("orders_allowed") is False and reason and reason not in RULE_TRIP_REASONS:
+        return reason
+    return None
+
+def to_epoch(value: Optional[datetime]) -> float:
+    """Datetime to epoch seconds, 0.0 when unset"""
+    if not value:
+        return 0.0
+    return as_utc(value).timestamp()
+
+class CompiledRules:
+    """RiskConfig flattened into plain slots so evaluation is branch-only.
+
+    Rules, in priority order: daily loss floor (raised by the trailing profit
+    step once peak profit clears it), daily profit target, consecutive loss
+    limit, trades per day, cooldown. A daily_max_loss of 0 or less sets no
+    loss floor, as a daily_max_profit of 0 sets no target. Loss/profit trips
+    latch via max_loss_hit/max_profit_hit until the status is reset, and a
+    manual halt (see manual_halt) outranks every rule until lifted. For
+    orders, side_lock allows only the locked side and the order notional
+    must fit max_position_size.
+    """
+
+    __slots__ = (
+        "max_loss_floor", "max_profit", "max_trades", "consecutive_limit",
+        "trail_step", "side_lock", "max_position_size",
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        max_loss = float(config.get("daily_max_loss", 0.0))
+        self.max_loss_floor = -max_loss if max_loss > 0 else None
+        self.max_profit = float(config.get("daily_max_profit", 0.0))
+        self.max_trades = int(config.get("max_trades_per_day", 0))
+        self.consecutive_limit = int(config.get("consecutive_loss_limit", 0))
+        step = float(config.get("trailing_profit_step", 0.0))
+        self.trail_step = step if config.get("trailing_profit_enabled") and step > 0 else 0.0
+        side_lock = config.get("side_lock")
+        self.side_lock = side_lock.upper() if side_lock else None
+        self.max_position_size = float(config.get("max_position_size", 0.0))
+
+    def loss_floor(self, peak_profit: float):
+        """Active loss floor (None when there is none) and the rule that set it"""
+        if self.trail_step and peak_profit >= self.trail_step:
+            trailing = (peak_profit // self.trail_step - 1) * self.trail_step
+            if self.max_loss_floor is None or trailing > self.max_loss_floor:
+                return trailing, TRIP_TRAILING_FLOOR
+        return self.max_loss_floor, TRIP_DAILY_MAX_LOSS
+
+    def evaluate(self, status: Dict[str, Any], cooldown_until_ts: float, now_ts: float) -> Dict[str, Any]:
+        """Derived status fields for the current status document"""
+        total_pnl = status.get("total_pnl", 0.0)
+        peak_profit = max(status.get("peak_profit", 0.0), total_pnl)
+        floor, floor_reason = self.loss_floor(peak_profit)
+        
+        max_loss_hit = status.get("max_loss_hit", False) or (floor is not None and total_pnl <= floor)
+        max_profit_hit = status.get("max_profit_hit", False) or (self.max_profit > 0 and total_pnl >= self.max_profit)
+        in_cooldown = cooldown_until_ts > now_ts if cooldown_until_ts else status.get("in_cooldown", False)
+        remaining = int((cooldown_until_ts - now_ts) / 60) if cooldown_until_ts > now_ts else 0
+        halt = manual_halt(status)
+        
+        if halt:
+            reason = halt
+        elif max_loss_hit:
+            # Keep the reason of an earlier or externally reported trip
+            reason = status.get("trip_reason") if status.get("max_loss_hit") and status.get("trip_reason") else floor_reason
+        elif max_profit_hit:
+            reason = TRIP_DAILY_MAX_PROFIT
+        elif self.consecutive_limit and status.get("consecutive_losses", 0) >= self.consecutive_limit:
+            reason = TRIP_CONSECUTIVE_LOSSES
+        elif self.max_trades and status.get("trades_today", 0) >= self.max_trades:
+            reason = TRIP_MAX_TRADES
+        elif in_cooldown:
+            reason = TRIP_COOLDOWN
+        else:
+            reason = None
+        
+        return {
+            "peak_profit": peak_profit,
+            "active_loss_floor": floor,
+            "max_loss_hit": max_loss_hit,
+            "max_profit_hit": max_profit_hit,
+            "in_cooldown": in_cooldown,
+            "cooldown_remaining_minutes": remaining,
+            "trip_reason": reason,
+            "orders_allowed": reason is None,
+        }
+
+    def check_order(self, status: Dict[str, Any], cooldown_until_ts: float, now_ts: float, side: str, quantity: int, price: float):
+        """(allowed, reason) for a prospective order; reads only, never writes"""
+        total_pnl = status.get("total_pnl", 0.0)
+        floor, floor_reason = self.loss_floor(max(status.get("peak_profit", 0.0), total_pnl))
+        halt = manual_halt(status)
+        if halt:
+            return False, halt
+        if status.get("max_loss_hit", False) or (floor is not None and total_pnl <= floor):
+            return False, status.get("trip_reason") or floor_reason
+        if status.get("max_profit_hit", False) or (self.max_profit > 0 and total_pnl >= self.max_profit):
+            return False, TRIP_DAILY_MAX_PROFIT
+        if self.consecutive_limit and status.get("consecutive_losses", 0) >= self.consecutive_limit:
+            return False, TRIP_CONSECUTIVE_LOSSES
+        if self.max_trades and status.get("trades_today", 0) >= self.max_trades:
+            return False, TRIP_MAX_TRADES
+        if cooldown_until_ts > now_ts if cooldown_until_ts else status.get("in_cooldown", False):
+            return False, TRIP_COOLDOWN
+        if self.side_lock and side.upper() != self.side_lock:
+            return False, DENY_SIDE_LOCK
+        if self.max_position_size and quantity * price > self.max_position_size:
+            return False, DENY_POSITION_SIZE
+        return True, None
+
+class RiskEngine:
+    """Holds the rules compiled from the cached config document"""
+
+    def __init__(self):
+        self.config_doc: Optional[Dict[str, Any]] = None
+        self.rules: Optional[CompiledRules] = None
+        self.cooldown_raw: Optional[str] = None
+        self.cooldown_ts = 0.0
+
+    def rules_for(self, config: Dict[str, Any]) -> CompiledRules:
+        # The cache replaces its document on every write, so identity is a version check
+        if config is not self.config_doc:
+            self.rules = CompiledRules(config)
+            self.config_doc = config
+        return self.rules
+
+    def cooldown_until_ts(self, status: Dict[str, Any]) -> float:
+        raw = status.get("cooldown_until")
+        if raw != self.cooldown_raw:
+            self.cooldown_ts = to_epoch(raw)
+            self.cooldown_raw = raw
+        return self.cooldown_ts
@@ -1,153 +1,1235 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.datastructures import Headers, MutableHeaders
+from pydantic import ValidationError, TypeAdapter
+import numpy as np
+import io
 import os
+import re
+import csv
+import codecs
+import gzip
+import json
+import hashlib
+import time
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone
-from enum import Enum
+from typing import List, Optional, Dict, Any, Set, AsyncIterator, Tuple, Callable, Awaitable, Hashable
+from datetime import datetime, timezone, timedelta
+from metrics import (
+    METRICS, CACHE_LOOKUPS, KV_SYNC_LAG, KV_LAST_SYNC, LOG_SINK_PENDING, LOG_SINK_DROPPED, STREAM_SUBSCRIBERS,
+    DEADLINES_PENDING, DEADLINES_FIRED, MetricsMiddleware,
+)
+from models import (
+    TRADING_TIMEZONE, utc_now, as_utc, trading_day, LogLevel, LogType, RiskConfig, RiskConfigUpdate, RiskStatus, RiskStatusUpdate,
+    KVStateUpdate, KVStateBatch, LogEntry, LogEntryCreate, Trade, TradeCreate, PreTradeCheck, RiskSimulationRequest,
+)
+from storage import (
+    DEFAULT_ACCOUNT, LOG_CAPPED_MB, MIGRATION_BATCH_SIZE, ROLLUP_COUNTERS, Cursor, RollupBuilder, MongoStore, store,
+    log_expiry, rollup_key, api_query_cursors, plan_stages, plan_indexes,
+)
+from rules import MANUAL_HALT, RULE_TRIP_REASONS, CompiledRules, RiskEngine
+from simulation import SimulationFills, simulate_rules, simulation_candidates
+
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip
+    brotli = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; Parquet exports are unavailable
+    pa = pq = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Enums
-class LogLevel(str, Enum):
-    INFO = "info"
-    WARNING = "warning"
-    ERROR = "error"
-    SUCCESS = "success"
-
-class LogType(str, Enum):
-    CONFIG_CHANGE = "config_change"
-    RISK_EVENT = "risk_event"
-    VIOLATION = "violation"
-    SYSTEM = "system"
-
-# Models
-class RiskConfig(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default="current_config")
-    daily_max_loss: float = Field(description="Maximum daily loss allowed")
-    daily_max_profit: float = Field(description="Daily profit target")
-    max_trades_per_day: int = Field(description="Maximum number of trades allowed per day")
-    max_position_size: float = Field(description="Maximum position size")
-    stop_loss_percentage: float = Field(description="Stop loss percentage")
-    consecutive_loss_limit: int = Field(description="Maximum consecutive losses allowed")
-    cooldown_after_loss: int = Field(description="Cooldown period in minutes after a loss")
-    trailing_profit_enabled: bool = Field(default=False)
-    trailing_profit_step: float = Field(default=0.0)
-    side_lock: Optional[str] = Field(default=None, description="BUY or SELL lock")
-    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
-
-class RiskConfigUpdate(BaseModel):
-    daily_max_loss: float
-    daily_max_profit: float
-    max_trades_per_day: int
-    max_position_size: float
-    stop_loss_percentage: float
-    consecutive_loss_limit: int
-    cooldown_after_loss: int
-    trailing_profit_enabled: bool = False
-    trailing_profit_step: float = 0.0
-    side_lock: Optional[str] = None
-
-class RiskStatus(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    
-    id: str = Field(default="current_status")
-    current_pnl: float = Field(default=0.0)
-    realised: float = Field(default=0.0)
-    unrealised: float = Field(default=0.0)
-    total_pnl: float = Field(default=0.0)
-    trades_today: int = Field(default=0)
-    consecutive_losses: int = Field(default=0)
-    max_loss_hit: bool = Field(default=False)
-    max_profit_hit: bool = Field(default=False)
-    position_size: float = Field(default=0.0)
-    in_cooldown: bool = Field(default=False)
-    cooldown_until: Optional[str] = None
-    cooldown_remaining_minutes: int = Field(default=0)
-    violations: List[str] = Field(default_factory=list)
-    last_trade_time: Optional[str] = None
-    peak_profit: float = Field(default=0.0, description="Peak profit reached today")
-    active_loss_floor: float = Field(default=0.0, description="Current loss floor (trailing stop)")
-    trip_reason: Optional[str] = Field(default=None, description="Reason for tripping")
-    orders_allowed: bool = Field(default=True, description="Whether new orders are allowed")
-    updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
-
-class RiskStatusUpdate(BaseModel):
-    current_pnl: Optional[float] = None
-    realised: Optional[float] = None
-    unrealised: Optional[float] = None
-    total_pnl: Optional[float] = None
-    trades_today: Optional[int] = None
-    consecutive_losses: Optional[int] = None
-    max_loss_hit: Optional[bool] = None
-    max_profit_hit: Optional[bool] = None
-    position_size: Optional[float] = None
-    in_cooldown: Optional[bool] = None
-    cooldown_until: Optional[str] = None
-    cooldown_remaining_minutes: Optional[int] = None
-    violations: Optional[List[str]] = None
-    last_trade_time: Optional[str] = None
-    peak_profit: Optional[float] = None
-    active_loss_floor: Optional[float] = None
-    trip_reason: Optional[str] = None
-    orders_allowed: Optional[bool] = None
-
-class KVStateUpdate(BaseModel):
-    """Model to accept KV state data from external system"""
-    state: Dict[str, Any]
-
-class LogEntry(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+# Account-scoped routes; served under /api for the default account and
+# under /api/accounts/{account_id} for every account
+account_router = APIRouter()
+
+# Dashboard stream broadcaster
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '15'))
+STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '256'))
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode a server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+class DashboardBroadcaster:
+    """In-process fan-out of state changes to connected /api/stream clients.
+
+    Each change is encoded once and pushed to every subscriber queue, so N open
+    dashboards cost a single DB write instead of N polling reads. A subscriber
+    whose queue fills up is dropped; its EventSource reconnects and receives a
+    fresh snapshot.
+    """
+
+    def __init__(self, queue_size: int = STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, account_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(account_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, account_id: str, queue: asyncio.Queue):
+        subscribers = self.subscribers.get(account_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self.subscribers[account_id]
+
+    def publish(self, account_id: str, event: str, data: Any):
+        subscribers = self.subscribers.get(account_id)
+        if not subscribers:
+            return
+        message = format_sse(event, data)
+        for queue in list(subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow consumer: drop pending frames and close its stream
+                self.unsubscribe(account_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+broadcaster = DashboardBroadcaster()
+
+# Buffered log writer
+LOG_SINK_BATCH_SIZE = int(os.environ.get('LOG_SINK_BATCH_SIZE', '200'))
+LOG_SINK_FLUSH_SECONDS = float(os.environ.get('LOG_SINK_FLUSH_SECONDS', '0.5'))
+LOG_SINK_MAX_PENDING = int(os.environ.get('LOG_SINK_MAX_PENDING', '10000'))
+LOG_SINK_POLICY = os.environ.get('LOG_SINK_POLICY', 'block')  # block | drop
+
+class LogSink:
+    """Background group-commit writer for the logs collection.
+
+    Producers enqueue documents and return immediately; one task writes them
+    as one batch once LOG_SINK_BATCH_SIZE entries are pending or
+    LOG_SINK_FLUSH_SECONDS have passed since the first one. The queue is
+    bounded: when full, the `block` policy makes producers wait and `drop`
+    discards the new entry and counts it. Before `start` and after `close`
+    entries are written inline.
+    """
+
+    def __init__(self, batch_size: int = LOG_SINK_BATCH_SIZE, flush_seconds: float = LOG_SINK_FLUSH_SECONDS,
+                 max_pending: int = LOG_SINK_MAX_PENDING, policy: str = LOG_SINK_POLICY):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.policy = policy
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.task = asyncio.create_task(self.run())
+
+    async def put(self, doc: Dict[str, Any]):
+        if self.task is None:
+            await store.insert_logs([doc])
+            return
+        if self.policy == "drop":
+            try:
+                self.queue.put_nowait(doc)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning("Log sink full, %d entries dropped so far", self.dropped)
+            return
+        await self.queue.put(doc)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            doc = await self.queue.get()
+            if doc is None:
+                self.queue.task_done()
+                return
+            batch = [doc]
+            closing = False
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    doc = self.queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        doc = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if doc is None:
+                    # Shutdown sentinel: write what we have and stop
+                    self.queue.task_done()
+                    closing = True
+                    break
+                batch.append(doc)
+            await self.write(batch)
+            if closing:
+                return
+
+    async def write(self, batch: List[Dict[str, Any]]):
+        try:
+            await store.insert_logs(batch)
+        except Exception:
+            logger.exception("Failed to write %d log entries", len(batch))
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    async def flush(self):
+        """Wait until everything enqueued so far has been written"""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def close(self):
+        """Write out everything queued, then stop the writer"""
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        await self.queue.put(None)
+        await task
+
+log_sink = LogSink()
+
+# Deadline scheduler
+class DeadlineScheduler:
+    """Runs coroutines at wall-clock deadlines on the event loop.
+
+    Keys are (kind, account) tuples with at most one timer each; scheduling
+    a key again replaces its timer, so callers simply re-arm after every
+    state change. Timers sit in the event loop's own timer heap, so an idle
+    server does no work between deadlines. Callbacks run as tasks and their
+    errors are logged.
+    """
+
+    def __init__(self):
+        self.timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, key: Hashable, when: float, callback: Callable[[], Awaitable[Any]]):
+        """Run `callback()` at unix time `when` (immediately if it has passed)"""
+        self.cancel(key)
+        loop = asyncio.get_running_loop()
+        self.timers[key] = loop.call_at(loop.time() + max(0.0, when - time.time()), self.fire, key, callback)
+
+    def cancel(self, key: Hashable):
+        handle = self.timers.pop(key, None)
+        if handle is not None:
+            handle.cancel()
+
+    def fire(self, key: Hashable, callback: Callable[[], Awaitable[Any]]):
+        self.timers.pop(key, None)
+        DEADLINES_FIRED.inc(key[0])
+        task = asyncio.create_task(self.run(key, callback))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, key: Hashable, callback: Callable[[], Awaitable[Any]]):
+        try:
+            await callback()
+        except Exception:
+            logger.exception("Deadline %s failed", key)
+
+    async def close(self):
+        """Drop pending timers and wait for callbacks already running"""
+        for key in list(self.timers):
+            self.cancel(key)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+deadlines = DeadlineScheduler()
+
+# Log entries; retention settings live with the storage backends
+async def record_log(account: "AccountState", log_entry: "LogEntry"):
+    """Queue a log entry for the background writer and push it to stream clients"""
+    log_data = log_entry.model_dump()
+    doc = dict(log_data, account=account.id)
+    if not LOG_CAPPED_MB:
+        expire_at = log_expiry(log_entry.type, datetime.now(timezone.utc))
+        if expire_at is not None:
+            doc["expire_at"] = expire_at
+    await log_sink.put(doc)
+    broadcaster.publish(account.id, "log", log_data)
+
+# Singleton document cache
+SINGLETON_CACHE_PROBE_SECONDS = float(os.environ.get('SINGLETON_CACHE_PROBE_SECONDS', '1.0'))
+
+class SingletonCache:
+    """Write-through cache for a single document such as current_config.
+
+    Every write goes through `update`, which bumps a `version` counter in the
+    same round trip and stores the returned document. Reads are served from
+    memory; once the probe interval has elapsed a projection-only read of
+    `version` checks whether another worker has written since, and the full
+    document is reloaded only when it has.
+    """
+
+    def __init__(self, collection_name: str, doc_id: str, account_id: str, probe_seconds: float = SINGLETON_CACHE_PROBE_SECONDS):
+        self.collection_name = collection_name
+        self.doc_id = doc_id
+        self.key = {"account": account_id, "id": doc_id}
+        self.probe_seconds = probe_seconds
+        self.doc: Optional[Dict[str, Any]] = None
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+
+    def store(self, doc: Optional[Dict[str, Any]]):
+        self.doc = doc
+        self.version = doc.get("version") if doc else None
+        self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        self.doc = None
+        self.version = None
+        self.checked_at = 0.0
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Return the cached document; callers must not mutate it"""
+        now = time.monotonic()
+        if self.doc is not None:
+            if now - self.checked_at < self.probe_seconds:
+                CACHE_LOOKUPS.inc(self.collection_name, "hit")
+                return self.doc
+            version = await store.singleton_version(self.collection_name, self.key)
+            if version is not None and version == self.version:
+                self.checked_at = now
+                CACHE_LOOKUPS.inc(self.collection_name, "revalidated")
+                return self.doc
+        CACHE_LOOKUPS.inc(self.collection_name, "miss")
+        doc = await store.find_singleton(self.collection_name, self.key)
+        self.store(doc)
+        return doc
+
+    async def update(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply an update operator document, upserting, and cache the result"""
+        update = dict(update)
+        update["$inc"] = {**update.get("$inc", {}), "version": 1}
+        doc = await store.update_singleton(self.collection_name, self.key, update)
+        self.store(doc)
+        return doc
+
+# Status history
+STATUS_HISTORY_FIELDS = ("total_pnl", "realised", "unrealised", "current_pnl", "peak_profit")
+
+async def record_status_history(account: "AccountState", status: Dict[str, Any], changes: Dict[str, Any]):
+    """Append a P&L point to the status time series when a P&L field changed"""
+    if not any(field in changes for field in STATUS_HISTORY_FIELDS):
+        return
+    point = {"ts": datetime.now(timezone.utc), "account": account.id}
+    for field in STATUS_HISTORY_FIELDS:
+        point[field] = status.get(field, 0.0)
+    await store.insert_history(point)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of the points to keep"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return indices
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Keep the min and max point of each time bucket, in time order"""
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    buckets = max(1, threshold // 2)
+    keep = set()
+    for chunk in np.array_split(np.arange(n), buckets):
+        if len(chunk):
+            keep.add(int(chunk[y[chunk].argmin()]))
+            keep.add(int(chunk[y[chunk].argmax()]))
+    return np.array(sorted(keep), dtype=np.int64)
+
+# Keyset pagination over (timestamp, id), newest first
+def parse_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """`timestamp[,id]` as (timestamp, id or None); 400 when malformed"""
+    if not cursor:
+        return None
+    raw_timestamp, _, row_id = cursor.partition(",")
+    try:
+        timestamp = as_utc(datetime.fromisoformat(raw_timestamp))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return timestamp, row_id or None
+
+def page_cursor(row: Dict[str, Any]) -> str:
+    return f"{row['timestamp'].isoformat()},{row.get('id') or ''}"
+
+async def fetch_page(table: str, account_id: str, limit: int, before: Optional[str], since: Optional[str],
+                     response: Response, **filters: Any) -> List[Dict[str, Any]]:
+    """One keyset page; sets X-Next-Cursor/X-Has-More headers on the response"""
+    rows = await store.page(table, account_id, limit + 1, parse_cursor(before), parse_cursor(since), filters)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    if rows:
+        response.headers["X-Next-Cursor"] = page_cursor(rows[-1])
+        response.headers["X-Latest-Cursor"] = page_cursor(rows[0])
+    return rows
+
+# Conditional GET and compression
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+# Low brotli qualities compress about as well as gzip -6 at a fraction of the CPU
+BROTLI_QUALITY = 4
+
+def weak_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Tag the response with `etag`; returns a 304 to send instead when the
+    client's If-None-Match already names it"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" not in tags and etag not in tags:
+        return None
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return Response(status_code=304, headers=headers)
+
+# Read endpoints validate stored documents once and serialize them in
+# pydantic-core; returning model instances through response_model would
+# validate every row a second time and encode it via jsonable_encoder
+LOG_LIST = TypeAdapter(List[LogEntry])
+TRADE_LIST = TypeAdapter(List[Trade])
+
+def json_response(body: bytes, response: Response) -> Response:
+    """A ready-encoded JSON body carrying the headers set on `response`"""
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class CompressionMiddleware:
+    """Brotli/gzip for complete response bodies of at least `minimum_size`.
+
+    Streamed bodies (server-sent events) pass through untouched, since
+    compressing them would hold events back in the compressor's buffer.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    @staticmethod
+    def choose_encoding(accept_encoding: str) -> Optional[str]:
+        offered = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            offered[name.strip().lower()] = quality
+        if brotli is not None and offered.get("br", 0) > 0:
+            return "br"
+        if offered.get("gzip", 0) > 0:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            if encoding == "br":
+                body = brotli.compress(body, quality=BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+# Streaming exports: rows go from a storage cursor to the client one batch at
+# a time as CSV, NDJSON or Parquet, so an export's memory use is bounded by
+# the batch (or Parquet row group) size rather than the date range
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_ROW_GROUP_ROWS = int(os.environ.get('EXPORT_ROW_GROUP_ROWS', '50000'))
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FIELDS = {
+    "trades": (*Trade.model_fields, "realised_pnl"),
+    "logs": tuple(LogEntry.model_fields),
+}
+
+def parquet_schema(table: str):
+    string, timestamp = pa.string(), pa.timestamp("us", tz="UTC")
+    if table == "trades":
+        return pa.schema([
+            ("id", string), ("timestamp", timestamp), ("instrument", string), ("side", string),
+            ("quantity", pa.int64()), ("price", pa.float64()), ("order_id", string), ("status", string),
+            ("realised_pnl", pa.float64()),
+        ])
+    # details vary per log type, so they are kept as JSON text
+    return pa.schema([
+        ("id", string), ("timestamp", timestamp), ("level", string), ("type", string),
+        ("message", string), ("details", string),
+    ])
+
+def csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=json_default)
+    return value
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last take()"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+def export_key(row: Dict[str, Any]) -> Tuple[datetime, str]:
+    return as_utc(row["timestamp"]), row.get("id") or ""
+
+async def archived_batches(table: str, account_id: str, start: Optional[datetime], end: Optional[datetime],
+                           filters: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Rows of rolled-over sessions in [start, end], oldest first, one archived day at a time"""
+    first = rollup_key({"timestamp": start})[0] if start else None
+    last = rollup_key({"timestamp": end})[0] if end else None
+    for day in await store.archived_days(table, account_id, first, last):
+        rows = [
+            row for row in await store.archived_rows(table, account_id, day)
+            if (start is None or as_utc(row["timestamp"]) >= start) and (end is None or as_utc(row["timestamp"]) <= end)
+            and all(row.get(field) == value for field, value in filters.items())
+        ]
+        if rows:
+            yield rows
+
+async def session_batches(table: str, account_id: str, start: Optional[datetime], end: Optional[datetime],
+                          filters: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Archived and live rows in [start, end] merged oldest first.
+
+    Archives are kept per trading day, so their days concatenate in order;
+    the live rows (the current session plus trades of carried positions)
+    are merged into them batch by batch.
+    """
+    streams = [
+        archived_batches(table, account_id, start, end, filters).__aiter__(),
+        store.export_rows(table, account_id, start, end, filters, EXPORT_BATCH_SIZE).__aiter__(),
+    ]
+    buffers: List[List[Dict[str, Any]]] = [[], []]
+    positions = [0, 0]
+    merged: List[Dict[str, Any]] = []
+    while True:
+        for side, stream in enumerate(streams):
+            if stream is not None and positions[side] == len(buffers[side]):
+                buffers[side], positions[side] = await anext(stream, None) or [], 0
+                if not buffers[side]:
+                    streams[side] = None
+        pending = [side for side in (0, 1) if positions[side] < len(buffers[side])]
+        if not pending:
+            break
+        side = min(pending, key=lambda side: export_key(buffers[side][positions[side]]))
+        merged.append(buffers[side][positions[side]])
+        positions[side] += 1
+        if len(merged) >= EXPORT_BATCH_SIZE:
+            yield merged
+            merged = []
+    if merged:
+        yield merged
+
+async def export_chunks(table: str, account_id: str, fmt: str, start: Optional[datetime], end: Optional[datetime],
+                        filters: Dict[str, Any]) -> AsyncIterator[bytes]:
+    fields = EXPORT_FIELDS[table]
+    batches = session_batches(table, account_id, start, end, filters)
+    if fmt == "ndjson":
+        async for batch in batches:
+            yield "".join(
+                json.dumps({field: row.get(field) for field in fields}, default=json_default) + "\n" for row in batch
+            ).encode()
+        return
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        async for batch in batches:
+            writer.writerows([csv_value(row.get(field)) for field in fields] for row in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+
+    schema = parquet_schema(table)
+    sink = ChunkSink()
+    parquet = pq.ParquetWriter(sink, schema, compression="zstd")
+    pending: List[Dict[str, Any]] = []
+
+    def write_row_group(rows: List[Dict[str, Any]]):
+        columns = {
+            name: [row.get(name) if name != "details" else csv_value(row.get(name)) for row in rows]
+            for name in schema.names
+        }
+        parquet.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+    try:
+        async for batch in batches:
+            pending.extend(batch)
+            if len(pending) >= EXPORT_ROW_GROUP_ROWS:
+                # Encoding and compressing a row group is CPU work; keep it off the loop
+                await asyncio.to_thread(write_row_group, pending)
+                pending = []
+                yield sink.take()
+        if pending:
+            await asyncio.to_thread(write_row_group, pending)
+    finally:
+        # Always write the footer so the writer releases its buffers
+        parquet.close()
+    yield sink.take()
+
+async def export_response(table: str, account: "AccountState", fmt: str, start: Optional[datetime],
+                          end: Optional[datetime], filters: Dict[str, Any]) -> StreamingResponse:
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_MEDIA_TYPES)}")
+    if fmt == "parquet" and pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs the pyarrow package")
+    start = as_utc(start) if start else None
+    end = as_utc(end) if end else None
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return StreamingResponse(
+        export_chunks(table, account.id, fmt, start, end, filters),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}-{account.id}.{fmt}"'},
+    )
+
+# Bulk trade ingestion
+BULK_TRADE_BATCH_SIZE = int(os.environ.get('BULK_TRADE_BATCH_SIZE', '500'))
+
+async def iter_json_rows(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row, value) from an NDJSON or JSON array body as it streams in.
+
+    A malformed NDJSON line yields its ValueError as the value so the caller
+    can report it per row; a malformed JSON array cannot be resynchronised
+    and raises.
+    """
+    ndjson = "ndjson" in request.headers.get("content-type", "") or "jsonl" in request.headers.get("content-type", "")
+    decoder = json.JSONDecoder()
+    # Chunk boundaries can split a multi-byte character
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    row = 0
+    started = False
+    async for chunk in request.stream():
+        buffer += utf8.decode(chunk)
+        if ndjson:
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                row += 1
+                try:
+                    yield row, json.loads(line)
+                except ValueError as e:
+                    yield row, e
+            continue
+        # JSON array: decode complete elements off the front of the buffer
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array or NDJSON body")
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] == ",":
+                buffer = buffer[1:]
+                continue
+            if not buffer or buffer[0] == "]":
+                break
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except ValueError:
+                break  # element not complete yet
+            row += 1
+            buffer = buffer[end:]
+            yield row, value
+    buffer += utf8.decode(b"", final=True)
+    if ndjson and buffer.strip():
+        row += 1
+        try:
+            yield row, json.loads(buffer)
+        except ValueError as e:
+            yield row, e
+    elif not ndjson and buffer.strip() not in ("", "]"):
+        raise ValueError("Truncated or malformed JSON array")
+
+async def insert_trade_batch(account: "AccountState", batch: List[Tuple[int, Dict[str, Any]]], result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Insert validated trades unordered, skipping order_ids already stored"""
+    order_ids = [doc["order_id"] for _, doc in batch if doc.get("order_id")]
+    existing = await store.existing_order_ids(account.id, order_ids) if order_ids else set()
     
-    timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
-    level: LogLevel
-    type: LogType
-    message: str
-    details: Optional[Dict[str, Any]] = None
-
-class LogEntryCreate(BaseModel):
-    level: LogLevel
-    type: LogType
-    message: str
-    details: Optional[Dict[str, Any]] = None
-
-class Trade(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    pending = []
+    for row, doc in batch:
+        order_id = doc.get("order_id")
+        if order_id and order_id in existing:
+            result["duplicates"].append(row)
+            continue
+        if order_id:
+            existing.add(order_id)
+        pending.append((row, doc))
+    if not pending:
+        return []
     
-    id: Optional[str] = None
-    timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
-    instrument: str = Field(description="Trading instrument symbol")
-    side: str = Field(description="BUY or SELL")
-    quantity: int = Field(description="Trade quantity")
-    price: float = Field(description="Trade price")
-    order_id: Optional[str] = None
-    status: str = Field(default="executed")
-
-class TradeCreate(BaseModel):
-    instrument: str
-    side: str
-    quantity: int
-    price: float
-    order_id: Optional[str] = None
-    status: str = "executed"
+    failed = set()
+    for index, duplicate, message in await store.insert_trades([dict(doc, account=account.id) for _, doc in pending]):
+        row = pending[index][0]
+        failed.add(index)
+        if duplicate:
+            result["duplicates"].append(row)
+        else:
+            result["errors"].append({"row": row, "error": message})
+    inserted = [doc for index, (_, doc) in enumerate(pending) if index not in failed]
+    result["inserted"] += len(inserted)
+    return inserted
+
+# Position engine
+class Position:
+    """Average-cost position for one instrument; quantity is signed (short < 0)"""
+    __slots__ = ("instrument", "quantity", "avg_price", "realised_pnl", "fills", "last_key")
+
+    def __init__(self, instrument: str):
+        self.instrument = instrument
+        self.quantity = 0
+        self.avg_price = 0.0
+        self.realised_pnl = 0.0
+        self.fills = 0
+        # (timestamp, id) of the newest fill applied, in replay order
+        self.last_key: Optional[Tuple[datetime, str]] = None
+
+    def copy(self) -> "Position":
+        position = Position(self.instrument)
+        for name in self.__slots__:
+            setattr(position, name, getattr(self, name))
+        return position
+
+    def apply(self, side: str, quantity: int, price: float) -> Tuple[int, float]:
+        """Apply a fill; returns (quantity closed, realised P&L of this fill)
+
+        A non-positive quantity is refused as a no-op: rows stored before
+        quantities were validated must not stop the book from rebuilding.
+        """
+        if quantity <= 0:
+            return 0, 0.0
+        signed = quantity if side.upper() == "BUY" else -quantity
+        self.fills += 1
+        if self.quantity == 0 or (self.quantity > 0) == (signed > 0):
+            # Opening or adding: blend the average cost
+            total = abs(self.quantity) + quantity
+            self.avg_price = (self.avg_price * abs(self.quantity) + price * quantity) / total
+            self.quantity += signed
+            return 0, 0.0
+        # Reducing, closing or flipping
+        closed = min(abs(self.quantity), quantity)
+        direction = 1 if self.quantity > 0 else -1
+        realised = closed * (price - self.avg_price) * direction
+        self.realised_pnl += realised
+        self.quantity += signed
+        if self.quantity == 0:
+            self.avg_price = 0.0
+        elif (self.quantity > 0) != (direction > 0):
+            self.avg_price = price
+        return closed, realised
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "instrument": self.instrument,
+            "quantity": self.quantity,
+            "avg_price": self.avg_price,
+            "realised_pnl": self.realised_pnl,
+            "fills": self.fills,
+        }
+
+class PositionBook:
+    """Per-instrument positions derived from the account's stored executed trades.
+
+    Every worker stores its fills, so the store (not this process's book)
+    decides positions. Each write of executed trades bumps a version counter
+    on the account's positions document; the book remembers the version it
+    was built at, so a one-field probe tells whether another worker has
+    written since and the trades need replaying.
+    """
+
+    def __init__(self, account_id: str):
+        self.account_id = account_id
+        self.key = {"account": account_id, "id": "current_positions"}
+        self.positions: Dict[str, Position] = {}
+        # Trades version the book reflects (0 before the first bump); None
+        # until it has been built
+        self.version: Optional[int] = None
+
+    def clear(self):
+        self.positions = {}
+        self.version = None
+
+    async def touch(self) -> int:
+        """Record a write of executed trades; returns the new trades version"""
+        doc = await store.update_singleton("positions", self.key, {"$inc": {"version": 1}})
+        return doc["version"]
+
+    def preview(self, trade: Dict[str, Any]) -> Optional[Tuple[Position, int, float]]:
+        """Apply a new fill to a copy of its position: (position, closed, realised),
+        or None when the book is unbuilt or the fill is back-dated"""
+        if self.version is None:
+            return None
+        key = export_key(trade)
+        position = self.positions.get(trade["instrument"])
+        if position is not None and position.last_key is not None and key < position.last_key:
+            return None
+        position = position.copy() if position is not None else Position(trade["instrument"])
+        closed, realised = position.apply(trade["side"], trade["quantity"], trade["price"])
+        position.last_key = key
+        return position, closed, realised
+
+    def commit(self, position: Position, version: int) -> bool:
+        """Keep a previewed position if this fill's write was the only one since
+        the book's version; False when the book must be rebuilt instead"""
+        if self.version is None or version != self.version + 1:
+            return False
+        self.positions[position.instrument] = position
+        self.version = version
+        return True
+
+    async def sync(self):
+        """Rebuild the book only if trades were written since it was built"""
+        if self.version is None or (await store.singleton_version("positions", self.key) or 0) != self.version:
+            await self.rebuild()
+
+    async def rebuild(self, on_fill=None):
+        """Replay the account's executed trades oldest-first in one streaming pass.
+
+        `on_fill(trade, closed, realised)` is called for every replayed fill.
+        The book is swapped in at the end, so readers never see a partial replay.
+        """
+        # Read the version first: a write during the replay leaves the book
+        # at an older version, so the next probe rebuilds again
+        version = await store.singleton_version("positions", self.key) or 0
+        positions: Dict[str, Position] = {}
+        async for trade in store.executed_trades(self.account_id):
+            position = positions.get(trade["instrument"])
+            if position is None:
+                position = positions[trade["instrument"]] = Position(trade["instrument"])
+            closed, realised = position.apply(trade["side"], trade["quantity"], trade["price"])
+            position.last_key = export_key(trade)
+            if on_fill is not None:
+                await on_fill(trade, closed, realised)
+        self.positions = positions
+        self.version = version
+
+async def record_trade_rollup(account: "AccountState", trade: Dict[str, Any], closed: int, realised: float):
+    await store.add_rollup(account.id, trade, closed, realised)
+
+async def replay_trades(account: "AccountState", inserted_ids: Optional[Set[str]] = None):
+    """Rebuild an account's positions and analytics rollups from its trades,
+    backfilling each fill's realised_pnl where it is missing or stale.
+
+    Rollups of rolled-over days are kept rather than rebuilt, since most of
+    their trades are archived; fills in `inserted_ids` that fall on such a
+    day are added to them instead.
+    """
+    builder = RollupBuilder(account.id)
+    updates = []
+    late = []
+    # Rollups of rolled-over days stay; their trades now live in the archive
+    after_day = await store.last_session_day(account.id)
+
+    async def on_fill(trade, closed, realised):
+        builder.add(trade, closed, realised)
+        if inserted_ids and after_day and trade.get("id") in inserted_ids and rollup_key(trade)[0] <= after_day:
+            late.append((trade, closed, realised))
+        if trade.get("realised_pnl") != realised:
+            updates.append((trade, realised))
+            if len(updates) >= MIGRATION_BATCH_SIZE:
+                await store.set_realised_pnl(updates)
+                updates.clear()
+
+    await account.position_book.rebuild(on_fill)
+    if updates:
+        await store.set_realised_pnl(updates)
+    docs = [doc for doc in builder.docs.values() if not after_day or doc["day"] > after_day]
+    await store.replace_rollups(account.id, docs, after_day)
+    for trade, closed, realised in late:
+        await store.add_rollup(account.id, trade, closed, realised)
+
+def combine_drawdown(days: List[Dict[str, Any]]) -> float:
+    """Max drawdown of realised P&L across consecutive daily path summaries"""
+    level = peak = max_drawdown = 0.0
+    for day in days:
+        max_drawdown = max(
+            max_drawdown,
+            day.get("max_drawdown", 0.0),
+            peak - (level + day.get("min_level", 0.0)),
+        )
+        peak = max(peak, level + day.get("peak_level", 0.0))
+        level += day.get("realised", 0.0)
+    return max_drawdown
+
+async def simulate_account(account: "AccountState", configs: List[Dict[str, Any]], grid: Dict[str, List[Any]],
+                           start: Optional[str], end: Optional[str], include_trips: bool = True) -> Dict[str, Any]:
+    """Replay the account's fills in [start, end] under the candidates; ValueError on bad input"""
+    for bound in (start, end):
+        if bound:
+            datetime.strptime(bound, "%Y-%m-%d")
+    candidates = simulation_candidates(await load_risk_config(account), configs, grid)
+    trades = []
+    async for trade in store.executed_trades(account.id):
+        day, _ = rollup_key(trade)
+        if (not start or day >= start) and (not end or day <= end):
+            trades.append(trade)
+    # Rolled-over sessions live in the per-day archives
+    for day in await store.archived_days("trades", account.id, start, end):
+        trades.extend(trade for trade in await store.archived_rows("trades", account.id, day) if trade.get("status") == "executed")
+    trades.sort(key=export_key)
+    fills = SimulationFills(trades)
+    started = time.perf_counter()
+    # Sweeps can take a while; keep the event loop serving requests meanwhile
+    outcomes = await asyncio.to_thread(simulate_rules, fills, [candidate["config"] for candidate in candidates], include_trips)
+    return {
+        "days": fills.days,
+        "fills": int(fills.valid.sum()),
+        "actual_realised": float(fills.pnl.sum()),
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+        "results": [{"overrides": candidate["overrides"], **outcome} for candidate, outcome in zip(candidates, outcomes)],
+    }
+
+# Accounts
+ACCOUNT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+class AccountState:
+    """In-process state of one trading account: cached singletons, positions, rules"""
+
+    def __init__(self, account_id: str):
+        self.id = account_id
+        self.config_cache = SingletonCache("risk_config", "current_config", account_id)
+        self.status_cache = SingletonCache("risk_status", "current_status", account_id)
+        self.position_book = PositionBook(account_id)
+        self.risk_engine = RiskEngine()
+        # Push timestamp (ms) of the newest KV state applied by this worker;
+        # older batch entries from slower pushers are dropped instead of
+        # rolling state back
+        self.last_kv_push_ts: Optional[int] = None
+
+accounts: Dict[str, AccountState] = {}
+
+def account_state(account_id: str) -> AccountState:
+    account = accounts.get(account_id)
+    if account is None:
+        account = accounts[account_id] = AccountState(account_id)
+    return account
+
+def current_account(request: Request) -> AccountState:
+    """Dependency: the account named in the path, or the default account"""
+    account_id = request.path_params.get("account_id", DEFAULT_ACCOUNT)
+    if not ACCOUNT_ID_PATTERN.match(account_id):
+        raise HTTPException(status_code=400, detail=f"Invalid account id: {account_id}")
+    return account_state(account_id)
+
+async def current_rules(account: AccountState) -> CompiledRules:
+    return account.risk_engine.rules_for(await load_risk_config(account))
+
+def next_cooldown_change(cooldown_until_ts: float, now_ts: float) -> Optional[float]:
+    """When in_cooldown or cooldown_remaining_minutes next changes, if ever"""
+    if cooldown_until_ts <= now_ts:
+        return None
+    # The whole-minute count drops when the time left crosses its next multiple of 60s
+    remaining = int((cooldown_until_ts - now_ts) / 60)
+    return cooldown_until_ts - 60 * remaining
+
+def arm_cooldown_deadline(account: AccountState, cooldown_until_ts: float, now_ts: float):
+    """Re-evaluate the account when its cooldown countdown next changes"""
+    key = ("cooldown", account.id)
+    when = next_cooldown_change(cooldown_until_ts, now_ts)
+    if when is None:
+        deadlines.cancel(key)
+    else:
+        deadlines.schedule(key, when, lambda: reevaluate_status(account))
+
+async def reevaluate_status(account: AccountState):
+    """Re-run the rules against the current status and persist what changed"""
+    rules = await current_rules(account)
+    status = await load_risk_status(account)
+    now_ts = datetime.now(timezone.utc).timestamp()
+    cooldown_until_ts = account.risk_engine.cooldown_until_ts(status)
+    arm_cooldown_deadline(account, cooldown_until_ts, now_ts)
+    derived = rules.evaluate(status, cooldown_until_ts, now_ts)
+    changes = changed_fields(status, derived)
+    if not changes:
+        return status
+    changes["updated_at"] = utc_now()
+    status = await account.status_cache.update({"$set": changes})
+    broadcaster.publish(account.id, "status", changes)
+    await record_status_history(account, status, changes)
+    return status
+
+# Session rollover: at market close each account's trades and logs up to the
+# close move into per-day archives, a summary of the day is saved and the live
+# status starts the next session flat, so the hot collections only ever hold
+# the current session. The trade rollups of archived days are kept as their
+# compact history.
+MARKET_CLOSE = os.environ.get('MARKET_CLOSE', '15:30')  # HH:MM in TRADING_TIMEZONE, or "off"
+ARCHIVE_RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', '0'))  # 0 keeps archives forever
+SESSION_DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def next_market_close(now: datetime) -> Optional[datetime]:
+    if MARKET_CLOSE.lower() == "off":
+        return None
+    hour, minute = (int(part) for part in MARKET_CLOSE.split(":"))
+    local = now.astimezone(TRADING_TIMEZONE)
+    close = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if close <= local:
+        close += timedelta(days=1)
+    return close.astimezone(timezone.utc)
+
+async def open_instruments_at(account_id: str, cutoff: datetime) -> Set[str]:
+    """Instruments with a non-flat position from the executed trades up to `cutoff`"""
+    positions: Dict[str, Position] = {}
+    async for trade in store.executed_trades(account_id):
+        if as_utc(trade["timestamp"]) > cutoff:
+            break
+        position = positions.get(trade["instrument"])
+        if position is None:
+            position = positions[trade["instrument"]] = Position(trade["instrument"])
+        position.apply(trade["side"], trade["quantity"], trade["price"])
+    return {instrument for instrument, position in positions.items() if position.quantity}
+
+async def roll_over_account(account: AccountState, cutoff: datetime) -> Optional[Dict[str, Any]]:
+    """Archive the session ending at `cutoff` and reset the live status; None if
+    another worker has this cutoff or there was nothing to roll over"""
+    day = cutoff.astimezone(TRADING_TIMEZONE).date().isoformat()
+    # Claims are per cutoff: workers racing for the same close roll it over
+    # once, while a later close (after a manual rollover) still runs
+    claim = await store.update_singleton(
+        "session_rollovers", {"account": account.id, "id": cutoff.isoformat()}, {"$inc": {"claims": 1}},
+    )
+    if claim["claims"] > 1:
+        return None
+    await log_sink.flush()
+    status = await load_risk_status(account)
+    # Positions still open at the close keep their trades live, so the next
+    # session's book (rebuilt from live trades) starts from them
+    carried = await open_instruments_at(account.id, cutoff)
+    archived = {"trades": 0, "logs": 0}
+    for table in archived:
+        async for batch in store.export_rows(table, account.id, None, cutoff, {}, EXPORT_BATCH_SIZE):
+            rows = [row for row in batch if not (table == "trades" and row.get("instrument") in carried)]
+            if any(not row.get("id") for row in rows):
+                # Without an id a row could not be deleted after archiving; the
+                # startup id backfill picks it up for the next rollover
+                logger.warning("Leaving %s rows without an id live for account %s", table, account.id)
+                rows = [row for row in rows if row.get("id")]
+            by_day: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                by_day.setdefault(rollup_key(row)[0], []).append(row)
+            for row_day, day_rows in by_day.items():
+                await store.archive_rows(table, account.id, row_day, day_rows)
+            # Only what was archived is deleted; rows written meanwhile stay live
+            if rows:
+                await store.delete_rows(table, account.id, [row["id"] for row in rows])
+                if table == "trades":
+                    await account.position_book.touch()
+            archived[table] += len(rows)
+    if not any(archived.values()) and not status.get("trades_today") and not status.get("total_pnl"):
+        return None
+
+    facets = await store.analytics_facets(account.id, day, day, None)
+    totals = facets["days"][0] if facets["days"] else {}
+    # An earlier rollover of the same day (e.g. a manual one) already archived part of it
+    earlier = await store.sessions(account.id, day, day)
+    summary = {
+        "account": account.id,
+        "day": day,
+        "closed_at": cutoff,
+        "rollovers": earlier[0].get("rollovers", 1) + 1 if earlier else 1,
+        "status": RiskStatus.model_validate(status).model_dump(),
+        "archived_trades": archived["trades"] + (earlier[0]["archived_trades"] if earlier else 0),
+        "archived_logs": archived["logs"] + (earlier[0]["archived_logs"] if earlier else 0),
+        "carried_instruments": sorted(carried),
+        "fills": sum(row["fills"] for row in facets["by_instrument"]),
+        "realised": totals.get("realised", 0.0),
+        "max_drawdown": totals.get("max_drawdown", 0.0),
+    }
+    await store.save_session(summary)
+
+    reset_data = RiskStatus(id="current_status").model_dump()
+    await account.status_cache.update({"$set": reset_data})
+    broadcaster.publish(account.id, "status", reset_data)
+    await record_status_history(account, reset_data, reset_data)
+    await reevaluate_status(account)
+    await replay_trades(account)
+    broadcaster.publish(account.id, "session_rollover", {"day": day, **archived})
+    await record_log(account, LogEntry(
+        level=LogLevel.INFO,
+        type=LogType.SYSTEM,
+        message=f"Session {day} rolled over",
+        details={"archived_trades": archived["trades"], "archived_logs": archived["logs"], "carried_instruments": sorted(carried)},
+    ))
+    return summary
+
+async def roll_over_sessions(cutoff: datetime):
+    account_ids = set(await store.trade_accounts())
+    account_ids.update(row.get("account") or "" for row in (await store.accounts_overview())["accounts"])
+    for account_id in sorted(account_ids):
+        if not ACCOUNT_ID_PATTERN.match(account_id):
+            continue
+        try:
+            await roll_over_account(account_state(account_id), cutoff)
+        except Exception:
+            logger.exception("Session rollover failed for account %s", account_id)
+    if ARCHIVE_RETENTION_DAYS > 0:
+        oldest = cutoff.astimezone(TRADING_TIMEZONE).date() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+        await store.drop_archives(oldest.isoformat())
+
+# Daily counters: trades_today and consecutive_losses count the fills of one
+# trading day, which the status records as trading_day. The first fill of a
+# later day starts them over, and each local midnight resets every account's
+# counters so the rules stop counting yesterday's fills before anything trades.
+def next_trading_day_start(now: datetime) -> datetime:
+    local = now.astimezone(TRADING_TIMEZONE)
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.astimezone(timezone.utc)
+
+async def roll_daily_counters(account: AccountState, today: str) -> bool:
+    """Zero the daily counters if they belong to an earlier trading day.
+
+    A status without a trading_day (new, reset or rolled over) already counts
+    from zero; the next fill claims it for its day.
+    """
+    status = await load_risk_status(account)
+    if status.get("trading_day") in (None, today):
+        return False
+    changes = {"trading_day": today, "trades_today": 0, "consecutive_losses": 0, "updated_at": utc_now()}
+    await account.status_cache.update({"$set": changes})
+    broadcaster.publish(account.id, "status", changes)
+    return True
+
+async def start_trading_day():
+    today = trading_day(utc_now())
+    for row in (await store.accounts_overview())["accounts"]:
+        account_id = row.get("account") or ""
+        if not ACCOUNT_ID_PATTERN.match(account_id):
+            continue
+        account = account_state(account_id)
+        try:
+            if await roll_daily_counters(account, today):
+                await reevaluate_status(account)
+        except Exception:
+            logger.exception("Daily counter reset failed for account %s", account_id)
+
+def arm_daily_reset():
+    when = next_trading_day_start(utc_now())
+
+    async def reset():
+        try:
+            await start_trading_day()
+        finally:
+            arm_daily_reset()
+
+    deadlines.schedule(("daily_reset", "*"), when.timestamp(), reset)
+
+def arm_session_rollover():
+    when = next_market_close(utc_now())
+    if when is None:
+        return
+
+    async def roll_over():
+        try:
+            await roll_over_sessions(when)
+        finally:
+            arm_session_rollover()
+
+    deadlines.schedule(("rollover", "*"), when.timestamp(), roll_over)
 
 # Routes
 @api_router.get("/")
@@ -155,9 +1237,9 @@ async def root():
     return {"message": "Risk Management Dashboard API"}
 
 # Risk Configuration Endpoints
-@api_router.get("/risk-config", response_model=RiskConfig)
-async def get_risk_config():
-    config = await db.risk_config.find_one({"id": "current_config"}, {"_id": 0})
+async def load_risk_config(account: AccountState) -> Dict[str, Any]:
+    """The account's stored config document, creating the defaults on first use"""
+    config = await account.config_cache.get()
     if not config:
         # Return default config
         default_config = RiskConfig(
@@ -172,21 +1254,24 @@ async def get_risk_config():
             trailing_profit_enabled=False,
             trailing_profit_step=0.5
         )
-        await db.risk_config.insert_one(default_config.model_dump())
-        return default_config
-    return RiskConfig(**config)
+        config = await account.config_cache.update({"$setOnInsert": default_config.model_dump()})
+    return config
 
-@api_router.put("/risk-config", response_model=RiskConfig)
-async def update_risk_config(config_update: RiskConfigUpdate):
+@account_router.get("/risk-config", response_model=RiskConfig)
+async def get_risk_config(request: Request, response: Response, account: AccountState = Depends(current_account)):
+    config = await load_risk_config(account)
+    unchanged = not_modified(request, response, weak_etag(config.get("version"), config.get("updated_at")))
+    if unchanged:
+        return unchanged
+    return json_response(RiskConfig.model_validate(config).model_dump_json(), response)
+
+@account_router.put("/risk-config", response_model=RiskConfig)
+async def update_risk_config(config_update: RiskConfigUpdate, account: AccountState = Depends(current_account)):
     config_data = config_update.model_dump()
     config_data["id"] = "current_config"
-    config_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    config_data["updated_at"] = utc_now()
     
-    await db.risk_config.update_one(
-        {"id": "current_config"},
-        {"$set": config_data},
-        upsert=True
-    )
+    await account.config_cache.update({"$set": config_data})
     
     # Log the configuration change
     log_entry = LogEntry(
@@ -195,44 +1280,139 @@ async def update_risk_config(config_update: RiskConfigUpdate):
         message="Risk configuration updated",
         details=config_data
     )
-    await db.logs.insert_one(log_entry.model_dump())
+    broadcaster.publish(account.id, "config", config_data)
+    await record_log(account, log_entry)
+    await reevaluate_status(account)
     
     return RiskConfig(**config_data)
 
+@account_router.post("/risk-config/simulate")
+async def simulate_risk_config(request: RiskSimulationRequest, account: AccountState = Depends(current_account)):
+    """How candidate configs would have behaved on the account's past fills"""
+    try:
+        return await simulate_account(account, request.configs, request.grid, request.start, request.end, request.include_trips)
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Risk Status Endpoints
-@api_router.get("/risk-status", response_model=RiskStatus)
-async def get_risk_status():
-    status = await db.risk_status.find_one({"id": "current_status"}, {"_id": 0})
+async def load_risk_status(account: AccountState) -> Dict[str, Any]:
+    """The account's stored status document, creating the defaults on first use"""
+    status = await account.status_cache.get()
     if not status:
         default_status = RiskStatus(id="current_status")
-        await db.risk_status.insert_one(default_status.model_dump())
-        return default_status
-    return RiskStatus(**status)
+        status = await account.status_cache.update({"$setOnInsert": default_status.model_dump()})
+    return status
 
-@api_router.put("/risk-status", response_model=RiskStatus)
-async def update_risk_status(status_update: RiskStatusUpdate):
-    current_status = await db.risk_status.find_one({"id": "current_status"}, {"_id": 0})
+@account_router.get("/risk-status", response_model=RiskStatus)
+async def get_risk_status(request: Request, response: Response, account: AccountState = Depends(current_account)):
+    status = await load_risk_status(account)
+    unchanged = not_modified(request, response, weak_etag(status.get("version"), status.get("updated_at")))
+    if unchanged:
+        return unchanged
+    return json_response(RiskStatus.model_validate(status).model_dump_json(), response)
+
+@account_router.put("/risk-status", response_model=RiskStatus)
+async def update_risk_status(status_update: RiskStatusUpdate, account: AccountState = Depends(current_account)):
+    # Update only provided fields in a single atomic round trip; defaults
+    # are written only when the status document does not exist yet
+    update_data = status_update.model_dump(exclude_none=True)
+    update_data["updated_at"] = utc_now()
+    if update_data.get("orders_allowed") is False and update_data.get("trip_reason") in (None, *RULE_TRIP_REASONS):
+        # Halting by hand: a reason no rule produces keeps it latched
+        update_data["trip_reason"] = MANUAL_HALT
     
-    if not current_status:
-        current_status = RiskStatus(id="current_status").model_dump()
+    defaults = RiskStatus(id="current_status").model_dump(exclude={"id"})
+    for key in update_data:
+        defaults.pop(key, None)
     
-    # Update only provided fields
-    update_data = status_update.model_dump(exclude_none=True)
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    current_status = await account.status_cache.update({"$set": update_data, "$setOnInsert": defaults})
+    broadcaster.publish(account.id, "status", update_data)
+    await record_status_history(account, current_status, update_data)
+    current_status = await reevaluate_status(account)
     
-    for key, value in update_data.items():
-        current_status[key] = value
+    return RiskStatus(**current_status)
+
+@account_router.get("/risk-status/history")
+async def get_risk_status_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = 500,
+    method: str = "lttb",
+    fields: str = "total_pnl",
+    account: AccountState = Depends(current_account),
+):
+    """Downsampled P&L series for a window (default: the current trading day)"""
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in STATUS_HISTORY_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown history fields: {unknown}")
+    if method not in ("lttb", "minmax"):
+        raise HTTPException(status_code=400, detail="method must be 'lttb' or 'minmax'")
+    if points < 3:
+        raise HTTPException(status_code=400, detail="points must be at least 3")
+    
+    end = as_utc(end) if end else utc_now()
+    # Trading days start at midnight in TRADING_TIMEZONE, as for analytics
+    start = as_utc(start) if start else end.astimezone(TRADING_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    rows = await store.history_range(account.id, start, end, selected)
     
-    await db.risk_status.update_one(
-        {"id": "current_status"},
-        {"$set": current_status},
-        upsert=True
+    timestamps = np.array(
+        [int(as_utc(row["ts"]).timestamp() * 1000) for row in rows],
+        dtype=np.int64
     )
+    downsample = lttb_indices if method == "lttb" else minmax_indices
+    series = {}
+    for field in selected:
+        values = np.array([row.get(field, 0.0) for row in rows], dtype=np.float64)
+        keep = downsample(timestamps.astype(np.float64), values, points)
+        series[field] = [[int(timestamps[i]), float(values[i])] for i in keep]
     
-    return RiskStatus(**current_status)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "method": method,
+        "raw_points": len(rows),
+        "series": series,
+    }
+
+def session_day(day: str) -> str:
+    if not SESSION_DAY_PATTERN.match(day):
+        raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+    return day
+
+@account_router.get("/sessions")
+async def get_sessions(start: Optional[str] = None, end: Optional[str] = None, account: AccountState = Depends(current_account)):
+    """Summaries of rolled-over trading days `start`..`end` (YYYY-MM-DD), oldest first"""
+    return await store.sessions(account.id, start and session_day(start), end and session_day(end))
 
-@api_router.post("/risk-status/reset")
-async def reset_risk_status():
+@account_router.post("/sessions/rollover")
+async def roll_over_session(account: AccountState = Depends(current_account)):
+    """Archive the current session now instead of waiting for MARKET_CLOSE"""
+    summary = await roll_over_account(account, utc_now())
+    if summary is None:
+        raise HTTPException(status_code=409, detail="Nothing to roll over since the last rollover")
+    return summary
+
+@account_router.get("/sessions/{day}")
+async def get_session(day: str, account: AccountState = Depends(current_account)):
+    sessions = await store.sessions(account.id, session_day(day), day)
+    if not sessions:
+        raise HTTPException(status_code=404, detail=f"No session summary for {day}")
+    return sessions[0]
+
+@account_router.get("/sessions/{day}/trades")
+async def get_session_trades(day: str, response: Response, account: AccountState = Depends(current_account)):
+    trades = await store.archived_rows("trades", account.id, session_day(day))
+    return json_response(TRADE_LIST.dump_json(TRADE_LIST.validate_python(trades)), response)
+
+@account_router.get("/sessions/{day}/logs")
+async def get_session_logs(day: str, response: Response, account: AccountState = Depends(current_account)):
+    logs = await store.archived_rows("logs", account.id, session_day(day))
+    return json_response(LOG_LIST.dump_json(LOG_LIST.validate_python(logs)), response)
+
+@account_router.post("/risk-status/reset")
+async def reset_risk_status(account: AccountState = Depends(current_account)):
     # Create status with mock data for demonstration
     default_status = RiskStatus(
         id="current_status",
@@ -242,139 +1422,574 @@ async def reset_risk_status():
         peak_profit=1500.0,
         active_loss_floor=500.0,
         orders_allowed=True,
-        last_trade_time=datetime.now(timezone.utc).isoformat()
-    )
-    await db.risk_status.update_one(
-        {"id": "current_status"},
-        {"$set": default_status.model_dump()},
-        upsert=True
+        last_trade_time=utc_now()
     )
+    reset_data = default_status.model_dump()
+    await account.status_cache.update({"$set": reset_data})
+    broadcaster.publish(account.id, "status", reset_data)
+    await record_status_history(account, reset_data, reset_data)
+    await reevaluate_status(account)
     
     log_entry = LogEntry(
         level=LogLevel.INFO,
         type=LogType.SYSTEM,
         message="Risk status reset to default"
     )
-    await db.logs.insert_one(log_entry.model_dump())
+    await record_log(account, log_entry)
     
     # Add some sample trades if none exist
-    trade_count = await db.trades.count_documents({})
+    trade_count = await store.count_trades(account.id)
     if trade_count == 0:
         sample_trades = [
-            Trade(instrument="NIFTY25D09257700PE", side="BUY", quantity=75, price=3.15, timestamp=(datetime.now(timezone.utc).replace(hour=13, minute=1, second=41)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=17.7, timestamp=(datetime.now(timezone.utc).replace(hour=11, minute=46, second=41)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=17.4, timestamp=(datetime.now(timezone.utc).replace(hour=11, minute=34, second=33)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=17.45, timestamp=(datetime.now(timezone.utc).replace(hour=11, minute=34, second=28)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=16.7, timestamp=(datetime.now(timezone.utc).replace(hour=10, minute=34, second=33)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=15.8, timestamp=(datetime.now(timezone.utc).replace(hour=10, minute=23, second=7)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=15.6, timestamp=(datetime.now(timezone.utc).replace(hour=10, minute=15, second=34)).isoformat()),
-            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=13.65, timestamp=(datetime.now(timezone.utc).replace(hour=9, minute=15, second=23)).isoformat()),
+            Trade(instrument="NIFTY25D09257700PE", side="BUY", quantity=75, price=3.15, timestamp=utc_now().replace(hour=13, minute=1, second=41)),
+            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=17.7, timestamp=utc_now().replace(hour=11, minute=46, second=41)),
+            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=17.4, timestamp=utc_now().replace(hour=11, minute=34, second=33)),
+            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=17.45, timestamp=utc_now().replace(hour=11, minute=34, second=28)),
+            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=16.7, timestamp=utc_now().replace(hour=10, minute=34, second=33)),
+            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=15.8, timestamp=utc_now().replace(hour=10, minute=23, second=7)),
+            Trade(instrument="NIFTY25D16256600PE", side="SELL", quantity=75, price=15.6, timestamp=utc_now().replace(hour=10, minute=15, second=34)),
+            Trade(instrument="NIFTY25D16256600PE", side="BUY", quantity=75, price=13.65, timestamp=utc_now().replace(hour=9, minute=15, second=23)),
         ]
-        await db.trades.insert_many([trade.model_dump() for trade in sample_trades])
+        await store.insert_trades([dict(trade.model_dump(), account=account.id) for trade in sample_trades])
+        await account.position_book.touch()
+        await replay_trades(account)
+        broadcaster.publish(account.id, "trades_reset", [trade.model_dump() for trade in sample_trades])
     
     return {"message": "Risk status reset successfully"}
 
 # KV State Sync Endpoint
-@api_router.post("/sync-kv-state")
-async def sync_kv_state(kv_data: KVStateUpdate):
+def kv_state_to_status(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a KV state to RiskStatus fields"""
+    # Calculate cooldown remaining time
+    cooldown_remaining = 0
+    if state.get('cooldown_active') and state.get('cooldown_until'):
+        cooldown_until_ts = state['cooldown_until'] / 1000  # Convert to seconds
+        current_ts = datetime.now(timezone.utc).timestamp()
+        cooldown_remaining = max(0, int((cooldown_until_ts - current_ts) / 60))  # Minutes
+    
+    return {
+        "id": "current_status",
+        "realised": state.get('realised', 0.0),
+        "unrealised": state.get('unrealised', 0.0),
+        "total_pnl": state.get('total_pnl', 0.0),
+        "current_pnl": state.get('total_pnl', 0.0),
+        "consecutive_losses": state.get('consecutive_losses', 0),
+        "in_cooldown": state.get('cooldown_active', False),
+        "cooldown_until": datetime.fromtimestamp(state['cooldown_until'] / 1000, tz=timezone.utc) if state.get('cooldown_until') else None,
+        "cooldown_remaining_minutes": cooldown_remaining,
+        "max_loss_hit": state.get('tripped_day', False),
+        "violations": [state.get('trip_reason')] if state.get('trip_reason') else [],
+        "last_trade_time": datetime.fromtimestamp(state['last_trade_time'] / 1000, tz=timezone.utc) if state.get('last_trade_time') else None,
+        "updated_at": utc_now()
+    }
+
+def kv_state_to_config(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map a KV state to RiskConfig fields, or None if it carries no config"""
+    if 'max_loss_pct' not in state:
+        return None
+    capital = state.get('capital_day_915', 3000)
+    return {
+        "id": "current_config",
+        "daily_max_loss": state.get('max_loss_abs', capital * state['max_loss_pct'] / 100),
+        "daily_max_profit": state.get('max_profit_abs', capital * state.get('max_profit_pct', 10) / 100),
+        "max_trades_per_day": 10,  # Not in KV, using default
+        "max_position_size": capital,
+        "stop_loss_percentage": 2.0,  # Not in KV
+        "consecutive_loss_limit": state.get('max_consecutive_losses', 3),
+        "cooldown_after_loss": state.get('cooldown_min', 15),
+        "trailing_profit_enabled": state.get('trail_step_profit', 0) > 0,
+        "trailing_profit_step": state.get('trail_step_profit', 0),
+        "updated_at": utc_now()
+    }
+
+def changed_fields(current: Optional[Dict[str, Any]], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of data that differ from the current document, ignoring id/updated_at"""
+    current = current or {}
+    return {
+        key: value for key, value in data.items()
+        if key not in ("id", "updated_at") and (key not in current or current[key] != value)
+    }
+
+async def apply_kv_state(account: AccountState, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Write only the status/config fields that changed; returns the mapped status"""
+    status_data = kv_state_to_status(state)
+    config_data = kv_state_to_config(state)
+    now_ts = time.time()
+    KV_LAST_SYNC.set(now_ts, account.id)
+    if state.get('last_trade_time'):
+        KV_SYNC_LAG.set(now_ts - state['last_trade_time'] / 1000, account.id, "last_trade")
+    
+    # Also sync config if present, skipping the write when nothing changed
+    if config_data is not None:
+        config_changes = changed_fields(await account.config_cache.get(), config_data)
+        if config_changes:
+            config_changes["updated_at"] = config_data["updated_at"]
+            await account.config_cache.update({"$set": config_changes})
+            broadcaster.publish(account.id, "config", config_changes)
+    
+    # Update status: the rules run on the pushed fields merged into the stored
+    # status, so the push and what the rules derive from it are one write and
+    # an unchanged push writes nothing
+    current = await account.status_cache.get() or {}
+    merged = {**current, **status_data}
+    # A push can report a loss trip but not lift one the rules latched
+    merged["max_loss_hit"] = bool(current.get("max_loss_hit")) or status_data["max_loss_hit"]
+    rules = await current_rules(account)
+    cooldown_until_ts = account.risk_engine.cooldown_until_ts(merged)
+    arm_cooldown_deadline(account, cooldown_until_ts, now_ts)
+    merged.update(rules.evaluate(merged, cooldown_until_ts, now_ts))
+    status_changes = changed_fields(current, merged)
+    if status_changes:
+        status_changes["updated_at"] = status_data["updated_at"]
+        defaults = RiskStatus(id="current_status").model_dump(exclude={"id"})
+        for key in status_changes:
+            defaults.pop(key, None)
+        current_status = await account.status_cache.update({"$set": status_changes, "$setOnInsert": defaults})
+        broadcaster.publish(account.id, "status", status_changes)
+        await record_status_history(account, current_status, status_changes)
+    
+    return status_data
+
+@account_router.post("/sync-kv-state")
+async def sync_kv_state(kv_data: KVStateUpdate, account: AccountState = Depends(current_account)):
     """Sync risk status from external KV state"""
     try:
-        state = kv_data.state
+        status_data = await apply_kv_state(account, kv_data.state)
+        return {"message": "KV state synced successfully", "status": status_data}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to sync KV state: {str(e)}")
+
+@account_router.post("/sync-kv-state/batch")
+async def sync_kv_state_batch(batch: KVStateBatch, account: AccountState = Depends(current_account)):
+    """Coalesce a batch of timestamped KV states and apply only the net change"""
+    try:
+        last_push_ts = account.last_kv_push_ts
+        entries = sorted(
+            (entry for entry in batch.states
+             if entry.timestamp is None or last_push_ts is None or entry.timestamp >= last_push_ts),
+            key=lambda entry: entry.timestamp or 0
+        )
+        if not entries:
+            return {"message": "No newer KV state in batch", "received": len(batch.states), "applied": 0}
         
-        # Calculate cooldown remaining time
-        cooldown_remaining = 0
-        if state.get('cooldown_active') and state.get('cooldown_until'):
-            cooldown_until_ts = state['cooldown_until'] / 1000  # Convert to seconds
-            current_ts = datetime.now(timezone.utc).timestamp()
-            cooldown_remaining = max(0, int((cooldown_until_ts - current_ts) / 60))  # Minutes
+        # Later states override earlier ones, so partial pushes still merge
+        state: Dict[str, Any] = {}
+        for entry in entries:
+            state.update(entry.state)
         
-        # Map KV state to RiskStatus
-        status_data = {
-            "id": "current_status",
-            "realised": state.get('realised', 0.0),
-            "unrealised": state.get('unrealised', 0.0),
-            "total_pnl": state.get('total_pnl', 0.0),
-            "current_pnl": state.get('total_pnl', 0.0),
-            "consecutive_losses": state.get('consecutive_losses', 0),
-            "in_cooldown": state.get('cooldown_active', False),
-            "cooldown_until": datetime.fromtimestamp(state['cooldown_until'] / 1000, tz=timezone.utc).isoformat() if state.get('cooldown_until') else None,
-            "cooldown_remaining_minutes": cooldown_remaining,
-            "max_loss_hit": state.get('tripped_day', False),
-            "violations": [state.get('trip_reason')] if state.get('trip_reason') else [],
-            "last_trade_time": datetime.fromtimestamp(state['last_trade_time'] / 1000, tz=timezone.utc).isoformat() if state.get('last_trade_time') else None,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+        status_data = await apply_kv_state(account, state)
+        newest = max((entry.timestamp for entry in entries if entry.timestamp is not None), default=None)
+        if newest is not None:
+            account.last_kv_push_ts = newest
+            KV_SYNC_LAG.set(time.time() - newest / 1000, account.id, "push")
+        return {
+            "message": "KV state batch synced successfully",
+            "received": len(batch.states),
+            "applied": len(entries),
+            "status": status_data,
         }
-        
-        # Also sync config if present
-        if 'max_loss_pct' in state:
-            capital = state.get('capital_day_915', 3000)
-            config_data = {
-                "id": "current_config",
-                "daily_max_loss": state.get('max_loss_abs', capital * state['max_loss_pct'] / 100),
-                "daily_max_profit": state.get('max_profit_abs', capital * state.get('max_profit_pct', 10) / 100),
-                "max_trades_per_day": 10,  # Not in KV, using default
-                "max_position_size": capital,
-                "stop_loss_percentage": 2.0,  # Not in KV
-                "consecutive_loss_limit": state.get('max_consecutive_losses', 3),
-                "cooldown_after_loss": state.get('cooldown_min', 15),
-                "trailing_profit_enabled": state.get('trail_step_profit', 0) > 0,
-                "trailing_profit_step": state.get('trail_step_profit', 0),
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.risk_config.update_one(
-                {"id": "current_config"},
-                {"$set": config_data},
-                upsert=True
-            )
-        
-        # Update status
-        await db.risk_status.update_one(
-            {"id": "current_status"},
-            {"$set": status_data},
-            upsert=True
-        )
-        
-        return {"message": "KV state synced successfully", "status": status_data}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to sync KV state: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Failed to sync KV state batch: {str(e)}")
 
 # Logs Endpoints
-@api_router.get("/logs", response_model=List[LogEntry])
-async def get_logs(limit: int = 100, log_type: Optional[str] = None):
-    query = {}
-    if log_type:
-        query["type"] = log_type
-    
-    logs = await db.logs.find(query, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
-    return [LogEntry(**log) for log in logs]
+@account_router.get("/logs", response_model=List[LogEntry])
+async def get_logs(
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    log_type: Optional[str] = None,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    account: AccountState = Depends(current_account),
+):
+    """Newest-first logs; `before`/`since` take `timestamp,id` cursors from X-Next-Cursor/X-Latest-Cursor"""
+    filters = {"type": log_type} if log_type else {}
+    logs = await fetch_page("logs", account.id, limit, before, since, response, **filters)
+    # Log entries are never modified, so the page's row keys identify its content
+    unchanged = not_modified(request, response, weak_etag([(log["timestamp"], log.get("id")) for log in logs]))
+    if unchanged:
+        return unchanged
+    return json_response(LOG_LIST.dump_json(LOG_LIST.validate_python(logs)), response)
+
+@account_router.get("/logs/export")
+async def export_logs(
+    fmt: str = Query("csv", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    log_type: Optional[str] = None,
+    account: AccountState = Depends(current_account),
+):
+    """Stream logs with start <= timestamp <= end, oldest first, as csv, ndjson or parquet"""
+    # Include entries still queued for the background writer
+    await log_sink.flush()
+    filters = {"type": log_type} if log_type else {}
+    return await export_response("logs", account, fmt, start, end, filters)
 
-@api_router.post("/logs", response_model=LogEntry)
-async def create_log(log_create: LogEntryCreate):
+@account_router.post("/logs", response_model=LogEntry)
+async def create_log(log_create: LogEntryCreate, account: AccountState = Depends(current_account)):
     log_entry = LogEntry(**log_create.model_dump())
-    await db.logs.insert_one(log_entry.model_dump())
+    await record_log(account, log_entry)
     return log_entry
 
-@api_router.delete("/logs")
-async def clear_logs():
-    result = await db.logs.delete_many({})
-    return {"message": f"Deleted {result.deleted_count} log entries"}
+@account_router.delete("/logs")
+async def clear_logs(before: Optional[str] = None, log_type: Optional[str] = None, account: AccountState = Depends(current_account)):
+    """Clear logs, optionally only those older than `before` and/or of one type"""
+    # Write out queued entries first so none land after the delete
+    await log_sink.flush()
+    before_dt = None
+    if before:
+        try:
+            before_dt = as_utc(datetime.fromisoformat(before))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid before timestamp: {before}")
+    try:
+        deleted = await store.clear_logs(account.id, before_dt, log_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    broadcaster.publish(account.id, "logs_cleared", {"before": before, "log_type": log_type} if before or log_type else {})
+    return {"message": f"Deleted {deleted} log entries"}
 
 # Trades Endpoints
-@api_router.get("/trades", response_model=List[Trade])
-async def get_trades(limit: int = 100):
-    trades = await db.trades.find({}, {"_id": 0}).sort("timestamp", -1).limit(limit).to_list(limit)
-    return [Trade(**trade) for trade in trades]
+@account_router.get("/trades", response_model=List[Trade])
+async def get_trades(
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    account: AccountState = Depends(current_account),
+):
+    """Newest-first trades; `before`/`since` take `timestamp,id` cursors from X-Next-Cursor/X-Latest-Cursor"""
+    trades = await fetch_page("trades", account.id, limit, before, since, response)
+    # Trades only change when a replay backfills realised_pnl
+    unchanged = not_modified(request, response, weak_etag([
+        (trade["timestamp"], trade.get("id"), trade.get("realised_pnl")) for trade in trades
+    ]))
+    if unchanged:
+        return unchanged
+    return json_response(TRADE_LIST.dump_json(TRADE_LIST.validate_python(trades)), response)
 
-@api_router.post("/trades", response_model=Trade)
-async def create_trade(trade_create: TradeCreate):
+@account_router.get("/trades/export")
+async def export_trades(
+    fmt: str = Query("csv", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    account: AccountState = Depends(current_account),
+):
+    """Stream trades with start <= timestamp <= end, oldest first, as csv, ndjson or parquet"""
+    return await export_response("trades", account, fmt, start, end, {})
+
+async def count_fill(account: AccountState, realised: float):
+    """Advance trades_today and the loss streak for one executed fill.
+
+    A losing close extends consecutive_losses and starts a cooldown of
+    cooldown_after_loss minutes; a winning close ends the streak; an opening
+    fill leaves both alone.
+    """
+    today = trading_day(utc_now())
+    await roll_daily_counters(account, today)
+    increments = {"trades_today": 1}
+    changes: Dict[str, Any] = {"trading_day": today}
+    if realised < 0:
+        increments["consecutive_losses"] = 1
+        cooldown = (await load_risk_config(account)).get("cooldown_after_loss", 0)
+        if cooldown > 0:
+            changes["cooldown_until"] = utc_now() + timedelta(minutes=cooldown)
+    elif realised > 0:
+        changes["consecutive_losses"] = 0
+    defaults = RiskStatus(id="current_status").model_dump(exclude={"id", *increments, *changes})
+    update: Dict[str, Any] = {"$inc": increments, "$setOnInsert": defaults}
+    if changes:
+        update["$set"] = changes
+    status = await account.status_cache.update(update)
+    broadcaster.publish(account.id, "status", {
+        "trades_today": status["trades_today"], "consecutive_losses": status.get("consecutive_losses", 0), **changes,
+    })
+    await reevaluate_status(account)
+
+@account_router.post("/trades", response_model=Trade)
+async def create_trade(trade_create: TradeCreate, account: AccountState = Depends(current_account)):
     trade_entry = Trade(**trade_create.model_dump())
-    await db.trades.insert_one(trade_entry.model_dump())
+    trade_doc = trade_entry.model_dump()
+    trade_doc["account"] = account.id
+    book = account.position_book
+    executed = trade_entry.status == "executed"
+    preview = book.preview(trade_doc) if executed else None
+    if preview is not None:
+        # Stored with its P&L; the replay below corrects it if the book was stale
+        trade_doc["realised_pnl"] = preview[2]
+    # Store first: a rejected trade (e.g. a repeated order_id) must not reach the book
+    failures = await store.insert_trades([trade_doc])
+    if failures:
+        _, duplicate, message = failures[0]
+        if duplicate:
+            raise HTTPException(status_code=409, detail=f"Trade with order_id {trade_entry.order_id} already exists")
+        raise HTTPException(status_code=500, detail=message)
+    if executed:
+        version = await book.touch()
+        if preview is not None and book.commit(preview[0], version):
+            fill = preview[1:]
+            await record_trade_rollup(account, trade_doc, *fill)
+        else:
+            # Another worker stored fills since the book was built, or this
+            # one is back-dated: realised P&L comes from replaying the store
+            fill = (0, 0.0)
+            stale = []
+
+            async def on_fill(trade, closed, realised):
+                nonlocal fill
+                if trade.get("id") == trade_entry.id:
+                    fill = (closed, realised)
+                if trade.get("realised_pnl") != realised:
+                    stale.append((trade, realised))
+
+            await book.rebuild(on_fill)
+            if stale:
+                await store.set_realised_pnl(stale)
+            if any(trade.get("id") != trade_entry.id for trade, _ in stale):
+                # A back-dated fill changed later fills' P&L; rebuild their rollups too
+                await replay_trades(account, {trade_entry.id})
+            else:
+                await record_trade_rollup(account, trade_doc, *fill)
+    broadcaster.publish(account.id, "trade", trade_entry.model_dump())
+    if executed:
+        await count_fill(account, fill[1])
     return trade_entry
 
-@api_router.delete("/trades")
-async def clear_trades():
-    result = await db.trades.delete_many({})
-    return {"message": f"Deleted {result.deleted_count} trade entries"}
+@account_router.post("/trades/bulk")
+async def create_trades_bulk(request: Request, account: AccountState = Depends(current_account)):
+    """Ingest trades from an NDJSON (application/x-ndjson) or JSON array body.
+
+    Rows are validated and written in unordered batches; rows whose order_id
+    is already stored are reported as duplicates, so replays are idempotent.
+    """
+    result = {"received": 0, "inserted": 0, "duplicates": [], "errors": []}
+    inserted_today = 0
+    inserted_ids: Set[str] = set()
+    today = trading_day(utc_now())
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    
+    async def flush():
+        nonlocal inserted_today
+        inserted = await insert_trade_batch(account, batch, result)
+        inserted_ids.update(doc["id"] for doc in inserted)
+        inserted_today += sum(
+            1 for doc in inserted
+            if doc["status"] == "executed" and rollup_key(doc)[0] == today
+        )
+        batch.clear()
+    
+    try:
+        async for row, value in iter_json_rows(request):
+            result["received"] += 1
+            if isinstance(value, Exception):
+                result["errors"].append({"row": row, "error": f"Invalid JSON: {value}"})
+                continue
+            try:
+                if not isinstance(value, dict):
+                    raise ValueError("row must be an object")
+                batch.append((row, Trade(**value).model_dump()))
+            except (ValidationError, ValueError, TypeError) as e:
+                result["errors"].append({"row": row, "error": str(e)})
+                continue
+            if len(batch) >= BULK_TRADE_BATCH_SIZE:
+                await flush()
+    except ValueError as e:
+        # Rows before the malformed input are still stored; report them too
+        if batch:
+            await flush()
+        raise HTTPException(status_code=400, detail={"error": str(e), **result})
+    if batch:
+        await flush()
+    
+    if result["inserted"]:
+        await account.position_book.touch()
+        await replay_trades(account, inserted_ids)
+        if inserted_today:
+            await roll_daily_counters(account, today)
+            defaults = RiskStatus(id="current_status").model_dump(exclude={"id", "trades_today", "trading_day"})
+            status = await account.status_cache.update({
+                "$inc": {"trades_today": inserted_today}, "$set": {"trading_day": today}, "$setOnInsert": defaults,
+            })
+            broadcaster.publish(account.id, "status", {"trades_today": status["trades_today"]})
+            await reevaluate_status(account)
+        broadcaster.publish(account.id, "trades_bulk", {"inserted": result["inserted"]})
+    return result
+
+@account_router.delete("/trades")
+async def clear_trades(account: AccountState = Depends(current_account)):
+    deleted = await store.delete_trades(account.id)
+    await account.position_book.touch()
+    account.position_book.clear()
+    await store.replace_rollups(account.id, [], await store.last_session_day(account.id))
+    broadcaster.publish(account.id, "trades_cleared", {})
+    return {"message": f"Deleted {deleted} trade entries"}
+
+# Pre-trade Check Endpoint
+@account_router.post("/pre-trade-check")
+async def pre_trade_check(order: PreTradeCheck, account: AccountState = Depends(current_account)):
+    """Allow/deny a prospective order against the current rules and status"""
+    rules = await current_rules(account)
+    status = await load_risk_status(account)
+    allowed, reason = rules.check_order(
+        status,
+        account.risk_engine.cooldown_until_ts(status),
+        time.time(),
+        order.side,
+        order.quantity,
+        order.price,
+    )
+    return {"allowed": allowed, "reason": reason}
+
+# Position Endpoints
+@account_router.get("/positions")
+async def get_positions(include_flat: bool = False, account: AccountState = Depends(current_account)):
+    # Other workers may have stored fills since this book last saw them
+    await account.position_book.sync()
+    return [
+        position.to_dict() for position in account.position_book.positions.values()
+        if include_flat or position.quantity != 0
+    ]
+
+@account_router.get("/pnl/by-instrument")
+async def get_pnl_by_instrument(account: AccountState = Depends(current_account)):
+    await account.position_book.sync()
+    instruments = {
+        instrument: position.realised_pnl
+        for instrument, position in account.position_book.positions.items()
+    }
+    return {"realised_total": sum(instruments.values()), "instruments": instruments}
+
+# Analytics Endpoints
+@account_router.get("/analytics")
+async def get_analytics(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    instrument: Optional[str] = None,
+    account: AccountState = Depends(current_account),
+):
+    """Trade statistics over trading days `start`..`end` (YYYY-MM-DD, default today)"""
+    today = utc_now().astimezone(TRADING_TIMEZONE).date().isoformat()
+    end = end or today
+    start = start or end
+    facets = await store.analytics_facets(account.id, start, end, instrument)
+    
+    def summarise(row: Dict[str, Any]) -> Dict[str, Any]:
+        decided = row["wins"] + row["losses"]
+        return {
+            "fills": row["fills"],
+            "quantity": row["quantity"],
+            "notional": row["notional"],
+            "closed_trades": row["closes"],
+            "wins": row["wins"],
+            "losses": row["losses"],
+            "win_rate": row["wins"] / decided if decided else None,
+            "avg_win": row["gross_win"] / row["wins"] if row["wins"] else None,
+            "avg_loss": row["gross_loss"] / row["losses"] if row["losses"] else None,
+            "realised": row["realised"],
+        }
+    
+    totals = {key: sum(row[key] for row in facets["by_instrument"]) for key in ROLLUP_COUNTERS}
+    return {
+        "start": start,
+        "end": end,
+        **summarise(totals),
+        # Drawdown is tracked across all instruments only
+        "max_drawdown": None if instrument else combine_drawdown(facets["days"]),
+        "fills_by_hour": {row["_id"]: row["fills"] for row in facets["by_hour"]},
+        "by_instrument": [{"instrument": row["_id"], **summarise(row)} for row in facets["by_instrument"]],
+        "realised_by_day": {row["day"]: row["realised"] for row in facets["days"]},
+    }
+
+# Account Overview Endpoint
+@api_router.get("/accounts/overview")
+async def get_accounts_overview():
+    """Status of every account plus cross-account totals, in one aggregation"""
+    return await store.accounts_overview()
+
+# Diagnostics Endpoints
+@api_router.get("/diagnostics/query-plans")
+async def get_query_plans():
+    """explain() the API's queries so collection scans and in-memory sorts show up"""
+    if not isinstance(store, MongoStore):
+        raise HTTPException(status_code=501, detail=f"Query plans are only available with the mongo backend, not {store.name}")
+    plans = {}
+    for name, cursor in api_query_cursors(DEFAULT_ACCOUNT).items():
+        explain = await cursor.explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        # Newer servers nest the classic plan under queryPlan (SBE engine)
+        stages = plan_stages(winning.get("queryPlan", winning))
+        stats = explain.get("executionStats", {})
+        plans[name] = {
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+            "indexes": plan_indexes(winning.get("queryPlan", winning)),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+            "execution_ms": stats.get("executionTimeMillis"),
+        }
+    return plans
+
+# Dashboard Stream Endpoint
+@account_router.get("/stream")
+async def stream_dashboard(request: Request, logs_limit: int = 50, trades_limit: int = 100, account: AccountState = Depends(current_account)):
+    """Server-sent events: one combined snapshot, then deltas as state changes"""
+    # Subscribe before reading the snapshot so no change in between is lost
+    queue = broadcaster.subscribe(account.id)
+    try:
+        config = await load_risk_config(account)
+        status = await load_risk_status(account)
+        logs = await fetch_page("logs", account.id, logs_limit, None, None, Response())
+        trades = await fetch_page("trades", account.id, trades_limit, None, None, Response())
+    except Exception:
+        broadcaster.unsubscribe(account.id, queue)
+        raise
+    snapshot = {
+        "config": RiskConfig.model_validate(config).model_dump(),
+        "status": RiskStatus.model_validate(status).model_dump(),
+        "logs": LOG_LIST.dump_python(LOG_LIST.validate_python(logs)),
+        "trades": TRADE_LIST.dump_python(TRADE_LIST.validate_python(trades)),
+    }
+
+    async def event_source():
+        try:
+            yield format_sse("snapshot", snapshot)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            broadcaster.unsubscribe(account.id, queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Metrics Endpoint
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    LOG_SINK_PENDING.set(log_sink.queue.qsize() if log_sink.queue is not None else 0)
+    LOG_SINK_DROPPED.set(log_sink.dropped)
+    STREAM_SUBSCRIBERS.set(sum(len(queues) for queues in broadcaster.subscribers.values()))
+    DEADLINES_PENDING.set(len(deadlines.timers))
+    lines = [line for metric in METRICS for line in metric.render()]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+# Account-scoped routes answer for the default account under /api and for
+# any account under /api/accounts/{account_id}
+api_router.include_router(account_router)
+api_router.include_router(account_router, prefix="/accounts/{account_id}")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -385,7 +2000,10 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Latest-Cursor", "X-Has-More", "ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -394,6 +2012,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def connect_db():
+    await store.connect()
+
+@app.on_event("startup")
+async def ensure_collections():
+    await store.setup()
+    # Setup may have migrated singletons behind the caches
+    for account in accounts.values():
+        account.config_cache.invalidate()
+        account.status_cache.invalidate()
+
+@app.on_event("startup")
+async def load_positions():
+    for account_id in await store.trade_accounts():
+        await replay_trades(account_state(account_id))
+
+@app.on_event("startup")
+async def start_log_sink():
+    log_sink.start()
+
+@app.on_event("startup")
+async def arm_deadlines():
+    # Cooldowns stored before a restart still need their expiry timers
+    for row in (await store.accounts_overview())["accounts"]:
+        if row.get("in_cooldown") and ACCOUNT_ID_PATTERN.match(row.get("account") or ""):
+            await reevaluate_status(account_state(row["account"]))
+    # Counters left from a day the server was down for start over now
+    await start_trading_day()
+    arm_daily_reset()
+    arm_session_rollover()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await deadlines.close()
+    await log_sink.close()
+    await store.close()
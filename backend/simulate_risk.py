@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""What-if replay of risk configs over an account's stored fills.
+
+Uses the same storage settings as the server (backend/.env and the
+environment) and the same engine as POST /api/risk-config/simulate. Each
+--grid option lists values for one config field; every combination is
+simulated on top of the current config.
+
+    python simulate_risk.py --grid daily_max_loss=2000,3000,5000 --grid consecutive_loss_limit=2,3,4
+    python simulate_risk.py --configs candidates.json --start 2025-01-01 --end 2025-03-31 --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server
+
+
+def parse_grid(options):
+    grid = {}
+    for option in options:
+        field, _, raw_values = option.partition("=")
+        if not raw_values:
+            sys.exit(f"--grid expects field=value[,value...], got {option!r}")
+        grid[field] = [parse_value(value) for value in raw_values.split(",")]
+    return grid
+
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+async def run(args):
+    configs = []
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    await server.connect_db()
+    try:
+        return await server.simulate_account(
+            server.account_state(args.account), configs, parse_grid(args.grid), args.start, args.end,
+            include_trips=args.json,
+        )
+    finally:
+        await server.shutdown_db_client()
+
+
+def print_report(report, top):
+    print(f"{report['fills']} fills over {len(report['days'])} trading days, "
+          f"actual realised {report['actual_realised']:.2f}, simulated in {report['elapsed_ms']:.0f} ms")
+    results = sorted(report["results"], key=lambda result: result["realised"], reverse=True)[:top]
+    print(f"{'realised':>12}{'drawdown':>12}{'taken':>8}{'blocked':>9}{'tripped':>9}  overrides")
+    for result in results:
+        print(
+            f"{result['realised']:>12.2f}{result['max_drawdown']:>12.2f}{result['fills_taken']:>8}"
+            f"{result['fills_blocked']:>9}{result['days_tripped']:>9}  {json.dumps(result['overrides'])}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--account", default=server.DEFAULT_ACCOUNT, help="account whose fills to replay")
+    parser.add_argument("--grid", action="append", default=[], metavar="FIELD=V1,V2",
+                        help="values to sweep for one config field; repeat for more fields")
+    parser.add_argument("--configs", help="JSON file with a list of override objects")
+    parser.add_argument("--start", help="first trading day, YYYY-MM-DD")
+    parser.add_argument("--end", help="last trading day, YYYY-MM-DD")
+    parser.add_argument("--top", type=int, default=20, help="rows to print, best realised P&L first")
+    parser.add_argument("--json", action="store_true", help="print every result, with trips, as JSON")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args))
+    except ValueError as e:
+        sys.exit(str(e))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+import os
+import itertools
+from pathlib import Path
+from typing import List, Dict, Any
+from datetime import datetime, timezone
+from models import TRADING_TIMEZONE, RiskConfig, RiskConfigUpdate
+from rules import (
+    TRIP_DAILY_MAX_LOSS, TRIP_TRAILING_FLOOR, TRIP_DAILY_MAX_PROFIT, TRIP_CONSECUTIVE_LOSSES,
+    TRIP_MAX_TRADES, TRIP_COOLDOWN, DENY_SIDE_LOCK, DENY_POSITION_SIZE,
+)
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# What-if simulation: replay an account's executed fills under candidate
+# configs. Fills are laid out as a (trading day, fill) grid and every
+# (config, day) pair is advanced in lockstep, one fill column at a time, so a
+# sweep costs one pass over the busiest day's fills whatever the number of
+# configs or days. Each fill keeps its recorded realised_pnl; a fill the rules
+# would have refused contributes neither its P&L nor its count. A losing fill
+# starts a cooldown of cooldown_after_loss minutes.
+SIMULATION_MAX_CONFIGS = int(os.environ.get('SIMULATION_MAX_CONFIGS', '5000'))
+SIMULATION_OVERRIDABLE = set(RiskConfigUpdate.model_fields)
+# Order of the reason codes; the first five halt orders for the rest of the day
+SIMULATION_REASONS = (
+    TRIP_DAILY_MAX_LOSS, TRIP_TRAILING_FLOOR, TRIP_DAILY_MAX_PROFIT, TRIP_CONSECUTIVE_LOSSES,
+    TRIP_MAX_TRADES, TRIP_COOLDOWN, DENY_SIDE_LOCK, DENY_POSITION_SIZE,
+)
+LATCHED_REASONS = 5
+(REASON_LOSS, REASON_TRAIL, REASON_PROFIT, REASON_CONSECUTIVE,
+ REASON_TRADES, REASON_COOLDOWN, REASON_SIDE, REASON_SIZE) = range(len(SIMULATION_REASONS))
+
+class SimulationFills:
+    """Executed fills as (day, fill) arrays padded to the busiest day"""
+
+    def __init__(self, trades: List[Dict[str, Any]]):
+        frame = pd.DataFrame(trades, columns=["timestamp", "side", "quantity", "price", "realised_pnl"])
+        timestamps = pd.to_datetime(frame["timestamp"], utc=True)
+        frame["day"] = timestamps.dt.tz_convert(TRADING_TIMEZONE).dt.strftime("%Y-%m-%d")
+        day_codes, days = pd.factorize(frame["day"], sort=True)
+        position = frame.groupby("day", sort=False).cumcount().to_numpy()
+        shape = (len(days), int(position.max()) + 1 if len(frame) else 0)
+        self.days: List[str] = list(days)
+        self.valid = np.zeros(shape, dtype=bool)
+        self.ts = np.zeros(shape)
+        self.pnl = np.zeros(shape)
+        self.notional = np.zeros(shape)
+        self.buy = np.zeros(shape, dtype=bool)
+        self.valid[day_codes, position] = True
+        self.ts[day_codes, position] = (timestamps - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+        self.pnl[day_codes, position] = frame["realised_pnl"].fillna(0.0).to_numpy(dtype=float)
+        self.notional[day_codes, position] = (frame["quantity"] * frame["price"]).to_numpy(dtype=float)
+        self.buy[day_codes, position] = (frame["side"].str.upper() == "BUY").to_numpy()
+
+def config_columns(configs: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Each rule parameter as a (configs, 1) column, mirroring CompiledRules"""
+    def column(values, dtype=float):
+        return np.array(values, dtype=dtype).reshape(-1, 1)
+    return {
+        # No loss floor for a daily_max_loss of 0 or less
+        "loss_floor": column([
+            -float(config["daily_max_loss"]) if float(config["daily_max_loss"]) > 0 else -np.inf for config in configs
+        ]),
+        "max_profit": column([float(config["daily_max_profit"]) for config in configs]),
+        "max_trades": column([int(config["max_trades_per_day"]) for config in configs]),
+        "consecutive_limit": column([int(config["consecutive_loss_limit"]) for config in configs]),
+        "cooldown": column([max(int(config["cooldown_after_loss"]), 0) * 60 for config in configs]),
+        "trail_step": column([
+            float(config["trailing_profit_step"]) if config.get("trailing_profit_enabled") and config["trailing_profit_step"] > 0 else 0.0
+            for config in configs
+        ]),
+        "side_lock": column([
+            {"BUY": 1, "SELL": -1}.get((config.get("side_lock") or "").upper(), 0) for config in configs
+        ], dtype=np.int8),
+        "max_position_size": column([float(config["max_position_size"]) for config in configs]),
+    }
+
+def simulate_rules(fills: SimulationFills, configs: List[Dict[str, Any]], include_trips: bool = True) -> List[Dict[str, Any]]:
+    """Outcome of each config over the fills: P&L, drawdown, blocked fills and trips"""
+    rules = config_columns(configs)
+    shape = (len(configs), len(fills.days))
+    total = np.zeros(shape)
+    peak = np.zeros(shape)
+    trough = np.zeros(shape)
+    drawdown = np.zeros(shape)
+    trades = np.zeros(shape, dtype=np.int64)
+    consecutive = np.zeros(shape, dtype=np.int64)
+    cooldown_until = np.zeros(shape)
+    loss_reason = np.full(shape, -1, dtype=np.int8)
+    profit_hit = np.zeros(shape, dtype=bool)
+    trip_reason = np.full(shape, -1, dtype=np.int8)
+    trip_at = np.zeros(shape)
+    blocked_by = np.zeros((len(configs), len(SIMULATION_REASONS)), dtype=np.int64)
+    trailing = rules["trail_step"] > 0
+    step = np.where(trailing, rules["trail_step"], 1.0)
+
+    def loss_floor():
+        trail_floor = (np.floor(peak / step) - 1) * step
+        use_trail = trailing & (peak >= step) & (trail_floor > rules["loss_floor"])
+        return np.where(use_trail, trail_floor, rules["loss_floor"]), np.where(use_trail, REASON_TRAIL, REASON_LOSS)
+
+    def halted():
+        return np.select(
+            [loss_reason >= 0, profit_hit,
+             (rules["consecutive_limit"] > 0) & (consecutive >= rules["consecutive_limit"]),
+             (rules["max_trades"] > 0) & (trades >= rules["max_trades"])],
+            [loss_reason, REASON_PROFIT, REASON_CONSECUTIVE, REASON_TRADES],
+            -1,
+        )
+
+    def record_trips(reason, at):
+        new = (trip_reason < 0) & (reason >= 0) & (reason < LATCHED_REASONS)
+        trip_reason[new] = reason[new]
+        np.copyto(trip_at, np.broadcast_to(at, shape), where=new)
+
+    for column in range(fills.valid.shape[1]):
+        valid = fills.valid[:, column]
+        at = fills.ts[:, column]
+        pnl = fills.pnl[:, column]
+        # Refusal checks in CompiledRules.check_order's priority order
+        floor, floor_reason = loss_floor()
+        reason = halted()
+        reason = np.where((reason < 0) & (total <= floor), floor_reason, reason)
+        reason = np.where((reason < 0) & (rules["max_profit"] > 0) & (total >= rules["max_profit"]), REASON_PROFIT, reason)
+        reason = np.where((reason < 0) & (at < cooldown_until), REASON_COOLDOWN, reason)
+        side = np.where(fills.buy[:, column], 1, -1)
+        reason = np.where((reason < 0) & (rules["side_lock"] != 0) & (rules["side_lock"] != side), REASON_SIDE, reason)
+        oversized = (rules["max_position_size"] > 0) & (fills.notional[:, column] > rules["max_position_size"])
+        reason = np.where((reason < 0) & oversized, REASON_SIZE, reason)
+        blocked = valid & (reason >= 0)
+        for code in range(len(SIMULATION_REASONS)):
+            blocked_by[:, code] += (blocked & (reason == code)).sum(axis=1)
+        record_trips(np.where(blocked, reason, -1), at)
+
+        taken = valid & (reason < 0)
+        total += np.where(taken, pnl, 0.0)
+        trades += taken
+        lost = taken & (pnl < 0)
+        consecutive = np.where(lost, consecutive + 1, np.where(taken & (pnl > 0), 0, consecutive))
+        cooldown_until = np.where(lost & (rules["cooldown"] > 0), at + rules["cooldown"], cooldown_until)
+        np.maximum(peak, total, out=peak)
+        np.minimum(trough, total, out=trough)
+        np.maximum(drawdown, peak - total, out=drawdown)
+        # Trips evaluated after the fill, as RiskEngine does on a status update
+        floor, floor_reason = loss_floor()
+        loss_reason = np.where((loss_reason < 0) & taken & (total <= floor), floor_reason, loss_reason).astype(np.int8)
+        profit_hit |= taken & (rules["max_profit"] > 0) & (total >= rules["max_profit"])
+        record_trips(np.where(taken, halted(), -1), at)
+
+    # Drawdown across days, as combine_drawdown does for the analytics rollups
+    level = np.zeros(len(configs))
+    running_peak = np.zeros(len(configs))
+    max_drawdown = np.zeros(len(configs))
+    for day in range(len(fills.days)):
+        max_drawdown = np.maximum.reduce([max_drawdown, drawdown[:, day], running_peak - (level + trough[:, day])])
+        running_peak = np.maximum(running_peak, level + peak[:, day])
+        level += total[:, day]
+
+    results = []
+    for index in range(len(configs)):
+        tripped = np.flatnonzero(trip_reason[index] >= 0)
+        result = {
+            "realised": float(total[index].sum()),
+            "max_drawdown": float(max_drawdown[index]),
+            "fills_taken": int(trades[index].sum()),
+            "fills_blocked": int(blocked_by[index].sum()),
+            "blocked_by": {name: int(count) for name, count in zip(SIMULATION_REASONS, blocked_by[index]) if count},
+            "days_tripped": int(tripped.size),
+            "trips_by_reason": {
+                SIMULATION_REASONS[code]: int(count)
+                for code, count in enumerate(np.bincount(trip_reason[index][tripped], minlength=LATCHED_REASONS)) if count
+            },
+        }
+        if include_trips:
+            result["trips"] = [{
+                "day": fills.days[day],
+                "at": datetime.fromtimestamp(trip_at[index, day], timezone.utc).isoformat(),
+                "reason": SIMULATION_REASONS[trip_reason[index, day]],
+            } for day in tripped]
+        results.append(result)
+    return results
+
+def simulation_candidates(base: Dict[str, Any], configs: List[Dict[str, Any]], grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Override sets: each of `configs` (or the base alone) crossed with the grid"""
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    overrides = [{**config, **combo} for config in (configs or [{}]) for combo in combos]
+    if len(overrides) > SIMULATION_MAX_CONFIGS:
+        raise ValueError(f"{len(overrides)} candidate configs; at most {SIMULATION_MAX_CONFIGS} per run")
+    for override in overrides:
+        unknown = set(override) - SIMULATION_OVERRIDABLE
+        if unknown:
+            raise ValueError(f"Cannot override {sorted(unknown)}")
+    # Validate every candidate as a full config so bad values fail up front
+    return [
+        {"overrides": override, "config": RiskConfig.model_validate({**base, **override}).model_dump()}
+        for override in overrides
+    ]
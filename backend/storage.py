@@ -0,0 +1,1535 @@
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, IndexModel, UpdateOne, ASCENDING, DESCENDING, ReadPreference, WriteConcern
+from pymongo.errors import CollectionInvalid, OperationFailure, BulkWriteError
+import os
+import re
+import gzip
+import json
+import functools
+import time
+import asyncio
+import bisect
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Set, AsyncIterator, Tuple, Callable
+from datetime import datetime, timezone, timedelta
+from metrics import MongoCommandTimer
+from models import TRADING_TIMEZONE, LogType, utc_now, as_utc
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Rows stored before accounts existed belong to the default account
+DEFAULT_ACCOUNT = os.environ.get('DEFAULT_ACCOUNT', 'default')
+
+# MongoDB connection, created on startup by MongoStore.connect
+MONGO_CLIENT_OPTIONS = {
+    # option name: environment variable
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    "maxConnecting": "MONGO_MAX_CONNECTING",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+}
+# Fail fast instead of pymongo's 30s when no server is reachable
+MONGO_CLIENT_DEFAULTS = {"serverSelectionTimeoutMS": 5000}
+# Logs and history points are cheap to lose in a crash and written often;
+# config changes are rare and must survive a failover. Override per
+# collection with MONGO_WRITE_CONCERN_<COLLECTION>, e.g. "w=1,j=false".
+DEFAULT_WRITE_CONCERNS = {
+    "logs": "w=1,j=false",
+    "risk_status_history": "w=1,j=false",
+    "risk_config": "majority",
+}
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+def mongo_client_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = dict(MONGO_CLIENT_DEFAULTS)
+    for option, env_name in MONGO_CLIENT_OPTIONS.items():
+        if os.environ.get(env_name):
+            options[option] = int(os.environ[env_name])
+    if os.environ.get('MONGO_COMPRESSORS'):
+        # e.g. "zstd,snappy,zlib"; zstd and snappy need the zstandard /
+        # python-snappy packages, pymongo skips those that are missing
+        options["compressors"] = os.environ['MONGO_COMPRESSORS']
+    return options
+
+def parse_write_concern(value: str) -> WriteConcern:
+    """'majority', '1' or 'w=1,j=false,wtimeout=2000' -> WriteConcern"""
+    if "=" not in value:
+        return WriteConcern(w=int(value) if value.isdigit() else value)
+    options: Dict[str, Any] = {}
+    for item in value.split(","):
+        key, _, raw = item.strip().partition("=")
+        if key == "w":
+            options["w"] = int(raw) if raw.isdigit() else raw
+        elif key in ("j", "fsync"):
+            options[key] = raw.lower() in ("1", "true", "yes")
+        elif key == "wtimeout":
+            options["wtimeout"] = int(raw)
+        else:
+            raise ValueError(f"Unknown write concern option: {key}")
+    return WriteConcern(**options)
+
+def collection_env(prefix: str, name: str) -> Optional[str]:
+    return os.environ.get(f"{prefix}_{name.upper()}") or os.environ.get(prefix)
+
+class ConfiguredDatabase:
+    """A Motor database whose collections carry the configured write concern
+    and read preference. Collection handles are built once and reused."""
+
+    def __init__(self, database):
+        self.database = database
+        self.collections: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str):
+        collection = self.collections.get(name)
+        if collection is None:
+            options: Dict[str, Any] = {}
+            write_concern = collection_env("MONGO_WRITE_CONCERN", name) or DEFAULT_WRITE_CONCERNS.get(name)
+            if write_concern:
+                options["write_concern"] = parse_write_concern(write_concern)
+            read_preference = collection_env("MONGO_READ_PREFERENCE", name)
+            if read_preference:
+                options["read_preference"] = READ_PREFERENCES[read_preference]
+            collection = self.collections[name] = self.database.get_collection(name, **options)
+        return collection
+
+    def __getattr__(self, name: str):
+        # db.logs and friends are collections; database methods pass through
+        if name.startswith("_") or hasattr(type(self.database), name):
+            return getattr(self.database, name)
+        return self[name]
+
+client: Optional[AsyncIOMotorClient] = None
+db: Any = None
+
+# Log retention: each entry stores a BSON `expire_at` derived from its type's
+# retention and a TTL index removes it once that passes. 0 days keeps forever,
+# the default, so upgrading never deletes history nobody asked to expire.
+# LOG_CAPPED_MB > 0 creates logs as a capped collection instead (no TTL).
+LOG_RETENTION_DAYS = float(os.environ.get('LOG_RETENTION_DAYS', '0'))
+LOG_RETENTION_DAYS_BY_TYPE = {
+    log_type: float(os.environ.get(f'LOG_RETENTION_DAYS_{log_type.name}', LOG_RETENTION_DAYS))
+    for log_type in LogType
+}
+LOG_CAPPED_MB = int(os.environ.get('LOG_CAPPED_MB', '0'))
+LOG_DELETE_BATCH_SIZE = 1000
+
+def log_expiry(log_type: str, now: datetime) -> Optional[datetime]:
+    days = LOG_RETENTION_DAYS_BY_TYPE.get(LogType(log_type), LOG_RETENTION_DAYS)
+    return now + timedelta(days=days) if days > 0 else None
+
+async def ensure_logs_collection():
+    """Create logs (capped when configured) with its query and TTL indexes"""
+    existing = await db.list_collection_names()
+    if LOG_CAPPED_MB:
+        if "logs" not in existing:
+            await db.create_collection("logs", capped=True, size=LOG_CAPPED_MB * 1024 * 1024)
+        elif not (await db.logs.options()).get("capped"):
+            logger.warning("LOG_CAPPED_MB is set but logs is not capped; convert it with convertToCapped during a maintenance window")
+    await db.logs.create_indexes(COLLECTION_INDEXES["logs"])
+    if LOG_CAPPED_MB:
+        return
+    await db.logs.create_index("expire_at", name="expire_at_ttl", expireAfterSeconds=0)
+    # Backfill expiry for entries written before retention existed
+    for log_type, days in LOG_RETENTION_DAYS_BY_TYPE.items():
+        if days <= 0:
+            continue
+        await db.logs.update_many(
+            {"type": log_type.value, "expire_at": {"$exists": False}},
+            [{"$set": {"expire_at": {"$add": [{"$toDate": "$timestamp"}, int(days * 86400 * 1000)]}}}],
+        )
+
+# Status history
+STATUS_HISTORY_RETENTION_DAYS = int(os.environ.get('STATUS_HISTORY_RETENTION_DAYS', '30'))
+
+def history_scope(account_id: str) -> Dict[str, Any]:
+    """History filter for one account; points written before accounts existed
+    belong to the default account (time-series points can't be backfilled)"""
+    if account_id == DEFAULT_ACCOUNT:
+        return {"account": {"$in": [account_id, None]}}
+    return {"account": account_id}
+
+# Keyset pagination over (timestamp, id), newest first
+PAGE_SORT = [("timestamp", DESCENDING), ("id", DESCENDING)]
+EXPORT_SORT = [("timestamp", ASCENDING), ("id", ASCENDING)]
+
+Cursor = Tuple[datetime, Optional[str]]
+
+def keyset_query(query: Dict[str, Any], before: Optional[Cursor] = None, since: Optional[Cursor] = None) -> Dict[str, Any]:
+    """Restrict a query to rows strictly before and/or after parsed cursors"""
+    bounds = []
+    for cursor, op in ((before, "$lt"), (since, "$gt")):
+        if cursor is None:
+            continue
+        timestamp, row_id = cursor
+        if row_id:
+            bounds.append({"$or": [
+                {"timestamp": {op: timestamp}},
+                {"timestamp": timestamp, "id": {op: row_id}},
+            ]})
+        else:
+            bounds.append({"timestamp": {op: timestamp}})
+    if not bounds:
+        return query
+    return {"$and": [query, *bounds]} if query else (bounds[0] if len(bounds) == 1 else {"$and": bounds})
+
+# Indexes ensured at startup, per collection
+COLLECTION_INDEXES = {
+    "logs": [
+        IndexModel([("account", ASCENDING), ("type", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="account_type_timestamp_id"),
+        IndexModel([("account", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="account_timestamp_id"),
+    ],
+    "trades": [
+        IndexModel([("account", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="account_timestamp_id"),
+        IndexModel([("account", ASCENDING), ("instrument", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="account_instrument_timestamp_id"),
+        IndexModel(
+            [("account", ASCENDING), ("order_id", ASCENDING)],
+            name="account_order_id_unique",
+            unique=True,
+            partialFilterExpression={"order_id": {"$type": "string"}},
+        ),
+    ],
+    "risk_config": [
+        IndexModel([("account", ASCENDING), ("id", ASCENDING)], name="account_id_unique", unique=True),
+    ],
+    "risk_status": [
+        IndexModel([("account", ASCENDING), ("id", ASCENDING)], name="account_id_unique", unique=True),
+    ],
+    "trade_rollups": [
+        IndexModel([("account", ASCENDING), ("day", ASCENDING), ("instrument", ASCENDING)], name="account_day_instrument_unique", unique=True),
+    ],
+    "sessions": [
+        IndexModel([("account", ASCENDING), ("day", ASCENDING)], name="account_day_unique", unique=True),
+    ],
+    "session_rollovers": [
+        IndexModel([("account", ASCENDING), ("id", ASCENDING)], name="account_id_unique", unique=True),
+    ],
+    "positions": [
+        IndexModel([("account", ASCENDING), ("id", ASCENDING)], name="account_id_unique", unique=True),
+    ],
+}
+
+# Indexes from before accounts existed; the unique ones would now reject a
+# second account's singletons, and the rest only cost writes
+LEGACY_INDEXES = {
+    "logs": ["type_timestamp", "timestamp", "type_timestamp_id", "timestamp_id"],
+    "trades": ["timestamp", "instrument_timestamp", "timestamp_id", "instrument_timestamp_id", "order_id_unique"],
+    "risk_config": ["id_unique"],
+    "risk_status": ["id_unique"],
+    "trade_rollups": ["day_instrument_unique"],
+}
+
+# Fields that older versions stored as ISO strings
+TIMESTAMP_FIELDS = {
+    "logs": ["timestamp"],
+    "trades": ["timestamp"],
+    "risk_config": ["updated_at"],
+    "risk_status": ["updated_at", "cooldown_until", "last_trade_time"],
+}
+MIGRATION_BATCH_SIZE = 1000
+
+async def migrate_timestamps():
+    """Convert ISO string timestamps left by older versions to BSON dates"""
+    for collection_name, fields in TIMESTAMP_FIELDS.items():
+        collection = db[collection_name]
+        # Singletons are cached; bump their version so every worker reloads
+        update_extra = {"$inc": {"version": 1}} if collection_name in ("risk_config", "risk_status") else {}
+        for field in fields:
+            ops = []
+            migrated = 0
+            async for doc in collection.find({field: {"$type": "string"}}, {field: 1}):
+                try:
+                    value = as_utc(datetime.fromisoformat(doc[field]))
+                except ValueError:
+                    logger.warning("Skipping unparseable %s.%s=%r", collection_name, field, doc[field])
+                    continue
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: value}, **update_extra}))
+                if len(ops) >= MIGRATION_BATCH_SIZE:
+                    await collection.bulk_write(ops, ordered=False)
+                    migrated += len(ops)
+                    ops = []
+            if ops:
+                await collection.bulk_write(ops, ordered=False)
+                migrated += len(ops)
+            if migrated:
+                logger.info("Migrated %d %s.%s values to dates", migrated, collection_name, field)
+
+async def migrate_accounts():
+    """Assign documents written before accounts existed to the default account"""
+    for collection_name in ("logs", "trades", "risk_config", "risk_status", "trade_rollups"):
+        collection = db[collection_name]
+        for index_name in LEGACY_INDEXES.get(collection_name, []):
+            try:
+                await collection.drop_index(index_name)
+            except OperationFailure:
+                pass
+        update: Dict[str, Any] = {"$set": {"account": DEFAULT_ACCOUNT}}
+        if collection_name in ("risk_config", "risk_status"):
+            update["$inc"] = {"version": 1}
+        result = await collection.update_many({"account": {"$exists": False}}, update)
+        if result.modified_count:
+            logger.info("Assigned %d %s documents to account %s", result.modified_count, collection_name, DEFAULT_ACCOUNT)
+
+async def migrate_ids():
+    """Give logs and trades stored without an `id` a stable one derived from
+    their _id, so pages and their keyset cursors agree across reads"""
+    for collection_name in ("logs", "trades"):
+        result = await db[collection_name].update_many(
+            {"id": None},
+            [{"$set": {"id": {"$toString": "$_id"}}}],
+        )
+        if result.modified_count:
+            logger.info("Assigned ids to %d %s documents", result.modified_count, collection_name)
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Flatten an explain() plan tree into its stage names, outermost first"""
+    stages = [plan.get("stage", "?")]
+    if "inputStage" in plan:
+        stages += plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+def plan_indexes(plan: Dict[str, Any]) -> List[str]:
+    """Index names used anywhere in an explain() plan tree"""
+    names = [plan["indexName"]] if "indexName" in plan else []
+    if "inputStage" in plan:
+        names += plan_indexes(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        names += plan_indexes(child)
+    return names
+
+def api_query_cursors(account_id: str) -> Dict[str, Any]:
+    """The cursors behind the read endpoints, for explain() diagnostics"""
+    now_cursor = (datetime.now(timezone.utc), None)
+    scope = {"account": account_id}
+    return {
+        "risk_config": db.risk_config.find({**scope, "id": "current_config"}, {"_id": 0}).limit(1),
+        "risk_status": db.risk_status.find({**scope, "id": "current_status"}, {"_id": 0}).limit(1),
+        "logs": db.logs.find(scope, {"_id": 0}).sort(PAGE_SORT).limit(100),
+        "logs_by_type": db.logs.find({**scope, "type": LogType.VIOLATION.value}, {"_id": 0}).sort(PAGE_SORT).limit(100),
+        "logs_since": db.logs.find(keyset_query(scope, since=now_cursor), {"_id": 0}).sort(PAGE_SORT).limit(100),
+        "trades": db.trades.find(scope, {"_id": 0}).sort(PAGE_SORT).limit(100),
+        "trades_before": db.trades.find(keyset_query(scope, before=now_cursor), {"_id": 0}).sort(PAGE_SORT).limit(100),
+        "overview": db.risk_status.find({"id": "current_status"}, {"_id": 0}),
+    }
+
+# MongoDB's error code for a unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+# Trade analytics rollups: one document per (trading day, instrument) with
+# fill/close/win/loss counters and fills per hour, plus one per day under
+# ROLLUP_ALL_INSTRUMENTS tracking the day's realised P&L path for drawdown
+ROLLUP_ALL_INSTRUMENTS = "*"
+ROLLUP_COUNTERS = ("fills", "quantity", "notional", "closes", "wins", "losses", "gross_win", "gross_loss", "realised")
+
+def rollup_key(trade: Dict[str, Any]) -> Tuple[str, str]:
+    """(trading day, hour) of a trade in TRADING_TIMEZONE"""
+    local = as_utc(trade["timestamp"]).astimezone(TRADING_TIMEZONE)
+    return local.date().isoformat(), f"{local.hour:02d}"
+
+def rollup_increments(trade: Dict[str, Any], closed: int, realised: float, hour: str) -> Dict[str, Any]:
+    return {
+        "fills": 1,
+        "quantity": trade["quantity"],
+        "notional": trade["quantity"] * trade["price"],
+        "closes": 1 if closed else 0,
+        "wins": 1 if realised > 0 else 0,
+        "losses": 1 if realised < 0 else 0,
+        "gross_win": realised if realised > 0 else 0.0,
+        "gross_loss": realised if realised < 0 else 0.0,
+        "realised": realised,
+        f"hours.{hour}": 1,
+    }
+
+def daily_path_update(realised: float) -> List[Dict[str, Any]]:
+    """Pipeline update advancing a day's realised level, peak, trough and drawdown"""
+    return [
+        {"$set": {"realised": {"$add": [{"$ifNull": ["$realised", 0.0]}, realised]}}},
+        {"$set": {
+            "peak_level": {"$max": [{"$ifNull": ["$peak_level", 0.0]}, "$realised"]},
+            "min_level": {"$min": [{"$ifNull": ["$min_level", 0.0]}, "$realised"]},
+        }},
+        {"$set": {"max_drawdown": {"$max": [
+            {"$ifNull": ["$max_drawdown", 0.0]},
+            {"$subtract": ["$peak_level", "$realised"]},
+        ]}}},
+    ]
+
+class RollupBuilder:
+    """Builds the same rollup documents in memory during a full replay"""
+
+    def __init__(self, account_id: str):
+        self.account_id = account_id
+        self.docs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def add(self, trade: Dict[str, Any], closed: int, realised: float):
+        day, hour = rollup_key(trade)
+        doc = self.docs.setdefault((day, trade["instrument"]), {
+            "account": self.account_id, "day": day, "instrument": trade["instrument"], "hours": {},
+        })
+        for key, value in rollup_increments(trade, closed, realised, hour).items():
+            if key.startswith("hours."):
+                doc["hours"][hour] = doc["hours"].get(hour, 0) + value
+            else:
+                doc[key] = doc.get(key, 0) + value
+        daily = self.docs.setdefault((day, ROLLUP_ALL_INSTRUMENTS), {
+            "account": self.account_id, "day": day, "instrument": ROLLUP_ALL_INSTRUMENTS,
+            "realised": 0.0, "peak_level": 0.0, "min_level": 0.0, "max_drawdown": 0.0,
+        })
+        daily["realised"] += realised
+        daily["peak_level"] = max(daily["peak_level"], daily["realised"])
+        daily["min_level"] = min(daily["min_level"], daily["realised"])
+        daily["max_drawdown"] = max(daily["max_drawdown"], daily["peak_level"] - daily["realised"])
+
+# Storage backends. STORAGE_BACKEND picks where config, status, trades, logs,
+# rollups and status history live: "mongo" (default), "memory" (one process,
+# nothing survives a restart) or "sqlite" (a single WAL-mode file at
+# SQLITE_PATH, for single-box deployments). Routes only talk to `store`.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'risk.db'))
+# How often the embedded engines delete expired logs and history points
+STORE_PURGE_SECONDS = 60.0
+# Upper bound for a cursor without an id, so `since` skips the whole timestamp
+CURSOR_ID_MAX = "\U0010ffff"
+OVERVIEW_FIELDS = ("account", "realised", "unrealised", "total_pnl", "trades_today",
+                   "orders_allowed", "max_loss_hit", "in_cooldown", "updated_at")
+OVERVIEW_SUMMARY_FIELDS = ("realised", "unrealised", "total_pnl", "trades_today")
+ROLLUP_DAY_FIELDS = ("day", "realised", "peak_level", "min_level", "max_drawdown")
+# Mongo keeps each archived trading day in its own collection, e.g. trades_archive_20250301
+ARCHIVE_COLLECTION_PATTERN = re.compile(r"^(trades|logs)_archive_(\d{8})$")
+ARCHIVE_GZIP_LEVEL = 6
+
+def archive_collection(table: str, day: str) -> str:
+    return f"{table}_archive_{day.replace('-', '')}"
+
+def apply_update(doc: Optional[Dict[str, Any]], key: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """$set / $setOnInsert / $inc applied like an upserting find_one_and_update"""
+    if doc is None:
+        doc = dict(key)
+        doc.update(update.get("$setOnInsert", {}))
+    else:
+        doc = dict(doc)
+    doc.update(update.get("$set", {}))
+    for field, amount in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + amount
+    return doc
+
+def rollup_facets(docs: List[Dict[str, Any]], instrument: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """The analytics $facet stages, computed in Python over rollup documents"""
+    by_instrument: Dict[str, Dict[str, Any]] = {}
+    hours: Dict[str, int] = {}
+    for doc in docs:
+        if instrument and doc["instrument"] != instrument:
+            continue
+        if not instrument and doc["instrument"] == ROLLUP_ALL_INSTRUMENTS:
+            continue
+        row = by_instrument.setdefault(doc["instrument"], {"_id": doc["instrument"], **{key: 0 for key in ROLLUP_COUNTERS}})
+        for key in ROLLUP_COUNTERS:
+            row[key] += doc.get(key, 0)
+        for hour, fills in doc.get("hours", {}).items():
+            hours[hour] = hours.get(hour, 0) + fills
+    days = sorted((doc for doc in docs if doc["instrument"] == ROLLUP_ALL_INSTRUMENTS), key=lambda doc: doc["day"])
+    return {
+        "by_instrument": sorted(by_instrument.values(), key=lambda row: -row["realised"]),
+        "by_hour": [{"_id": hour, "fills": fills} for hour, fills in sorted(hours.items())],
+        "days": [{field: doc.get(field) for field in ROLLUP_DAY_FIELDS} for doc in days],
+    }
+
+def statuses_overview(statuses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-account summary rows and cross-account totals of current_status documents"""
+    rows = sorted(
+        ({field: status[field] for field in OVERVIEW_FIELDS if field in status} for status in statuses),
+        key=lambda row: row.get("account", ""),
+    )
+    totals = {"accounts": len(rows), "blocked": sum(1 for row in rows if row.get("orders_allowed") is False)}
+    for field in OVERVIEW_SUMMARY_FIELDS:
+        totals[field] = sum(row.get(field, 0) for row in rows)
+    return {"totals": totals, "accounts": rows}
+
+class Store(ABC):
+    """Persistence used by the API. Documents are plain dicts with BSON-style
+    values (datetimes, not strings); paged reads return up to `limit` rows
+    newest first, bounded by parsed (timestamp, id) cursors."""
+    name = "abstract"
+
+    async def connect(self): ...
+
+    async def setup(self): ...
+
+    async def close(self): ...
+
+    @abstractmethod
+    async def find_singleton(self, collection: str, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def singleton_version(self, collection: str, key: Dict[str, Any]) -> Optional[int]:
+        """The stored version, or None when the document doesn't exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_singleton(self, collection: str, key: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply $set/$setOnInsert/$inc, upserting; returns the new document"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def accounts_overview(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def page(self, table: str, account_id: str, limit: int, before: Optional[Tuple[datetime, Optional[str]]],
+                   since: Optional[Tuple[datetime, Optional[str]]], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def export_rows(self, table: str, account_id: str, start: Optional[datetime], end: Optional[datetime],
+                    filters: Dict[str, Any], batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Rows with start <= timestamp <= end, oldest first, in lists of up to batch_size"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_logs(self, docs: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear_logs(self, account_id: str, before: Optional[datetime], log_type: Optional[str]) -> int:
+        """Delete an account's logs, optionally only older than `before` / of one type"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_trades(self, docs: List[Dict[str, Any]]) -> List[Tuple[int, bool, str]]:
+        """Insert unordered; returns (index, is_duplicate, message) per failed row"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def existing_order_ids(self, account_id: str, order_ids: List[str]) -> Set[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_trades(self, account_id: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def executed_trades(self, account_id: str, instrument: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Executed trades (of one instrument, if given) oldest first; yielded
+        documents can be passed to set_realised_pnl"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_realised_pnl(self, updates: List[Tuple[Dict[str, Any], float]]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_trades(self, account_id: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def trade_accounts(self) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_rollup(self, account_id: str, trade: Dict[str, Any], closed: int, realised: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace_rollups(self, account_id: str, docs: List[Dict[str, Any]], after_day: Optional[str] = None):
+        """Replace the account's rollups of trading days after `after_day` (all days when None)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def analytics_facets(self, account_id: str, start: str, end: str, instrument: Optional[str]) -> Dict[str, List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_history(self, point: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def history_range(self, account_id: str, start: datetime, end: datetime, fields: List[str]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_rows(self, table: str, account_id: str, ids: List[str]) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def archive_rows(self, table: str, account_id: str, day: str, rows: List[Dict[str, Any]]):
+        """Append rows to the archive of one trading day"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def archived_rows(self, table: str, account_id: str, day: str) -> List[Dict[str, Any]]:
+        """An archived day's rows, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def archived_days(self, table: str, account_id: str, start: Optional[str], end: Optional[str]) -> List[str]:
+        """Trading days in [start, end] with archived rows of the account, ascending"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def drop_archives(self, before_day: str):
+        """Delete every account's archived rows of trading days before `before_day`"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_session(self, summary: Dict[str, Any]):
+        """Insert or replace the summary of an account's trading day"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def sessions(self, account_id: str, start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def last_session_day(self, account_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+class MongoStore(Store):
+    name = "mongo"
+
+    def __init__(self):
+        self.archive_collections: Set[str] = set()
+
+    async def connect(self):
+        global client, db
+        if client is not None:
+            return
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            tz_aware=True,
+            event_listeners=[MongoCommandTimer()],
+            **mongo_client_options(),
+        )
+        db = ConfiguredDatabase(client[os.environ['DB_NAME']])
+
+    async def setup(self):
+        await migrate_timestamps()
+        await migrate_accounts()
+        await migrate_ids()
+        try:
+            await ensure_logs_collection()
+        except OperationFailure as e:
+            logger.warning("Could not set up logs collection: %s", e)
+        for collection_name, indexes in COLLECTION_INDEXES.items():
+            if collection_name == "logs":
+                continue
+            try:
+                await db[collection_name].create_indexes(indexes)
+            except OperationFailure as e:
+                # e.g. duplicate singleton documents left by an older version
+                logger.warning("Could not create indexes on %s: %s", collection_name, e)
+
+        existing = await db.list_collection_names()
+        if "risk_status_history" not in existing:
+            try:
+                await db.create_collection(
+                    "risk_status_history",
+                    timeseries={"timeField": "ts", "metaField": "account", "granularity": "seconds"},
+                    expireAfterSeconds=STATUS_HISTORY_RETENTION_DAYS * 86400,
+                )
+            except CollectionInvalid:
+                pass
+            except OperationFailure:
+                # Time-series collections need MongoDB 5.0+; fall back to a plain
+                # collection with a TTL index on the timestamp
+                await db.risk_status_history.create_index("ts", expireAfterSeconds=STATUS_HISTORY_RETENTION_DAYS * 86400)
+                await db.risk_status_history.create_index([("account", ASCENDING), ("ts", ASCENDING)], name="account_ts")
+
+    async def close(self):
+        global client
+        if client is not None:
+            client.close()
+            client = None
+
+    async def find_singleton(self, collection, key):
+        return await db[collection].find_one(key, {"_id": 0})
+
+    async def singleton_version(self, collection, key):
+        probe = await db[collection].find_one(key, {"_id": 0, "version": 1})
+        return None if probe is None else probe.get("version")
+
+    async def update_singleton(self, collection, key, update):
+        return await db[collection].find_one_and_update(
+            key,
+            update,
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def accounts_overview(self):
+        pipeline = [
+            {"$match": {"id": "current_status"}},
+            {"$facet": {
+                "accounts": [
+                    {"$sort": {"account": 1}},
+                    {"$project": {"_id": 0, **{field: 1 for field in OVERVIEW_FIELDS}}},
+                ],
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "accounts": {"$sum": 1},
+                        "blocked": {"$sum": {"$cond": [{"$eq": ["$orders_allowed", False]}, 1, 0]}},
+                        **{field: {"$sum": f"${field}"} for field in OVERVIEW_SUMMARY_FIELDS},
+                    }},
+                    {"$project": {"_id": 0}},
+                ],
+            }},
+        ]
+        facets = (await db.risk_status.aggregate(pipeline).to_list(1))[0]
+        totals = facets["totals"][0] if facets["totals"] else {
+            "accounts": 0, "blocked": 0, **{field: 0 for field in OVERVIEW_SUMMARY_FIELDS},
+        }
+        return {"totals": totals, "accounts": facets["accounts"]}
+
+    async def page(self, table, account_id, limit, before, since, filters):
+        query = keyset_query({"account": account_id, **filters}, before, since)
+        return await db[table].find(query, {"_id": 0}).sort(PAGE_SORT).limit(limit).to_list(limit)
+
+    async def export_rows(self, table, account_id, start, end, filters, batch_size):
+        query: Dict[str, Any] = {"account": account_id, **filters}
+        bounds = {op: bound for op, bound in (("$gte", start), ("$lte", end)) if bound is not None}
+        if bounds:
+            query["timestamp"] = bounds
+        # One cursor, fetched batch_size documents per round trip
+        cursor = db[table].find(query, {"_id": 0, "account": 0, "expire_at": 0}).sort(EXPORT_SORT).batch_size(batch_size)
+        batch = []
+        async for row in cursor:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def insert_logs(self, docs):
+        await db.logs.insert_many(docs, ordered=False)
+
+    async def clear_logs(self, account_id, before, log_type):
+        # Always a scoped delete, never a drop: writers keep inserting while
+        # this runs, and a dropped collection would lose their entries and
+        # the indexes until it was recreated
+        query: Dict[str, Any] = {"account": account_id}
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
+        if log_type:
+            query["type"] = log_type
+        # Delete in small batches so other operations interleave
+        deleted = 0
+        while True:
+            ids = [doc["_id"] async for doc in db.logs.find(query, {"_id": 1}).limit(LOG_DELETE_BATCH_SIZE)]
+            if not ids:
+                break
+            try:
+                result = await db.logs.delete_many({"_id": {"$in": ids}})
+            except OperationFailure as e:
+                if LOG_CAPPED_MB:
+                    raise ValueError(f"Deleting from the capped logs collection needs MongoDB 5.0 or later: {e}")
+                raise
+            deleted += result.deleted_count
+        return deleted
+
+    async def insert_trades(self, docs):
+        try:
+            await db.trades.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            return [
+                (error["index"], error.get("code") == DUPLICATE_KEY_ERROR, error.get("errmsg", "write failed"))
+                for error in e.details.get("writeErrors", [])
+            ]
+        return []
+
+    async def existing_order_ids(self, account_id, order_ids):
+        query = {"account": account_id, "order_id": {"$in": order_ids}}
+        return {doc["order_id"] async for doc in db.trades.find(query, {"_id": 0, "order_id": 1})}
+
+    async def count_trades(self, account_id):
+        return await db.trades.count_documents({"account": account_id})
+
+    async def executed_trades(self, account_id, instrument=None):
+        projection = {"id": 1, "instrument": 1, "side": 1, "quantity": 1, "price": 1, "status": 1, "timestamp": 1, "realised_pnl": 1}
+        query = {"account": account_id, "status": "executed"}
+        if instrument is not None:
+            query["instrument"] = instrument
+        async for trade in db.trades.find(query, projection).sort([("timestamp", ASCENDING), ("id", ASCENDING)]):
+            yield trade
+
+    async def set_realised_pnl(self, updates):
+        await db.trades.bulk_write(
+            [UpdateOne({"_id": trade["_id"]}, {"$set": {"realised_pnl": realised}}) for trade, realised in updates],
+            ordered=False,
+        )
+
+    async def delete_trades(self, account_id):
+        return (await db.trades.delete_many({"account": account_id})).deleted_count
+
+    async def trade_accounts(self):
+        return await db.trades.distinct("account")
+
+    async def add_rollup(self, account_id, trade, closed, realised):
+        day, hour = rollup_key(trade)
+        await db.trade_rollups.update_one(
+            {"account": account_id, "day": day, "instrument": trade["instrument"]},
+            {"$inc": rollup_increments(trade, closed, realised, hour)},
+            upsert=True,
+        )
+        await db.trade_rollups.update_one(
+            {"account": account_id, "day": day, "instrument": ROLLUP_ALL_INSTRUMENTS},
+            daily_path_update(realised),
+            upsert=True,
+        )
+
+    async def replace_rollups(self, account_id, docs, after_day=None):
+        query: Dict[str, Any] = {"account": account_id}
+        if after_day:
+            query["day"] = {"$gt": after_day}
+        await db.trade_rollups.delete_many(query)
+        if docs:
+            await db.trade_rollups.insert_many(docs)
+
+    async def analytics_facets(self, account_id, start, end, instrument):
+        instrument_match = {"instrument": instrument} if instrument else {"instrument": {"$ne": ROLLUP_ALL_INSTRUMENTS}}
+        pipeline = [
+            {"$match": {"account": account_id, "day": {"$gte": start, "$lte": end}}},
+            {"$facet": {
+                "by_instrument": [
+                    {"$match": instrument_match},
+                    {"$group": {"_id": "$instrument", **{key: {"$sum": f"${key}"} for key in ROLLUP_COUNTERS}}},
+                    {"$sort": {"realised": -1}},
+                ],
+                "by_hour": [
+                    {"$match": instrument_match},
+                    {"$project": {"hours": {"$objectToArray": "$hours"}}},
+                    {"$unwind": "$hours"},
+                    {"$group": {"_id": "$hours.k", "fills": {"$sum": "$hours.v"}}},
+                    {"$sort": {"_id": 1}},
+                ],
+                "days": [
+                    {"$match": {"instrument": ROLLUP_ALL_INSTRUMENTS}},
+                    {"$sort": {"day": 1}},
+                    {"$project": {"_id": 0, **{field: 1 for field in ROLLUP_DAY_FIELDS}}},
+                ],
+            }},
+        ]
+        return (await db.trade_rollups.aggregate(pipeline).to_list(1))[0]
+
+    async def insert_history(self, point):
+        await db.risk_status_history.insert_one(point)
+
+    async def history_range(self, account_id, start, end, fields):
+        projection = {"_id": 0, "ts": 1, **{field: 1 for field in fields}}
+        return await db.risk_status_history.find(
+            {**history_scope(account_id), "ts": {"$gte": start, "$lte": end}}, projection
+        ).sort("ts", 1).to_list(None)
+
+    async def delete_rows(self, table, account_id, ids):
+        return (await db[table].delete_many({"account": account_id, "id": {"$in": ids}})).deleted_count
+
+    async def archive_rows(self, table, account_id, day, rows):
+        name = archive_collection(table, day)
+        if name not in self.archive_collections:
+            try:
+                # Archives are written once and read rarely; zstd blocks keep them small
+                await db.create_collection(name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+            except CollectionInvalid:
+                pass
+            except OperationFailure as e:
+                logger.warning("Could not create %s with zstd compression: %s", name, e)
+            await db[name].create_index([("account", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="account_timestamp_id")
+            self.archive_collections.add(name)
+        await db[name].insert_many([dict(row, account=account_id) for row in rows], ordered=False)
+
+    async def archived_rows(self, table, account_id, day):
+        cursor = db[archive_collection(table, day)].find({"account": account_id}, {"_id": 0, "account": 0})
+        return await cursor.sort(EXPORT_SORT).to_list(None)
+
+    async def archived_days(self, table, account_id, start, end):
+        days = []
+        for name in sorted(await db.list_collection_names()):
+            match = ARCHIVE_COLLECTION_PATTERN.match(name)
+            if not match or match.group(1) != table:
+                continue
+            day = f"{match.group(2)[:4]}-{match.group(2)[4:6]}-{match.group(2)[6:]}"
+            if (start and day < start) or (end and day > end):
+                continue
+            if await db[name].find_one({"account": account_id}, {"_id": 1}):
+                days.append(day)
+        return days
+
+    async def drop_archives(self, before_day):
+        for name in await db.list_collection_names():
+            match = ARCHIVE_COLLECTION_PATTERN.match(name)
+            if match and match.group(2) < before_day.replace("-", ""):
+                await db.drop_collection(name)
+                self.archive_collections.discard(name)
+
+    async def save_session(self, summary):
+        await db.sessions.replace_one({"account": summary["account"], "day": summary["day"]}, summary, upsert=True)
+
+    async def sessions(self, account_id, start, end):
+        query: Dict[str, Any] = {"account": account_id}
+        days = {op: bound for op, bound in (("$gte", start), ("$lte", end)) if bound}
+        if days:
+            query["day"] = days
+        return await db.sessions.find(query, {"_id": 0}).sort("day", ASCENDING).to_list(None)
+
+    async def last_session_day(self, account_id):
+        doc = await db.sessions.find_one({"account": account_id}, {"_id": 0, "day": 1}, sort=[("day", DESCENDING)])
+        return doc["day"] if doc else None
+
+class MemoryStore(Store):
+    """Everything in process memory: no I/O at all, for tests and throwaway
+    single-process deployments. Logs and trades are kept per account in
+    (timestamp, id) order so pages are binary searches."""
+    name = "memory"
+
+    def __init__(self):
+        self.singletons: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # table -> account -> (sorted row keys, rows)
+        self.tables: Dict[str, Dict[str, Tuple[List[Tuple[datetime, str]], List[Dict[str, Any]]]]] = {"logs": {}, "trades": {}}
+        self.order_ids: Dict[str, Set[str]] = {}
+        self.rollups: Dict[str, RollupBuilder] = {}
+        self.history: Dict[str, List[Dict[str, Any]]] = {}
+        self.archives: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        self.summaries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.purged_at = 0.0
+
+    @staticmethod
+    def row_key(doc: Dict[str, Any]) -> Tuple[datetime, str]:
+        return as_utc(doc["timestamp"]), doc.get("id") or ""
+
+    def rows(self, table: str, account_id: str):
+        return self.tables[table].setdefault(account_id, ([], []))
+
+    def insert_row(self, table: str, doc: Dict[str, Any]):
+        keys, rows = self.rows(table, doc["account"])
+        key = self.row_key(doc)
+        index = bisect.bisect_right(keys, key)
+        keys.insert(index, key)
+        rows.insert(index, doc)
+
+    def remove_rows(self, table: str, account_id: str, predicate) -> int:
+        keys, rows = self.rows(table, account_id)
+        kept = [(key, row) for key, row in zip(keys, rows) if not predicate(row)]
+        removed = len(rows) - len(kept)
+        keys[:] = [key for key, _ in kept]
+        rows[:] = [row for _, row in kept]
+        return removed
+
+    def purge_expired(self):
+        now = time.monotonic()
+        if now - self.purged_at < STORE_PURGE_SECONDS:
+            return
+        self.purged_at = now
+        utc = utc_now()
+        for account_id in list(self.tables["logs"]):
+            self.remove_rows("logs", account_id, lambda row: row.get("expire_at") is not None and row["expire_at"] <= utc)
+        cutoff = utc - timedelta(days=STATUS_HISTORY_RETENTION_DAYS)
+        for account_id, points in self.history.items():
+            points[:] = [point for point in points if point["ts"] >= cutoff]
+
+    async def find_singleton(self, collection, key):
+        return self.singletons.get((collection, key["account"], key["id"]))
+
+    async def singleton_version(self, collection, key):
+        doc = self.singletons.get((collection, key["account"], key["id"]))
+        return None if doc is None else doc.get("version")
+
+    async def update_singleton(self, collection, key, update):
+        slot = (collection, key["account"], key["id"])
+        doc = self.singletons[slot] = apply_update(self.singletons.get(slot), key, update)
+        return doc
+
+    async def accounts_overview(self):
+        return statuses_overview([
+            doc for (collection, _, doc_id), doc in self.singletons.items()
+            if collection == "risk_status" and doc_id == "current_status"
+        ])
+
+    async def page(self, table, account_id, limit, before, since, filters):
+        keys, rows = self.rows(table, account_id)
+        high = len(keys) if before is None else bisect.bisect_left(keys, (before[0], before[1] or ""))
+        low = 0 if since is None else bisect.bisect_right(keys, (since[0], since[1] or CURSOR_ID_MAX))
+        page = []
+        for index in range(high - 1, low - 1, -1):
+            row = rows[index]
+            if any(row.get(field) != value for field, value in filters.items()):
+                continue
+            page.append(dict(row))
+            if len(page) >= limit:
+                break
+        return page
+
+    async def export_rows(self, table, account_id, start, end, filters, batch_size):
+        keys, rows = self.rows(table, account_id)
+        first = (start, "") if start is not None else None
+        last = (end, CURSOR_ID_MAX) if end is not None else None
+        after = None
+        while True:
+            # Re-find the position every batch; inserts in between shift indices
+            if after is not None:
+                low = bisect.bisect_right(keys, after)
+            else:
+                low = 0 if first is None else bisect.bisect_left(keys, first)
+            high = len(keys) if last is None else bisect.bisect_right(keys, last)
+            if low >= high:
+                return
+            chunk = range(low, min(low + batch_size, high))
+            after = keys[chunk[-1]]
+            batch = [
+                {field: value for field, value in rows[index].items() if field not in ("account", "expire_at")}
+                for index in chunk if all(rows[index].get(field) == value for field, value in filters.items())
+            ]
+            if batch:
+                yield batch
+
+    async def insert_logs(self, docs):
+        for doc in docs:
+            self.insert_row("logs", dict(doc))
+        self.purge_expired()
+
+    async def clear_logs(self, account_id, before, log_type):
+        return self.remove_rows("logs", account_id, lambda row: (
+            (before is None or row["timestamp"] < before) and (not log_type or row["type"] == log_type)
+        ))
+
+    async def insert_trades(self, docs):
+        failures = []
+        for index, doc in enumerate(docs):
+            order_id = doc.get("order_id")
+            if order_id and order_id in self.order_ids.get(doc["account"], ()):
+                failures.append((index, True, f"duplicate order_id {order_id}"))
+                continue
+            self.insert_row("trades", doc)
+            if order_id:
+                self.order_ids.setdefault(doc["account"], set()).add(order_id)
+        return failures
+
+    async def existing_order_ids(self, account_id, order_ids):
+        return self.order_ids.get(account_id, set()) & set(order_ids)
+
+    async def count_trades(self, account_id):
+        return len(self.rows("trades", account_id)[1])
+
+    async def executed_trades(self, account_id, instrument=None):
+        for row in list(self.rows("trades", account_id)[1]):
+            if row.get("status") == "executed" and (instrument is None or row.get("instrument") == instrument):
+                yield row
+
+    async def set_realised_pnl(self, updates):
+        # executed_trades yields the stored rows themselves
+        for trade, realised in updates:
+            trade["realised_pnl"] = realised
+
+    async def delete_trades(self, account_id):
+        self.order_ids.pop(account_id, None)
+        return self.remove_rows("trades", account_id, lambda row: True)
+
+    async def trade_accounts(self):
+        return [account_id for account_id, (keys, _) in self.tables["trades"].items() if keys]
+
+    async def add_rollup(self, account_id, trade, closed, realised):
+        self.rollups.setdefault(account_id, RollupBuilder(account_id)).add(trade, closed, realised)
+
+    async def replace_rollups(self, account_id, docs, after_day=None):
+        builder = self.rollups.setdefault(account_id, RollupBuilder(account_id))
+        builder.docs = {key: doc for key, doc in builder.docs.items() if after_day and key[0] <= after_day}
+        for doc in docs:
+            builder.docs[(doc["day"], doc["instrument"])] = doc
+
+    async def analytics_facets(self, account_id, start, end, instrument):
+        builder = self.rollups.get(account_id)
+        docs = [doc for (day, _), doc in builder.docs.items() if start <= day <= end] if builder else []
+        return rollup_facets(docs, instrument)
+
+    async def insert_history(self, point):
+        self.history.setdefault(point["account"], []).append(point)
+        self.purge_expired()
+
+    async def history_range(self, account_id, start, end, fields):
+        points = [point for point in self.history.get(account_id, []) if start <= point["ts"] <= end]
+        points.sort(key=lambda point: point["ts"])
+        return [{"ts": point["ts"], **{field: point.get(field, 0.0) for field in fields}} for point in points]
+
+    async def delete_rows(self, table, account_id, ids):
+        ids = set(ids)
+        if table == "trades":
+            order_ids = self.order_ids.get(account_id, set())
+            for row in self.rows(table, account_id)[1]:
+                if row.get("id") in ids and row.get("order_id"):
+                    order_ids.discard(row["order_id"])
+        return self.remove_rows(table, account_id, lambda row: row.get("id") in ids)
+
+    async def archive_rows(self, table, account_id, day, rows):
+        self.archives.setdefault((table, account_id, day), []).extend(dict(row) for row in rows)
+
+    async def archived_rows(self, table, account_id, day):
+        return sorted(self.archives.get((table, account_id, day), []), key=self.row_key)
+
+    async def archived_days(self, table, account_id, start, end):
+        return sorted(
+            day for kind, account, day in self.archives
+            if kind == table and account == account_id and (not start or day >= start) and (not end or day <= end)
+        )
+
+    async def drop_archives(self, before_day):
+        for key in [key for key in self.archives if key[2] < before_day]:
+            del self.archives[key]
+
+    async def save_session(self, summary):
+        self.summaries.setdefault(summary["account"], {})[summary["day"]] = summary
+
+    async def sessions(self, account_id, start, end):
+        return [
+            summary for day, summary in sorted(self.summaries.get(account_id, {}).items())
+            if (not start or day >= start) and (not end or day <= end)
+        ]
+
+    async def last_session_day(self, account_id):
+        return max(self.summaries.get(account_id, {}), default=None)
+
+def encode_doc(doc: Dict[str, Any]) -> str:
+    return json.dumps(doc, default=lambda value: {"$date": value.isoformat()} if isinstance(value, datetime) else str(value))
+
+def decode_doc(text: str) -> Dict[str, Any]:
+    def revive(value: Dict[str, Any]) -> Any:
+        if len(value) == 1 and "$date" in value:
+            return as_utc(datetime.fromisoformat(value["$date"]))
+        return value
+    return json.loads(text, object_hook=revive)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def epoch_us(value: datetime) -> int:
+    return (as_utc(value) - EPOCH) // timedelta(microseconds=1)
+
+def on_sqlite_thread(method: Callable[..., Any]) -> Callable[..., Any]:
+    """Turn a blocking SQLiteStore method into a coroutine run on the store's thread."""
+    @functools.wraps(method)
+    async def run(self: "SQLiteStore", *args: Any, **kwargs: Any) -> Any:
+        return await self.run(method, self, *args, **kwargs)
+    return run
+
+class SQLiteStore(Store):
+    """Documents as JSON in one SQLite file in WAL mode, with the page, order
+    and uniqueness keys in indexed columns. Statements run on one dedicated
+    thread, so waiting on another worker's write lock never blocks the event
+    loop, and a transaction always sees its own connection."""
+    name = "sqlite"
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS singletons (collection TEXT NOT NULL, account TEXT NOT NULL, id TEXT NOT NULL, "
+        "version INTEGER, doc TEXT NOT NULL, PRIMARY KEY (collection, account, id))",
+        "CREATE TABLE IF NOT EXISTS logs (account TEXT NOT NULL, ts INTEGER NOT NULL, id TEXT NOT NULL, "
+        "type TEXT, expire_at INTEGER, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS logs_account_ts_id ON logs (account, ts, id)",
+        "CREATE INDEX IF NOT EXISTS logs_account_type_ts_id ON logs (account, type, ts, id)",
+        "CREATE INDEX IF NOT EXISTS logs_expire_at ON logs (expire_at) WHERE expire_at IS NOT NULL",
+        "CREATE TABLE IF NOT EXISTS trades (account TEXT NOT NULL, ts INTEGER NOT NULL, id TEXT NOT NULL, "
+        "order_id TEXT, status TEXT, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS trades_account_ts_id ON trades (account, ts, id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS trades_account_order_id ON trades (account, order_id) WHERE order_id IS NOT NULL",
+        "CREATE TABLE IF NOT EXISTS trade_rollups (account TEXT NOT NULL, day TEXT NOT NULL, instrument TEXT NOT NULL, "
+        "doc TEXT NOT NULL, PRIMARY KEY (account, day, instrument))",
+        "CREATE TABLE IF NOT EXISTS risk_status_history (account TEXT NOT NULL, ts INTEGER NOT NULL, doc TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS risk_status_history_account_ts ON risk_status_history (account, ts)",
+        # One gzip-compressed NDJSON blob per archived batch
+        "CREATE TABLE IF NOT EXISTS archives (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+        "account TEXT NOT NULL, day TEXT NOT NULL, rows INTEGER NOT NULL, data BLOB NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS archives_account_kind_day ON archives (account, kind, day)",
+        "CREATE TABLE IF NOT EXISTS sessions (account TEXT NOT NULL, day TEXT NOT NULL, doc TEXT NOT NULL, "
+        "PRIMARY KEY (account, day))",
+    ]
+    PAGE_FILTER_COLUMNS = {"type"}
+    SCAN_BATCH_SIZE = 1000
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.purged_at = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def open(self) -> sqlite3.Connection:
+        # Autocommit; multi-statement writes open their own transactions
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    async def connect(self):
+        if self.connection is not None:
+            return
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.connection = await self.run(self.open)
+
+    @on_sqlite_thread
+    def setup(self):
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+
+    async def close(self):
+        if self.connection is not None:
+            await self.run(self.connection.close)
+            self.connection = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def execute(self, sql: str, params: Tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, params)
+
+    def fetchall(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        return self.execute(sql, params).fetchall()
+
+    def purge_expired(self):
+        now = time.monotonic()
+        if now - self.purged_at < STORE_PURGE_SECONDS:
+            return
+        self.purged_at = now
+        utc = utc_now()
+        self.execute("DELETE FROM logs WHERE expire_at IS NOT NULL AND expire_at <= ?", (epoch_us(utc),))
+        cutoff = utc - timedelta(days=STATUS_HISTORY_RETENTION_DAYS)
+        self.execute("DELETE FROM risk_status_history WHERE ts < ?", (epoch_us(cutoff),))
+
+    @on_sqlite_thread
+    def find_singleton(self, collection, key):
+        return self.load_singleton(collection, key)
+
+    def load_singleton(self, collection: str, key: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        row = self.execute(
+            "SELECT doc FROM singletons WHERE collection = ? AND account = ? AND id = ?",
+            (collection, key["account"], key["id"]),
+        ).fetchone()
+        return decode_doc(row[0]) if row else None
+
+    @on_sqlite_thread
+    def singleton_version(self, collection, key):
+        row = self.execute(
+            "SELECT version FROM singletons WHERE collection = ? AND account = ? AND id = ?",
+            (collection, key["account"], key["id"]),
+        ).fetchone()
+        return row[0] if row else None
+
+    @on_sqlite_thread
+    def update_singleton(self, collection, key, update):
+        # IMMEDIATE takes the write lock up front, so concurrent workers
+        # serialise their read-modify-write like an atomic findAndModify
+        self.execute("BEGIN IMMEDIATE")
+        try:
+            doc = apply_update(self.load_singleton(collection, key), key, update)
+            self.execute(
+                "INSERT OR REPLACE INTO singletons (collection, account, id, version, doc) VALUES (?, ?, ?, ?, ?)",
+                (collection, key["account"], key["id"], doc.get("version"), encode_doc(doc)),
+            )
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+        return doc
+
+    @on_sqlite_thread
+    def accounts_overview(self):
+        rows = self.execute(
+            "SELECT doc FROM singletons WHERE collection = 'risk_status' AND id = 'current_status'"
+        ).fetchall()
+        return statuses_overview([decode_doc(row[0]) for row in rows])
+
+    @on_sqlite_thread
+    def page(self, table, account_id, limit, before, since, filters):
+        sql = f"SELECT doc FROM {table} WHERE account = ?"
+        params: List[Any] = [account_id]
+        for field, value in filters.items():
+            if field not in self.PAGE_FILTER_COLUMNS:
+                raise ValueError(f"Cannot filter {table} on {field}")
+            sql += f" AND {field} = ?"
+            params.append(value)
+        for cursor, op in ((before, "<"), (since, ">")):
+            if cursor is None:
+                continue
+            if cursor[1]:
+                sql += f" AND (ts, id) {op} (?, ?)"
+                params += [epoch_us(cursor[0]), cursor[1]]
+            else:
+                sql += f" AND ts {op} ?"
+                params.append(epoch_us(cursor[0]))
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return [decode_doc(row[0]) for row in self.execute(sql, tuple(params))]
+
+    async def export_rows(self, table, account_id, start, end, filters, batch_size):
+        sql = f"SELECT ts, id, doc FROM {table} WHERE account = ? AND ts BETWEEN ? AND ?"
+        params: List[Any] = [
+            account_id,
+            epoch_us(start) if start is not None else -2 ** 63,
+            epoch_us(end) if end is not None else 2 ** 63 - 1,
+        ]
+        for field, value in filters.items():
+            if field not in self.PAGE_FILTER_COLUMNS:
+                raise ValueError(f"Cannot filter {table} on {field}")
+            sql += f" AND {field} = ?"
+            params.append(value)
+        sql += " AND (ts, id) > (?, ?) ORDER BY ts, id LIMIT ?"
+        after = (-2 ** 63, "")
+        while True:
+            rows = await self.run(self.fetchall, sql, (*params, *after, batch_size))
+            if not rows:
+                return
+            batch = []
+            for _, _, doc in rows:
+                row = decode_doc(doc)
+                row.pop("account", None)
+                row.pop("expire_at", None)
+                batch.append(row)
+            yield batch
+            after = (rows[-1][0], rows[-1][1])
+
+    @on_sqlite_thread
+    def insert_logs(self, docs):
+        self.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                "INSERT INTO logs (account, ts, id, type, expire_at, doc) VALUES (?, ?, ?, ?, ?, ?)",
+                [(
+                    doc["account"], epoch_us(doc["timestamp"]), doc.get("id") or "", doc.get("type"),
+                    epoch_us(doc["expire_at"]) if doc.get("expire_at") else None, encode_doc(doc),
+                ) for doc in docs],
+            )
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+        self.purge_expired()
+
+    @on_sqlite_thread
+    def clear_logs(self, account_id, before, log_type):
+        sql = "DELETE FROM logs WHERE account = ?"
+        params: List[Any] = [account_id]
+        if before is not None:
+            sql += " AND ts < ?"
+            params.append(epoch_us(before))
+        if log_type:
+            sql += " AND type = ?"
+            params.append(log_type)
+        return self.execute(sql, tuple(params)).rowcount
+
+    def trade_row(self, doc: Dict[str, Any]) -> Tuple[Any, ...]:
+        return (doc["account"], epoch_us(doc["timestamp"]), doc.get("id") or "", doc.get("order_id"),
+                doc.get("status"), encode_doc(doc))
+
+    def write_trade(self, doc: Dict[str, Any]):
+        self.execute("INSERT INTO trades (account, ts, id, order_id, status, doc) VALUES (?, ?, ?, ?, ?, ?)", self.trade_row(doc))
+
+    @on_sqlite_thread
+    def insert_trades(self, docs):
+        failures = []
+        self.execute("BEGIN")
+        try:
+            for index, doc in enumerate(docs):
+                try:
+                    self.write_trade(doc)
+                except sqlite3.IntegrityError as e:
+                    failures.append((index, True, str(e)))
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+        return failures
+
+    @on_sqlite_thread
+    def existing_order_ids(self, account_id, order_ids):
+        placeholders = ",".join("?" * len(order_ids))
+        rows = self.execute(
+            f"SELECT order_id FROM trades WHERE account = ? AND order_id IN ({placeholders})",
+            (account_id, *order_ids),
+        )
+        return {row[0] for row in rows}
+
+    @on_sqlite_thread
+    def count_trades(self, account_id):
+        return self.execute("SELECT COUNT(*) FROM trades WHERE account = ?", (account_id,)).fetchone()[0]
+
+    async def executed_trades(self, account_id, instrument=None):
+        # Keyset batches, so rows can be updated between batches
+        last = (-1, "")
+        instrument_filter = " AND json_extract(doc, '$.instrument') = ?" if instrument is not None else ""
+        while True:
+            rows = await self.run(
+                self.fetchall,
+                "SELECT rowid, ts, id, doc FROM trades WHERE account = ? AND status = 'executed' AND (ts, id) > (?, ?)"
+                f"{instrument_filter} ORDER BY ts, id LIMIT ?",
+                (account_id, *last, *([instrument] if instrument is not None else []), self.SCAN_BATCH_SIZE),
+            )
+            for rowid, _, _, doc in rows:
+                trade = decode_doc(doc)
+                trade["_rowid"] = rowid
+                yield trade
+            if len(rows) < self.SCAN_BATCH_SIZE:
+                return
+            last = (rows[-1][1], rows[-1][2])
+
+    @on_sqlite_thread
+    def set_realised_pnl(self, updates):
+        self.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                "UPDATE trades SET doc = json_set(doc, '$.realised_pnl', ?) WHERE rowid = ?",
+                [(realised, trade["_rowid"]) for trade, realised in updates],
+            )
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+
+    @on_sqlite_thread
+    def delete_trades(self, account_id):
+        return self.execute("DELETE FROM trades WHERE account = ?", (account_id,)).rowcount
+
+    @on_sqlite_thread
+    def trade_accounts(self):
+        return [row[0] for row in self.execute("SELECT DISTINCT account FROM trades")]
+
+    def load_rollups(self, account_id: str, day: str, instruments: Tuple[str, ...]) -> RollupBuilder:
+        builder = RollupBuilder(account_id)
+        placeholders = ",".join("?" * len(instruments))
+        rows = self.execute(
+            f"SELECT instrument, doc FROM trade_rollups WHERE account = ? AND day = ? AND instrument IN ({placeholders})",
+            (account_id, day, *instruments),
+        )
+        for instrument, doc in rows:
+            builder.docs[(day, instrument)] = decode_doc(doc)
+        return builder
+
+    def write_rollups(self, docs: List[Dict[str, Any]]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO trade_rollups (account, day, instrument, doc) VALUES (?, ?, ?, ?)",
+            [(doc["account"], doc["day"], doc["instrument"], encode_doc(doc)) for doc in docs],
+        )
+
+    @on_sqlite_thread
+    def add_rollup(self, account_id, trade, closed, realised):
+        day, _ = rollup_key(trade)
+        self.execute("BEGIN IMMEDIATE")
+        try:
+            builder = self.load_rollups(account_id, day, (trade["instrument"], ROLLUP_ALL_INSTRUMENTS))
+            builder.add(trade, closed, realised)
+            self.write_rollups(list(builder.docs.values()))
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+
+    @on_sqlite_thread
+    def replace_rollups(self, account_id, docs, after_day=None):
+        self.execute("BEGIN")
+        try:
+            self.execute("DELETE FROM trade_rollups WHERE account = ? AND day > ?", (account_id, after_day or ""))
+            self.write_rollups(docs)
+            self.execute("COMMIT")
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+
+    @on_sqlite_thread
+    def analytics_facets(self, account_id, start, end, instrument):
+        rows = self.execute(
+            "SELECT doc FROM trade_rollups WHERE account = ? AND day BETWEEN ? AND ?",
+            (account_id, start, end),
+        )
+        return rollup_facets([decode_doc(row[0]) for row in rows], instrument)
+
+    @on_sqlite_thread
+    def insert_history(self, point):
+        self.execute(
+            "INSERT INTO risk_status_history (account, ts, doc) VALUES (?, ?, ?)",
+            (point["account"], epoch_us(point["ts"]), encode_doc(point)),
+        )
+        self.purge_expired()
+
+    @on_sqlite_thread
+    def history_range(self, account_id, start, end, fields):
+        rows = self.execute(
+            "SELECT doc FROM risk_status_history WHERE account = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+            (account_id, epoch_us(start), epoch_us(end)),
+        )
+        points = [decode_doc(row[0]) for row in rows]
+        return [{"ts": point["ts"], **{field: point.get(field, 0.0) for field in fields}} for point in points]
+
+    @on_sqlite_thread
+    def delete_rows(self, table, account_id, ids):
+        placeholders = ",".join("?" * len(ids))
+        return self.execute(f"DELETE FROM {table} WHERE account = ? AND id IN ({placeholders})", (account_id, *ids)).rowcount
+
+    @on_sqlite_thread
+    def archive_rows(self, table, account_id, day, rows):
+        data = gzip.compress("\n".join(encode_doc(row) for row in rows).encode(), ARCHIVE_GZIP_LEVEL)
+        self.execute(
+            "INSERT INTO archives (kind, account, day, rows, data) VALUES (?, ?, ?, ?, ?)",
+            (table, account_id, day, len(rows), data),
+        )
+
+    @on_sqlite_thread
+    def archived_rows(self, table, account_id, day):
+        rows = []
+        for (data,) in self.execute(
+            "SELECT data FROM archives WHERE account = ? AND kind = ? AND day = ? ORDER BY seq", (account_id, table, day)
+        ).fetchall():
+            rows.extend(decode_doc(line) for line in gzip.decompress(data).decode().split("\n"))
+        return sorted(rows, key=lambda row: (row["timestamp"], row.get("id") or ""))
+
+    @on_sqlite_thread
+    def archived_days(self, table, account_id, start, end):
+        rows = self.execute(
+            "SELECT DISTINCT day FROM archives WHERE account = ? AND kind = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (account_id, table, start or "", end or "9999-12-31"),
+        )
+        return [row[0] for row in rows]
+
+    @on_sqlite_thread
+    def drop_archives(self, before_day):
+        self.execute("DELETE FROM archives WHERE day < ?", (before_day,))
+
+    @on_sqlite_thread
+    def save_session(self, summary):
+        self.execute(
+            "INSERT OR REPLACE INTO sessions (account, day, doc) VALUES (?, ?, ?)",
+            (summary["account"], summary["day"], encode_doc(summary)),
+        )
+
+    @on_sqlite_thread
+    def sessions(self, account_id, start, end):
+        rows = self.execute(
+            "SELECT doc FROM sessions WHERE account = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (account_id, start or "", end or "9999-12-31"),
+        )
+        return [decode_doc(row[0]) for row in rows]
+
+    @on_sqlite_thread
+    def last_session_day(self, account_id):
+        return self.execute("SELECT MAX(day) FROM sessions WHERE account = ?", (account_id,)).fetchone()[0]
+
+STORES = {"mongo": MongoStore, "memory": MemoryStore, "sqlite": SQLiteStore}
+if STORAGE_BACKEND not in STORES:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected one of {sorted(STORES)}")
+store: Store = STORES[STORAGE_BACKEND]()
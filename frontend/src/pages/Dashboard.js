@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import { toast } from "sonner";
 import { Shield, User, Settings, RotateCcw, Square, XCircle } from "lucide-react";
@@ -15,7 +15,8 @@ import VerticalMeter from "@/components/VerticalMeter";
 import StreakMeter from "@/components/StreakMeter";
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
-const API = `${BACKEND_URL}/api`;
+const ACCOUNT_ID = process.env.REACT_APP_ACCOUNT_ID;
+const API = ACCOUNT_ID ? `${BACKEND_URL}/api/accounts/${encodeURIComponent(ACCOUNT_ID)}` : `${BACKEND_URL}/api`;
 
 const Dashboard = () => {
   const [config, setConfig] = useState(null);
@@ -24,6 +25,8 @@ const Dashboard = () => {
   const [trades, setTrades] = useState([]);
   const [loading, setLoading] = useState(true);
   const [configForm, setConfigForm] = useState({});
+  // Set while the user has unsaved edits; pushed config then leaves the form alone
+  const configEdited = useRef(false);
   const [tradeHistory, setTradeHistory] = useState([
     { type: 'profit', amount: 150 },
     { type: 'profit', amount: 200 },
@@ -47,7 +50,9 @@ const Dashboard = () => {
       setStatus(statusRes.data);
       setLogs(logsRes.data);
       setTrades(tradesRes.data);
-      setConfigForm(configRes.data);
+      if (!configEdited.current) {
+        setConfigForm(configRes.data);
+      }
       setLoading(false);
     } catch (error) {
       console.error("Error fetching data:", error);
@@ -57,11 +62,92 @@ const Dashboard = () => {
   };
 
   useEffect(() => {
-    fetchData();
-    const interval = setInterval(fetchData, 5000);
-    return () => clearInterval(interval);
+    // Browsers without EventSource fall back to polling
+    if (typeof EventSource === "undefined") {
+      fetchData();
+      const interval = setInterval(fetchData, 5000);
+      return () => clearInterval(interval);
+    }
+
+    // One snapshot on (re)connect, then deltas pushed by the server
+    const source = new EventSource(`${API}/stream?logs_limit=50&trades_limit=100`);
+    const parse = (event) => JSON.parse(event.data);
+
+    source.addEventListener("snapshot", (event) => {
+      const snapshot = parse(event);
+      setConfig(snapshot.config);
+      setStatus(snapshot.status);
+      setLogs(snapshot.logs);
+      setTrades(snapshot.trades);
+      if (!configEdited.current) {
+        setConfigForm(snapshot.config);
+      }
+      setLoading(false);
+    });
+    source.addEventListener("config", (event) => {
+      const data = parse(event);
+      setConfig(prev => ({...prev, ...data}));
+      if (!configEdited.current) {
+        setConfigForm(prev => ({...prev, ...data}));
+      }
+    });
+    source.addEventListener("status", (event) => {
+      const data = parse(event);
+      setStatus(prev => ({...prev, ...data}));
+    });
+    source.addEventListener("log", (event) => {
+      const data = parse(event);
+      setLogs(prev => [data, ...prev].slice(0, 50));
+    });
+    source.addEventListener("logs_cleared", async (event) => {
+      const data = parse(event);
+      if (!data.before && !data.log_type) {
+        setLogs([]);
+        return;
+      }
+      const logsRes = await axios.get(`${API}/logs?limit=50`);
+      setLogs(logsRes.data);
+    });
+    source.addEventListener("trade", (event) => {
+      const data = parse(event);
+      setTrades(prev => [data, ...prev].slice(0, 100));
+    });
+    source.addEventListener("trades_reset", (event) => {
+      const data = parse(event);
+      setTrades(data.slice(0, 100));
+    });
+    source.addEventListener("trades_cleared", () => setTrades([]));
+    source.addEventListener("trades_bulk", async () => {
+      const tradesRes = await axios.get(`${API}/trades?limit=100`);
+      setTrades(tradesRes.data);
+    });
+    source.addEventListener("session_rollover", async () => {
+      // The closed session's trades and logs moved to the archive
+      const [logsRes, tradesRes] = await Promise.all([
+        axios.get(`${API}/logs?limit=50`),
+        axios.get(`${API}/trades?limit=100`)
+      ]);
+      setLogs(logsRes.data);
+      setTrades(tradesRes.data);
+    });
+    source.onerror = () => {
+      // EventSource reconnects on its own and receives a fresh snapshot
+      console.error("Dashboard stream disconnected, reconnecting");
+    };
+
+    return () => source.close();
   }, []);
 
+  const editConfigForm = (changes) => {
+    configEdited.current = true;
+    setConfigForm(prev => ({...prev, ...changes}));
+  };
+
+  const refreshConfigForm = () => {
+    configEdited.current = false;
+    fetchData();
+  };
+
   const handleUpdateConfig = async () => {
     try {
       const response = await axios.put(`${API}/risk-config`, {
@@ -78,7 +164,7 @@ const Dashboard = () => {
       });
       setConfig(response.data);
       toast.success("Configuration updated");
-      fetchData();
+      refreshConfigForm();
     } catch (error) {
       toast.error("Failed to update configuration");
     }
@@ -286,7 +372,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.max_position_size || ''}
-                      onChange={(e) => setConfigForm({...configForm, max_position_size: e.target.value})}
+                      onChange={(e) => editConfigForm({max_position_size: e.target.value})}
                       data-testid="capital-input"
                     />
                   </div>
@@ -295,7 +381,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.stop_loss_percentage || ''}
-                      onChange={(e) => setConfigForm({...configForm, stop_loss_percentage: e.target.value})}
+                      onChange={(e) => editConfigForm({stop_loss_percentage: e.target.value})}
                       data-testid="min-loss-input"
                     />
                   </div>
@@ -304,7 +390,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.daily_max_loss || ''}
-                      onChange={(e) => setConfigForm({...configForm, daily_max_loss: e.target.value})}
+                      onChange={(e) => editConfigForm({daily_max_loss: e.target.value})}
                     />
                   </div>
                   <div className="space-y-2">
@@ -312,7 +398,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.daily_max_profit || ''}
-                      onChange={(e) => setConfigForm({...configForm, daily_max_profit: e.target.value})}
+                      onChange={(e) => editConfigForm({daily_max_profit: e.target.value})}
                     />
                   </div>
                   <div className="space-y-2">
@@ -320,7 +406,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.trailing_profit_step || ''}
-                      onChange={(e) => setConfigForm({...configForm, trailing_profit_step: e.target.value})}
+                      onChange={(e) => editConfigForm({trailing_profit_step: e.target.value})}
                       data-testid="trail-step-input"
                     />
                   </div>
@@ -329,7 +415,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.max_trades_per_day || ''}
-                      onChange={(e) => setConfigForm({...configForm, max_trades_per_day: e.target.value})}
+                      onChange={(e) => editConfigForm({max_trades_per_day: e.target.value})}
                     />
                   </div>
                   <div className="space-y-2">
@@ -337,7 +423,7 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.consecutive_loss_limit || ''}
-                      onChange={(e) => setConfigForm({...configForm, consecutive_loss_limit: e.target.value})}
+                      onChange={(e) => editConfigForm({consecutive_loss_limit: e.target.value})}
                     />
                   </div>
                   <div className="space-y-2">
@@ -345,14 +431,14 @@ const Dashboard = () => {
                     <Input
                       type="number"
                       value={configForm.cooldown_after_loss || ''}
-                      onChange={(e) => setConfigForm({...configForm, cooldown_after_loss: e.target.value})}
+                      onChange={(e) => editConfigForm({cooldown_after_loss: e.target.value})}
                     />
                   </div>
                   <div className="space-y-2">
                     <Label>Side Lock</Label>
                     <Select 
                       value={configForm.side_lock || "none"} 
-                      onValueChange={(value) => setConfigForm({...configForm, side_lock: value === "none" ? null : value})}
+                      onValueChange={(value) => editConfigForm({side_lock: value === "none" ? null : value})}
                     >
                       <SelectTrigger>
                         <SelectValue />
@@ -368,7 +454,7 @@ const Dashboard = () => {
                     <div className="flex items-center space-x-2">
                       <Switch
                         checked={configForm.trailing_profit_enabled === true}
-                        onCheckedChange={(checked) => setConfigForm(prev => ({...prev, trailing_profit_enabled: checked}))}
+                        onCheckedChange={(checked) => editConfigForm({trailing_profit_enabled: checked})}
                       />
                       <Label>Enable Cooldown after Profitable Trade</Label>
                     </div>
@@ -378,7 +464,7 @@ const Dashboard = () => {
                   <Button onClick={handleUpdateConfig} className="bg-orange-500 hover:bg-orange-600">
                     Save All Configuration
                   </Button>
-                  <Button onClick={() => fetchData()} variant="outline">
+                  <Button onClick={refreshConfigForm} variant="outline">
                     Refresh
                   </Button>
                 </div>
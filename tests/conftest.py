@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from pymongo.errors import OperationFailure
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "risk_test")
+
+import server  # noqa: E402
+import storage  # noqa: E402
+
+STORE_KINDS = ["memory", "sqlite", "mongo"]
+
+
+def make_store(kind, tmp_path, monkeypatch):
+    """A connected, set up store of one backend; mongo runs on mongomock-motor"""
+    if kind == "memory":
+        store = storage.MemoryStore()
+    elif kind == "sqlite":
+        store = storage.SQLiteStore(str(tmp_path / "risk.db"))
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["risk_test"]
+
+        # mongomock has no capped, time-series or compressed collections;
+        # the store falls back to plain ones as on an older server
+        async def create_collection(name, **options):
+            raise OperationFailure(f"{name}: collection options are not supported")
+
+        monkeypatch.setattr(db, "create_collection", create_collection, raising=False)
+        monkeypatch.setattr(storage, "db", db)
+        store = storage.MongoStore()
+        monkeypatch.setattr(store, "connect", lambda: asyncio.sleep(0))
+    asyncio.run(store.connect())
+    asyncio.run(store.setup())
+    return store
+
+
+@pytest.fixture(params=STORE_KINDS)
+def store(request, tmp_path, monkeypatch):
+    store = make_store(request.param, tmp_path, monkeypatch)
+    yield store
+    asyncio.run(store.close())
+
+
+@pytest.fixture
+def memory_store():
+    store = storage.MemoryStore()
+    asyncio.run(store.connect())
+    return store
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Serve the app from a given store: `async with api(store) as client`"""
+    server.accounts.clear()
+
+    def client(store):
+        monkeypatch.setattr(server, "store", store)
+        transport = httpx.ASGITransport(app=server.app)
+        return httpx.AsyncClient(transport=transport, base_url="http://test/api")
+
+    yield client
+    server.accounts.clear()
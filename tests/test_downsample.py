@@ -0,0 +1,26 @@
+import numpy as np
+
+from server import lttb_indices, minmax_indices
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50.0)
+    y[437] = 25.0
+    indices = lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+    assert 437 in indices
+
+
+def test_lttb_returns_everything_below_threshold():
+    x = np.arange(10, dtype=float)
+    assert list(lttb_indices(x, x, 50)) == list(range(10))
+    assert list(lttb_indices(x, x, 2)) == list(range(10))
+
+
+def test_minmax_keeps_each_buckets_extremes():
+    y = np.array([0, 5, -5, 1, 2, 9, -9, 3], dtype=float)
+    x = np.arange(len(y), dtype=float)
+    assert list(minmax_indices(x, y, 4)) == [1, 2, 5, 6]
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from server import Position, iter_json_rows
+
+
+class StreamedBody:
+    """Just enough of a Request for iter_json_rows: headers and a chunked body"""
+
+    def __init__(self, body: bytes, content_type: str, chunk_size: int):
+        self.headers = {"content-type": content_type}
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def rows(body, content_type, chunk_size=1):
+    async def go():
+        return [value async for _, value in iter_json_rows(StreamedBody(body, content_type, chunk_size))]
+    return asyncio.run(go())
+
+
+TRADES = [{"instrument": "NIFTY €", "side": "BUY", "quantity": 1}, {"instrument": "BANKNIFTY ₹", "side": "SELL", "quantity": 2}]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_ndjson_split_anywhere(chunk_size):
+    body = "".join(json.dumps(trade, ensure_ascii=False) + "\n" for trade in TRADES).encode()
+    assert rows(body, "application/x-ndjson", chunk_size) == TRADES
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_json_array_split_anywhere(chunk_size):
+    body = json.dumps(TRADES, ensure_ascii=False).encode()
+    assert rows(body, "application/json", chunk_size) == TRADES
+
+
+def test_ndjson_reports_bad_lines_per_row():
+    values = rows(b'{"a": 1}\n\nnot json\n{"a": 2}', "application/x-ndjson", 4)
+    assert values[0] == {"a": 1} and values[2] == {"a": 2}
+    assert isinstance(values[1], ValueError)
+
+
+def test_truncated_json_array_raises():
+    with pytest.raises(ValueError):
+        rows(b'[{"a": 1}, {"a": ', "application/json", 5)
+    with pytest.raises(ValueError):
+        rows(b'{"a": 1}', "application/json", 5)
+
+
+def test_bulk_rejects_bad_quantity_and_side_per_row(memory_store, api):
+    body = "".join(json.dumps(row) + "\n" for row in [
+        {"instrument": "X", "side": "buy", "quantity": 2, "price": 10.0, "order_id": "o1"},
+        {"instrument": "X", "side": "SELL", "quantity": 0, "price": 10.0, "order_id": "o2"},
+        {"instrument": "X", "side": "HOLD", "quantity": 1, "price": 10.0, "order_id": "o3"},
+    ])
+
+    async def go():
+        async with api(memory_store) as client:
+            response = await client.post("/trades/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+            assert response.status_code == 200, response.text
+            result = response.json()
+            assert result["inserted"] == 1 and [error["row"] for error in result["errors"]] == [2, 3]
+            assert (await client.get("/trades")).json()[0]["side"] == "BUY"
+            bad = {"instrument": "X", "side": "SELL", "quantity": -1, "price": 10.0}
+            assert (await client.post("/trades", json=bad)).status_code == 422
+            assert (await client.post("/pre-trade-check", json=bad)).status_code == 422
+            assert [(p["instrument"], p["quantity"]) for p in (await client.get("/positions")).json()] == [("X", 2)]
+        await server.deadlines.close()
+
+    asyncio.run(go())
+
+
+def test_position_ignores_non_positive_fills():
+    position = Position("X")
+    assert position.apply("BUY", 0, 10.0) == (0, 0.0)
+    assert (position.quantity, position.fills) == (0, 0)
+    position.apply("BUY", 2, 10.0)
+    assert position.apply("SELL", 1, 12.0) == (1, 2.0)
+
+
+def test_bulk_counts_todays_fills_by_trading_day(memory_store, api):
+    local_midnight = datetime.now(server.TRADING_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    stamps = [local_midnight - timedelta(minutes=1), local_midnight + timedelta(seconds=1)]
+    body = json.dumps([
+        {"instrument": "X", "side": "BUY", "quantity": 1, "price": 10.0, "order_id": f"o{n}",
+         "timestamp": stamp.astimezone(timezone.utc).isoformat()}
+        for n, stamp in enumerate(stamps)
+    ])
+
+    async def go():
+        async with api(memory_store) as client:
+            response = await client.post("/trades/bulk", content=body, headers={"content-type": "application/json"})
+            assert response.json()["inserted"] == 2
+            assert (await client.get("/risk-status")).json()["trades_today"] == 1
+        await server.deadlines.close()
+
+    asyncio.run(go())
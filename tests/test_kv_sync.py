@@ -0,0 +1,33 @@
+import asyncio
+
+import server
+from rules import TRIP_DAILY_MAX_LOSS
+from storage import DEFAULT_ACCOUNT
+
+STATUS_KEY = {"account": DEFAULT_ACCOUNT, "id": "current_status"}
+
+
+def test_kv_push_writes_once_and_cannot_lift_a_trip(memory_store, api):
+    async def go():
+        async with api(memory_store) as client:
+            # The default config has a daily max loss of 5000
+            await client.get("/risk-config")
+            loss = {"state": {"total_pnl": -6000.0, "realised": -6000.0, "tripped_day": False}}
+            assert (await client.post("/sync-kv-state", json=loss)).status_code == 200
+            status = (await client.get("/risk-status")).json()
+            assert status["max_loss_hit"] and status["trip_reason"] == TRIP_DAILY_MAX_LOSS
+            assert await memory_store.singleton_version("risk_status", STATUS_KEY) == 1
+
+            # The same push again changes nothing, so writes nothing
+            assert (await client.post("/sync-kv-state", json=loss)).status_code == 200
+            assert await memory_store.singleton_version("risk_status", STATUS_KEY) == 1
+
+            # A recovered push updates the P&L but keeps the latched trip
+            recovered = {"state": {"total_pnl": 100.0, "realised": 100.0, "tripped_day": False}}
+            assert (await client.post("/sync-kv-state", json=recovered)).status_code == 200
+            status = (await client.get("/risk-status")).json()
+            assert status["total_pnl"] == 100.0 and status["max_loss_hit"] and not status["orders_allowed"]
+            assert await memory_store.singleton_version("risk_status", STATUS_KEY) == 2
+        await server.deadlines.close()
+
+    asyncio.run(go())
@@ -0,0 +1,48 @@
+import asyncio
+
+import server
+from storage import DEFAULT_ACCOUNT
+
+
+def count_scans(store, monkeypatch):
+    """Count the full trade replays the store is asked for"""
+    scans = []
+    executed_trades = store.executed_trades
+
+    def counted(*args, **kwargs):
+        scans.append(args)
+        return executed_trades(*args, **kwargs)
+
+    monkeypatch.setattr(store, "executed_trades", counted)
+    return scans
+
+
+def test_fills_apply_incrementally_until_another_worker_writes(store, api, monkeypatch):
+    async def go():
+        async with api(store) as client:
+            fill = {"instrument": "X", "side": "BUY", "quantity": 10, "price": 10.0, "order_id": "o1"}
+            assert (await client.post("/trades", json=fill)).status_code == 200
+            scans = count_scans(store, monkeypatch)
+
+            fill = {"instrument": "X", "side": "SELL", "quantity": 4, "price": 12.0, "order_id": "o2"}
+            assert (await client.post("/trades", json=fill)).status_code == 200
+            positions = (await client.get("/positions")).json()
+            assert [(p["quantity"], p["realised_pnl"]) for p in positions] == [(6, 8.0)]
+            assert (await client.get("/pnl/by-instrument")).json()["realised_total"] == 8.0
+            assert scans == []
+
+            # Another worker stores a fill and bumps the version: the next read replays once
+            other = server.Trade(instrument="Y", side="BUY", quantity=1, price=5.0, order_id="o3").model_dump()
+            await store.insert_trades([dict(other, account=DEFAULT_ACCOUNT)])
+            await server.PositionBook(DEFAULT_ACCOUNT).touch()
+            positions = (await client.get("/positions")).json()
+            assert sorted(p["instrument"] for p in positions) == ["X", "Y"]
+            await client.get("/positions")
+            assert len(scans) == 1
+
+            # Fills applied incrementally are stored with their realised P&L
+            trades = [trade async for trade in store.executed_trades(DEFAULT_ACCOUNT)]
+            assert [trade.get("realised_pnl") for trade in trades[:2]] == [0.0, 8.0]
+        await server.deadlines.close()
+
+    asyncio.run(go())
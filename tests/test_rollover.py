@@ -0,0 +1,126 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import server
+from rules import TRIP_MAX_TRADES
+
+FILLS = [("X", "BUY", 10, 10.0), ("X", "SELL", 10, 8.0), ("Y", "BUY", 1, 5.0)]
+
+
+async def post_fills(client, fills, prefix="o"):
+    for n, (instrument, side, quantity, price) in enumerate(fills):
+        response = await client.post("/trades", json={
+            "instrument": instrument, "side": side, "quantity": quantity, "price": price, "order_id": f"{prefix}{n}",
+        })
+        assert response.status_code == 200, response.text
+
+
+def test_rollover_archives_the_session_and_carries_open_positions(store, api):
+    async def go():
+        async with api(store) as client:
+            await post_fills(client, FILLS)
+            await client.post("/logs", json={"level": "info", "type": "system", "message": "hello"})
+
+            response = await client.post("/sessions/rollover")
+            assert response.status_code == 200, response.text
+            summary = response.json()
+            assert summary["archived_trades"] == 2 and summary["carried_instruments"] == ["Y"]
+            assert summary["realised"] == -20 and summary["rollovers"] == 1
+            day = summary["day"]
+
+            # The closed instrument moved to the archive; the open one stays live
+            assert [trade["instrument"] for trade in (await client.get("/trades")).json()] == ["Y"]
+            assert [(p["instrument"], p["quantity"]) for p in (await client.get("/positions")).json()] == [("Y", 1)]
+            archived = (await client.get(f"/sessions/{day}/trades")).json()
+            assert sorted(trade["side"] for trade in archived) == ["BUY", "SELL"]
+            assert any(log["message"] == "hello" for log in (await client.get(f"/sessions/{day}/logs")).json())
+
+            status = (await client.get("/risk-status")).json()
+            assert status["total_pnl"] == 0 and status["orders_allowed"]
+
+            # Exports and simulations still see the archived session
+            exported = [json.loads(line) for line in (await client.get("/trades/export?format=ndjson")).text.splitlines()]
+            assert [(row["instrument"], row["side"]) for row in exported] == [("X", "BUY"), ("X", "SELL"), ("Y", "BUY")]
+            response = await client.post("/risk-config/simulate", json={"configs": [{}]})
+            assert response.status_code == 200, response.text
+            assert response.json()["fills"] == 3 and response.json()["actual_realised"] == -20
+            assert [session["day"] for session in (await client.get("/sessions")).json()] == [day]
+
+            # A second rollover the same day archives the first one's log and
+            # adds to the same summary
+            response = await client.post("/sessions/rollover")
+            assert response.status_code == 200, response.text
+            assert response.json()["rollovers"] == 2 and response.json()["archived_trades"] == 2
+        await server.deadlines.close()
+
+    asyncio.run(go())
+
+
+def test_rollover_with_nothing_to_archive_conflicts(memory_store, api):
+    async def go():
+        async with api(memory_store) as client:
+            assert (await client.post("/sessions/rollover")).status_code == 409
+            assert (await client.get("/sessions/yesterday")).status_code == 400
+            assert (await client.get("/sessions/2025-03-03")).status_code == 404
+
+    asyncio.run(go())
+
+
+def test_scheduled_close_runs_once_per_cutoff(memory_store, api):
+    async def go():
+        async with api(memory_store) as client:
+            await post_fills(client, FILLS[:2])
+            close = datetime.now(timezone.utc) + timedelta(seconds=1)
+            # Every worker fires the same close; only one rolls it over
+            await server.roll_over_sessions(close)
+            await server.roll_over_sessions(close)
+            sessions = (await client.get("/sessions")).json()
+            assert [(s["archived_trades"], s["rollovers"]) for s in sessions] == [(2, 1)]
+        await server.deadlines.close()
+
+    asyncio.run(go())
+
+
+def test_next_market_close(monkeypatch):
+    now = datetime(2025, 3, 3, 9, 0, tzinfo=timezone.utc)  # 14:30 in Asia/Kolkata
+    monkeypatch.setattr(server, "TRADING_TIMEZONE", ZoneInfo("Asia/Kolkata"))
+    monkeypatch.setattr(server, "MARKET_CLOSE", "15:30")
+    assert server.next_market_close(now) == datetime(2025, 3, 3, 10, 0, tzinfo=timezone.utc)
+    assert server.next_market_close(now + timedelta(hours=2)) == datetime(2025, 3, 4, 10, 0, tzinfo=timezone.utc)
+    monkeypatch.setattr(server, "MARKET_CLOSE", "off")
+    assert server.next_market_close(now) is None
+
+
+def test_daily_counters_start_over_each_trading_day(memory_store, api):
+    key = {"account": "default", "id": "current_status"}
+
+    async def go():
+        async with api(memory_store) as client:
+            await memory_store.update_singleton("risk_status", key, {
+                "$set": {"trading_day": "2025-03-03", "trades_today": 10, "consecutive_losses": 3},
+            })
+            # The first fill of a later day counts from zero
+            await post_fills(client, FILLS[:1])
+            status = (await client.get("/risk-status")).json()
+            assert (status["trades_today"], status["consecutive_losses"]) == (1, 0)
+            assert status["trading_day"] == server.trading_day(datetime.now(timezone.utc))
+
+            # The daily reset also lifts yesterday's max trades trip
+            await memory_store.update_singleton("risk_status", key, {"$set": {
+                "trading_day": "2025-03-03", "trades_today": 10, "orders_allowed": False, "trip_reason": TRIP_MAX_TRADES,
+            }})
+            server.accounts.clear()
+            await server.start_trading_day()
+            status = (await client.get("/risk-status")).json()
+            assert status["trades_today"] == 0 and status["orders_allowed"]
+        await server.deadlines.close()
+
+    asyncio.run(go())
+
+
+def test_next_trading_day_start(monkeypatch):
+    monkeypatch.setattr(server, "TRADING_TIMEZONE", ZoneInfo("Asia/Kolkata"))
+    now = datetime(2025, 3, 3, 19, 0, tzinfo=timezone.utc)  # 00:30 on the 4th in Asia/Kolkata
+    assert server.next_trading_day_start(now) == datetime(2025, 3, 4, 18, 30, tzinfo=timezone.utc)
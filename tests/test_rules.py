@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from models import RiskConfig
+from rules import (
+    CompiledRules, RiskEngine, MANUAL_HALT, TRIP_COOLDOWN, TRIP_CONSECUTIVE_LOSSES, TRIP_DAILY_MAX_LOSS,
+    TRIP_DAILY_MAX_PROFIT, TRIP_MAX_TRADES, TRIP_TRAILING_FLOOR, DENY_POSITION_SIZE, DENY_SIDE_LOCK,
+)
+from simulation import SimulationFills, simulate_rules
+
+NOW = 1_700_000_000.0
+
+
+def risk_config(**overrides):
+    config = RiskConfig(
+        daily_max_loss=1000, daily_max_profit=3000, max_trades_per_day=10, max_position_size=0,
+        stop_loss_percentage=2, consecutive_loss_limit=3, cooldown_after_loss=15,
+    ).model_dump()
+    config.update(overrides)
+    return config
+
+
+def rules(**overrides):
+    return CompiledRules(risk_config(**overrides))
+
+
+def test_clean_status_allows_orders():
+    derived = rules().evaluate({"total_pnl": 100.0}, 0.0, NOW)
+    assert derived["orders_allowed"] and derived["trip_reason"] is None
+    assert derived["active_loss_floor"] == -1000
+    assert rules().check_order({"total_pnl": 100.0}, 0.0, NOW, "BUY", 1, 10.0) == (True, None)
+
+
+@pytest.mark.parametrize("status, reason", [
+    ({"total_pnl": -1000.0}, TRIP_DAILY_MAX_LOSS),
+    ({"total_pnl": 3000.0}, TRIP_DAILY_MAX_PROFIT),
+    ({"consecutive_losses": 3}, TRIP_CONSECUTIVE_LOSSES),
+    ({"trades_today": 10}, TRIP_MAX_TRADES),
+    # The loss floor outranks every later rule
+    ({"total_pnl": -1500.0, "trades_today": 10, "consecutive_losses": 5}, TRIP_DAILY_MAX_LOSS),
+])
+def test_each_rule_trips(status, reason):
+    derived = rules().evaluate(status, 0.0, NOW)
+    assert (derived["orders_allowed"], derived["trip_reason"]) == (False, reason)
+    assert rules().check_order(status, 0.0, NOW, "BUY", 1, 1.0) == (False, reason)
+
+
+def test_loss_trip_latches_after_recovery():
+    derived = rules().evaluate({"total_pnl": 0.0, "max_loss_hit": True, "trip_reason": TRIP_DAILY_MAX_LOSS}, 0.0, NOW)
+    assert derived["max_loss_hit"] and derived["trip_reason"] == TRIP_DAILY_MAX_LOSS
+
+
+def test_trailing_floor_rises_with_peak_profit():
+    trailing = rules(trailing_profit_enabled=True, trailing_profit_step=500)
+    derived = trailing.evaluate({"total_pnl": 400.0, "peak_profit": 1600.0}, 0.0, NOW)
+    assert derived["active_loss_floor"] == 1000
+    assert derived["trip_reason"] == TRIP_TRAILING_FLOOR
+    # Below one step the fixed daily floor still applies
+    assert trailing.evaluate({"total_pnl": 400.0, "peak_profit": 400.0}, 0.0, NOW)["orders_allowed"]
+
+
+def test_zero_daily_max_loss_sets_no_floor():
+    unlimited = rules(daily_max_loss=0)
+    derived = unlimited.evaluate({"total_pnl": 0.0}, 0.0, NOW)
+    assert derived["orders_allowed"] and derived["active_loss_floor"] is None
+    assert unlimited.evaluate({"total_pnl": -10_000.0}, 0.0, NOW)["orders_allowed"]
+    assert unlimited.check_order({"total_pnl": 0.0}, 0.0, NOW, "BUY", 1, 1.0) == (True, None)
+    # The trailing floor still applies on its own
+    trailing = rules(daily_max_loss=0, trailing_profit_enabled=True, trailing_profit_step=500)
+    assert trailing.evaluate({"total_pnl": 400.0, "peak_profit": 1600.0}, 0.0, NOW)["trip_reason"] == TRIP_TRAILING_FLOOR
+
+    fills = SimulationFills([
+        {"timestamp": datetime.fromtimestamp(NOW + i, timezone.utc), "side": "BUY", "quantity": 1, "price": 1.0, "realised_pnl": -2000.0}
+        for i in range(2)
+    ])
+    outcome, = simulate_rules(fills, [risk_config(daily_max_loss=0, cooldown_after_loss=0)])
+    assert (outcome["fills_taken"], outcome["fills_blocked"], outcome["days_tripped"]) == (2, 0, 0)
+
+
+def test_cooldown_expires_with_time():
+    derived = rules().evaluate({}, NOW + 150, NOW)
+    assert derived["trip_reason"] == TRIP_COOLDOWN and derived["cooldown_remaining_minutes"] == 2
+    assert rules().evaluate({"in_cooldown": True}, NOW - 1, NOW)["orders_allowed"]
+
+
+def test_manual_halt_outranks_rules_until_lifted():
+    halted = {"orders_allowed": False, "trip_reason": MANUAL_HALT, "total_pnl": -2000.0}
+    assert rules().evaluate(halted, 0.0, NOW)["trip_reason"] == MANUAL_HALT
+    assert rules().check_order(halted, 0.0, NOW, "BUY", 1, 1.0) == (False, MANUAL_HALT)
+    # A halt written by the rules themselves is re-derived, not kept
+    stale = {"orders_allowed": False, "trip_reason": TRIP_MAX_TRADES, "trades_today": 0}
+    assert rules().evaluate(stale, 0.0, NOW)["orders_allowed"]
+
+
+def test_order_checks():
+    locked = rules(side_lock="buy", max_position_size=1000)
+    assert locked.check_order({}, 0.0, NOW, "SELL", 1, 1.0) == (False, DENY_SIDE_LOCK)
+    assert locked.check_order({}, 0.0, NOW, "BUY", 11, 100.0) == (False, DENY_POSITION_SIZE)
+    assert locked.check_order({}, 0.0, NOW, "buy", 10, 100.0) == (True, None)
+
+
+def test_engine_recompiles_only_for_a_new_config():
+    engine = RiskEngine()
+    config = risk_config()
+    compiled = engine.rules_for(config)
+    assert engine.rules_for(config) is compiled
+    assert engine.rules_for(dict(config)) is not compiled
@@ -0,0 +1,173 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+T0 = datetime(2025, 3, 3, 4, 0, tzinfo=timezone.utc)
+
+
+def log_doc(account, seconds, row_id, log_type="system"):
+    return {
+        "account": account, "id": row_id, "timestamp": T0 + timedelta(seconds=seconds),
+        "level": "info", "type": log_type, "message": row_id,
+    }
+
+
+def trade_doc(account, seconds, row_id, instrument="X", side="BUY", order_id=None):
+    # Every trade gets an order_id: mongomock ignores the partial filter
+    # that lets real MongoDB store many trades without one
+    return {
+        "account": account, "id": row_id, "timestamp": T0 + timedelta(seconds=seconds), "instrument": instrument,
+        "side": side, "quantity": 1, "price": 10.0, "order_id": order_id or f"order-{row_id}", "status": "executed",
+    }
+
+
+def test_update_singleton_upserts_and_bumps_version(store):
+    key = {"account": "a", "id": "current_status"}
+
+    async def go():
+        assert await store.find_singleton("risk_status", key) is None
+        assert await store.singleton_version("risk_status", key) is None
+        doc = await store.update_singleton("risk_status", key, {
+            "$set": {"total_pnl": 5.0}, "$setOnInsert": {"trades_today": 0}, "$inc": {"version": 1},
+        })
+        assert (doc["total_pnl"], doc["trades_today"], doc["version"]) == (5.0, 0, 1)
+        doc = await store.update_singleton("risk_status", key, {
+            "$setOnInsert": {"trades_today": 99}, "$inc": {"trades_today": 1, "version": 1},
+        })
+        assert (doc["trades_today"], doc["version"]) == (1, 2)
+        assert await store.singleton_version("risk_status", key) == 2
+        assert (await store.find_singleton("risk_status", key))["total_pnl"] == 5.0
+
+    asyncio.run(go())
+
+
+def test_keyset_pages_cover_every_row_once(store):
+    # Pairs of rows share a timestamp, so only the id breaks the tie
+    docs = [log_doc("a", i // 2, f"log-{i:02d}") for i in range(9)]
+    docs.append(log_doc("b", 0, "other-account"))
+
+    async def go():
+        await store.insert_logs(docs)
+        seen, before = [], None
+        while True:
+            page = await store.page("logs", "a", 4, before, None, {})
+            if not page:
+                break
+            seen += [row["id"] for row in page]
+            before = (page[-1]["timestamp"], page[-1]["id"])
+        assert seen == [f"log-{i:02d}" for i in reversed(range(9))]
+        newer = await store.page("logs", "a", 10, None, (T0 + timedelta(seconds=3), "log-06"), {})
+        assert [row["id"] for row in newer] == ["log-08", "log-07"]
+        # A cursor without an id skips its whole timestamp
+        older = await store.page("logs", "a", 10, (T0 + timedelta(seconds=1), None), None, {})
+        assert [row["id"] for row in older] == ["log-01", "log-00"]
+
+    asyncio.run(go())
+
+
+def test_page_filters_by_type(store):
+    async def go():
+        await store.insert_logs([log_doc("a", i, f"log-{i}", "violation" if i % 2 else "system") for i in range(6)])
+        rows = await store.page("logs", "a", 10, None, None, {"type": "violation"})
+        assert [row["id"] for row in rows] == ["log-5", "log-3", "log-1"]
+
+    asyncio.run(go())
+
+
+def test_clear_logs_only_touches_the_account(store):
+    async def go():
+        await store.insert_logs([log_doc("a", i, f"a-{i}") for i in range(3)] + [log_doc("b", 0, "b-0")])
+        assert await store.clear_logs("a", T0 + timedelta(seconds=1), None) == 1
+        assert await store.clear_logs("a", None, None) == 2
+        assert await store.page("logs", "a", 10, None, None, {}) == []
+        assert [row["id"] for row in await store.page("logs", "b", 10, None, None, {})] == ["b-0"]
+
+    asyncio.run(go())
+
+
+def test_export_rows_are_oldest_first_in_batches(store):
+    async def go():
+        await store.insert_logs([log_doc("a", i, f"log-{i}") for i in range(5)])
+        batches = [
+            batch async for batch in
+            store.export_rows("logs", "a", T0 + timedelta(seconds=1), T0 + timedelta(seconds=4), {}, 2)
+        ]
+        assert [[row["id"] for row in batch] for batch in batches] == [["log-1", "log-2"], ["log-3", "log-4"]]
+        assert "account" not in batches[0][0]
+
+    asyncio.run(go())
+
+
+def test_insert_trades_reports_duplicate_order_ids(store):
+    async def go():
+        failures = await store.insert_trades([
+            trade_doc("a", 0, "t1", order_id="o1"),
+            trade_doc("a", 1, "t2", order_id="o1"),
+            trade_doc("b", 2, "t3", order_id="o1"),
+            trade_doc("a", 3, "t4"),
+            trade_doc("a", 4, "t5"),
+        ])
+        assert [(index, duplicate) for index, duplicate, _ in failures] == [(1, True)]
+        assert await store.count_trades("a") == 3
+        assert await store.existing_order_ids("a", ["o1", "o2"]) == {"o1"}
+        assert sorted(await store.trade_accounts()) == ["a", "b"]
+
+    asyncio.run(go())
+
+
+def test_executed_trades_and_realised_pnl(store):
+    async def go():
+        await store.insert_trades([
+            trade_doc("a", 0, "t1", "X"), trade_doc("a", 1, "t2", "Y"), trade_doc("a", 2, "t3", "X", "SELL"),
+        ])
+        trades = [trade async for trade in store.executed_trades("a", "X")]
+        assert [trade["id"] for trade in trades] == ["t1", "t3"]
+        await store.set_realised_pnl([(trades[1], 4.5)])
+        trades = [trade async for trade in store.executed_trades("a")]
+        assert [trade.get("realised_pnl") for trade in trades] == [None, None, 4.5]
+
+    asyncio.run(go())
+
+
+def test_archives_and_sessions(store):
+    async def go():
+        rows = [trade_doc("a", i, f"t{i}") for i in range(3)]
+        await store.insert_trades(rows)
+        await store.archive_rows("trades", "a", "2025-03-03", rows[:2])
+        assert await store.delete_rows("trades", "a", ["t0", "t1"]) == 2
+        assert [trade["id"] async for trade in store.executed_trades("a")] == ["t2"]
+        archived = await store.archived_rows("trades", "a", "2025-03-03")
+        assert [row["id"] for row in archived] == ["t0", "t1"]
+        assert archived[0]["timestamp"] == T0
+        await store.archive_rows("trades", "a", "2025-03-05", rows[2:])
+        assert await store.archived_days("trades", "a", None, None) == ["2025-03-03", "2025-03-05"]
+        assert await store.archived_days("trades", "a", "2025-03-04", None) == ["2025-03-05"]
+        assert await store.archived_days("trades", "b", None, None) == []
+
+        assert await store.last_session_day("a") is None
+        for day in ("2025-03-03", "2025-03-04"):
+            await store.save_session({"account": "a", "day": day, "archived_trades": 2})
+        await store.save_session({"account": "a", "day": "2025-03-04", "archived_trades": 5})
+        sessions = await store.sessions("a", "2025-03-01", None)
+        assert [(s["day"], s["archived_trades"]) for s in sessions] == [("2025-03-03", 2), ("2025-03-04", 5)]
+        assert await store.last_session_day("a") == "2025-03-04"
+
+        await store.drop_archives("2025-03-04")
+        assert await store.archived_rows("trades", "a", "2025-03-03") == []
+
+    asyncio.run(go())
+
+
+def test_history_range(store):
+    # Recent points, so status history retention keeps them
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+
+    async def go():
+        for minute in range(3):
+            await store.insert_history({
+                "account": "a", "ts": start + timedelta(minutes=minute), "total_pnl": float(minute), "realised": 1.0,
+            })
+        points = await store.history_range("a", start + timedelta(minutes=1), start + timedelta(minutes=5), ["total_pnl", "realised"])
+        assert [(point["total_pnl"], point["realised"]) for point in points] == [(1.0, 1.0), (2.0, 1.0)]
+        assert points[0]["ts"] == start + timedelta(minutes=1)
+
+    asyncio.run(go())